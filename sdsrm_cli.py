@@ -0,0 +1,158 @@
+# This file is part of the SDSRM distribution (https://github.com/GreyHak/sdsrm).
+# Copyright (c) 2024 GreyHak (github.com/GreyHak).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Command line interface to sdsrm_lib, for scripts, cron jobs and SSH
+# sessions.  It is started often, so it stays clear of tkinter and the GUI,
+# and sdsrm_lib only imports asyncio when an asynchronous call is made.
+
+import argparse
+import contextlib
+import json
+import sys
+import sdsrm_lib
+
+SERVER_CONFIG_FILENAME = "ServerConfig.json"  # Shared with the GUI
+DEFAULT_SERVER_ADDRESS = "127.0.0.1"
+DEFAULT_SERVER_PORT = 7777
+
+def loadServerConfig():
+   # The GUI's saved server, as defaults for the options.
+   try:
+      with open(SERVER_CONFIG_FILENAME, "r") as fin:
+         jdata = json.load(fin)
+   except (OSError, ValueError):
+      return {}
+   return jdata if isinstance(jdata, dict) else {}
+
+def parseArguments(argv):
+   config = loadServerConfig()
+   parser = argparse.ArgumentParser(prog="sdsrm", description="Manage a Satisfactory dedicated server from the command line.")
+   parser.add_argument("--host", default=config.get("Host", DEFAULT_SERVER_ADDRESS), help="server address (default from ServerConfig.json, else %(default)s)")
+   parser.add_argument("--port", type=int, default=int(config.get("Port", DEFAULT_SERVER_PORT)), help="server port")
+   parser.add_argument("--token", default=config.get("API Token") or None, help="API token from server.GenerateAPIToken, used instead of logging in")
+   parser.add_argument("--password", default=config.get("Password") or "", help="password to log in with when there is no token")
+   parser.add_argument("--admin", action="store_true", help="log in with the administrator password rather than the client one")
+   parser.add_argument("--json", action="store_true", help="print the result as JSON")
+   subparsers = parser.add_subparsers(dest="command", metavar="command", required=True)
+
+   subparsers.add_parser("login", help="log in and print the token")
+   subparsers.add_parser("verify", help="check that the token is accepted")
+   subparsers.add_parser("state", help="print the server state")
+   subparsers.add_parser("sessions", help="list the sessions and their saves (needs --admin or an admin token)")
+   renameParser = subparsers.add_parser("rename", help="set the server name")
+   renameParser.add_argument("name")
+   uploadParser = subparsers.add_parser("upload", help="upload a save")
+   uploadParser.add_argument("filepath")
+   uploadParser.add_argument("saveName")
+   uploadParser.add_argument("--load", action="store_true", help="load the save once uploaded")
+   uploadParser.add_argument("--advanced", action="store_true", help="enable advanced game settings")
+   uploadParser.add_argument("--progress", action="store_true", help="report progress on stderr")
+   uploadParser.add_argument("--limit", type=float, metavar="MBPS", help="send at most this many MB per second")
+   downloadParser = subparsers.add_parser("download", help="download a save")
+   downloadParser.add_argument("saveName")
+   downloadParser.add_argument("filepath")
+   downloadParser.add_argument("--progress", action="store_true", help="report progress on stderr")
+   downloadParser.add_argument("--limit", type=float, metavar="MBPS", help="receive at most this many MB per second")
+   subparsers.add_parser("shutdown", help="shut the server down")
+   return parser.parse_args(argv)
+
+def progressReporter(enabledFlag):
+   if not enabledFlag:
+      return None
+   def report(progress):
+      print(sdsrm_lib.formatTransferProgress(progress), file=sys.stderr)
+   return report
+
+def runCommand(client, args, authorizationCode):
+   # Returns (status, data, text): data is added to the --json output, and
+   # text printed otherwise, in place of the status.
+   if args.command == "login":
+      return ("Success", {"token": authorizationCode}, authorizationCode)
+   if args.command == "verify":
+      (authStatus, authFlag) = client.verifyAuthentication(authorizationCode)
+      return (authStatus, {}, None)
+   if args.command == "state":
+      (getStatus, serverState) = client.getServerState(authorizationCode)
+      if serverState == None:
+         return (getStatus, {}, None)
+      return (getStatus, {"serverState": serverState.toDict()}, sdsrm_lib.formatServerState(serverState))
+   if args.command == "sessions":
+      (enumerateStatus, sessions) = client.enumerateSessions(authorizationCode)
+      if sessions == None:
+         return (enumerateStatus, {}, None)
+      lines = []
+      for session in sessions:
+         lines.append(session.sessionName + (" (current)" if session.currentFlag else ""))
+         lines.extend(f"   {saveHeader.saveName}  {saveHeader.saveDateTime}" for saveHeader in session.saveHeaders)
+      return (enumerateStatus, {"sessions": [session.toDict() for session in sessions]}, "\n".join(lines))
+   if args.command == "rename":
+      return (client.setServerName(authorizationCode, args.name), {}, None)
+   if args.command == "upload":
+      if args.limit:
+         sdsrm_lib.uploadBandwidth.setRate(args.limit * 1e6)
+      uploadStatus = client.uploadSave(authorizationCode, args.filepath, args.saveName, args.load, args.advanced, progressCallback=progressReporter(args.progress))
+      return (uploadStatus, {}, None)
+   if args.command == "download":
+      if args.limit:
+         sdsrm_lib.downloadBandwidth.setRate(args.limit * 1e6)
+      (downloadStatus, sha256) = client.downloadSave(authorizationCode, args.saveName, args.filepath, progressReporter(args.progress))
+      if sha256 == None:
+         return (downloadStatus, {}, None)
+      return (downloadStatus, {"sha256": sha256}, sha256)
+   if args.command == "shutdown":
+      return (client.shutdown(authorizationCode), {}, None)
+   raise ValueError(f"Unknown command {args.command}")
+
+def run(args):
+   # Returns what runCommand() does.  Tokens from logins are kept in the
+   # token cache, so repeated runs don't log in every time.  If the server
+   # rejects a cached token, it is dropped and the command retried once
+   # after a new login.
+   client = sdsrm_lib.ServerClient(args.host, args.port, poolSize=1)
+   try:
+      if args.token:
+         return runCommand(client, args, args.token)
+
+      tokenCache = sdsrm_lib.TokenCache()
+      for attempt in range(2):
+         (authStatus, authorizationCode) = client.getToken(args.admin, args.password, tokenCache)
+         if authorizationCode == None:
+            return (authStatus, {}, None)
+         (status, data, text) = runCommand(client, args, authorizationCode)
+         if not sdsrm_lib.isAuthFailure(status):
+            break
+         tokenCache.invalidate(args.host, args.port, args.admin)
+      return (status, data, text)
+   finally:
+      client.close()
+
+def main(argv=None):
+   args = parseArguments(argv)
+   # The library reports problems on stdout, which would get in the way of
+   # the result.
+   with contextlib.redirect_stdout(sys.stderr):
+      (status, data, text) = run(args)
+
+   successFlag = status in sdsrm_lib.SUCCESS_STATUSES
+   if args.json:
+      print(json.dumps(dict(command=args.command, host=args.host, port=args.port, status=status, **data), indent=3))
+   elif not successFlag:
+      print(status, file=sys.stderr)
+   else:
+      print(text if text != None else status)
+   return 0 if successFlag else 1
+
+if __name__ == '__main__':
+   sys.exit(main())
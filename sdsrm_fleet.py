@@ -0,0 +1,67 @@
+# This file is part of the SDSRM distribution (https://github.com/GreyHak/sdsrm).
+# Copyright (c) 2024 GreyHak (github.com/GreyHak).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import sdsrm_lib
+
+# Inventory file format, a JSON list of servers:
+# [
+#    {"Host": "10.0.0.5", "Port": 7777, "API Token": "ew0KCSJwbCI6..."},
+#    {"Host": "10.0.0.6", "Port": 7777, "Password": "hunter2"},
+#    ["10.0.0.7", 7777, "ew0KCSJwbCI6..."]
+# ]
+
+def loadInventory(filepath):
+   with open(filepath, "r") as fin:
+      return json.load(fin)
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description="Query the state of many Satisfactory dedicated servers in parallel, or upload a save to all of them.")
+   parser.add_argument("inventory", help="JSON file listing the servers to poll")
+   parser.add_argument("--concurrency", type=int, help=f"maximum number of servers queried at once ({sdsrm_lib.DEFAULT_FLEET_CONCURRENCY}), or uploaded to at once ({sdsrm_lib.DEFAULT_DEPLOY_CONCURRENCY})")
+   parser.add_argument("--timeout", type=float, help=f"seconds allowed per server ({sdsrm_lib.RECV_TIMEOUT}, unlimited for uploads)")
+   parser.add_argument("--output", help="write the JSON result here instead of to stdout")
+   deployGroup = parser.add_argument_group("deploying a save")
+   deployGroup.add_argument("--deploy", metavar="FILE", help="upload this save to every server instead of querying them")
+   deployGroup.add_argument("--save-name", help="name to upload the save as, the file name without .sav by default")
+   deployGroup.add_argument("--load", action="store_true", help="load the save once uploaded")
+   deployGroup.add_argument("--advanced", action="store_true", help="enable advanced game settings")
+   deployGroup.add_argument("--limit", type=float, metavar="MBPS", help="send at most this many MB per second, all uploads together")
+   deployGroup.add_argument("--host-concurrency", type=int, default=sdsrm_lib.DEFAULT_HOST_CONCURRENCY, help="maximum number of uploads at once to servers on the same host")
+   args = parser.parse_args()
+
+   # The library reports problems on stdout, which would get in the way of
+   # the JSON.
+   with contextlib.redirect_stdout(sys.stderr):
+      if args.deploy:
+         saveName = args.save_name or os.path.splitext(os.path.basename(args.deploy))[0]
+         concurrency = args.concurrency or sdsrm_lib.DEFAULT_DEPLOY_CONCURRENCY
+         if args.limit:
+            sdsrm_lib.uploadBandwidth.setRate(args.limit * 1e6)
+         result = sdsrm_lib.deployFleet(loadInventory(args.inventory), args.deploy, saveName, args.load, args.advanced,
+                                        concurrency, args.host_concurrency, args.timeout)
+      else:
+         concurrency = args.concurrency or sdsrm_lib.DEFAULT_FLEET_CONCURRENCY
+         timeout = args.timeout if args.timeout != None else sdsrm_lib.RECV_TIMEOUT
+         result = sdsrm_lib.pollFleet(loadInventory(args.inventory), concurrency, timeout)
+   if args.output:
+      with open(args.output, "w") as fout:
+         json.dump(result, fout, indent=3)
+   else:
+      print(json.dumps(result, indent=3))
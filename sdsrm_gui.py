@@ -17,11 +17,38 @@ import sdsrm_lib
 import tkinter as tk
 from tkinter import font
 from tkinter.filedialog import askopenfilename
+from concurrent.futures import ThreadPoolExecutor
+import collections
 import json
+import queue
+import threading
+import time
 
 DEFAULT_SERVER_ADDRESS = "127.0.0.1"
 DEFAULT_SERVER_PORT = "7777"
-authorizationInfo = None
+WORKER_COUNT = 4  # Network operations that can run at once
+RESULT_POLL_INTERVAL = 50  # Milliseconds between checks for finished operations
+DEFAULT_REFRESH_INTERVAL = "10"  # Seconds between automatic server state queries
+MIN_REFRESH_INTERVAL = 1.0
+HISTORY_LENGTH = 360  # Server state samples kept for the charts
+CHART_FIELDS = (("averageTickRate", "Tick Rate"), ("numConnectedPlayers", "Players"), ("totalGameDuration", "Game Duration"))
+CHART_WIDTH = 400
+CHART_HEIGHT = 100
+CHART_MARGIN = 20
+authorizationLock = threading.Lock()
+tokenCache = sdsrm_lib.TokenCache()
+
+# The most recent server state samples as (time.monotonic(), ServerState), for
+# the server in historyServer.  Older samples fall off the end.
+history = collections.deque(maxlen=HISTORY_LENGTH)
+historyServer = None
+refreshTimer = None  # window.after() id of the next automatic refresh
+
+# Network calls run on the worker pool so the window stays responsive.  Tk
+# may only be touched from its own thread, so workers queue callables which
+# the Tk thread runs from window.after().
+workers = ThreadPoolExecutor(max_workers=WORKER_COUNT)
+results = queue.Queue()
 
 SERVER_CONFIG_FILENAME = "ServerConfig.json"
 
@@ -56,114 +83,233 @@ def getServerDetails():
    adminApiToken = serverAdminApiTokenEntry.get()
    return ((hostname, port), (password, adminApiToken))
 
-def authenticated():
-   global authorizationInfo
+def authenticated(details):
+   # Called on a worker thread.  Returns (authStatus, authorization), the
+   # latter (adminFlag, authorizationCode) or None when login failed.  Logins
+   # are made one at a time so that operations started together don't each
+   # log in with the password.
+   ((hostname, port), (password, adminApiToken)) = details
+   with authorizationLock:
+      if adminApiToken != None and len(adminApiToken) > 0:
+         saveServerConfig(hostname, port, password, adminApiToken)
+         tokenCache.store(hostname, port, True, adminApiToken, verifiedFlag=False)
+         (authStatus, authCode) = sdsrm_lib.getClient(hostname, port).cachedToken(True, tokenCache)
+         if authCode != None:
+            return ("Success", (True, authCode))
 
-   ((hostname, port), (password, adminApiToken)) = getServerDetails()
-
-   if adminApiToken != None and len(adminApiToken) > 0:
-      authorizationInfo = (True, adminApiToken)
-      saveServerConfig(hostname, port, password, adminApiToken)
-
-   if authorizationInfo != None:
-      (adminFlag, authorizationCode) = authorizationInfo
-      (authVerResultStr, authVerResult) = sdsrm_lib.verifyAuthentication(hostname, port, authorizationCode)
-      if authVerResult == None:
-         print("Authentication code rejected")
-         authorizationInfo = None
-
-   if authorizationInfo == None:
       adminFlag = False
-      (authStatus, authCode) = sdsrm_lib.authenticate(hostname, port, adminFlag, password)
+      (authStatus, authCode) = sdsrm_lib.getToken(hostname, port, adminFlag, password, tokenCache)
       if authCode == None:
          print("Login failed")
-         serverStatusValue.set(authStatus)
-         return
-      authorizationInfo = (adminFlag, authCode)
+         return (authStatus, None)
       saveServerConfig(hostname, port, password, adminApiToken)
       print("Login successful")
-
-   return authorizationInfo != None
-
-def onGetServerState():
-   global authorizationInfo
-   serverStatusValue.set("Initiated")
-   print()
-
-   if not authenticated():
-      serverStatusValue.set("Auth Failure")
-      return
-   (adminFlag, authorizationCode) = authorizationInfo
-   ((hostname, port), password) = getServerDetails()
+      return ("Success", (adminFlag, authCode))
+
+def checkAuthFailure(status, details, adminFlag):
+   # Forget a token the server has rejected so the next action logs in again.
+   if sdsrm_lib.isAuthFailure(status):
+      ((hostname, port), password) = details
+      tokenCache.invalidate(hostname, port, adminFlag)
+
+def post(callback, *args):
+   # Runs callback(*args) on the Tk thread.
+   results.put((callback, args))
+
+def pollResults():
+   while True:
+      try:
+         (callback, args) = results.get_nowait()
+      except queue.Empty:
+         break
+      callback(*args)
+   window.after(RESULT_POLL_INTERVAL, pollResults)
+
+class Operation:
+   # One kind of network operation started from a button, with the label
+   # showing its status and a cancel button.  Only one of each kind runs at a
+   # time.  Calls already sent can't be taken back, so cancelling those only
+   # drops their result, except for uploads which stop sending.
+   def __init__(self, statusValue):
+      self.statusValue = statusValue
+      self.startButton = None
+      self.cancelButton = None
+      self.future = None
+      self.cancelledFlag = False
+
+   def start(self, run, *args):
+      # run(operation, *args) is called on a worker thread and returns the
+      # status to show.
+      self.statusValue.set("Initiated")
+      print()
+      self.cancelledFlag = False
+      self.startButton.configure(state=tk.DISABLED)
+      self.cancelButton.configure(state=tk.NORMAL)
+      self.future = workers.submit(self.work, run, args)
+
+   def work(self, run, args):
+      try:
+         status = run(self, *args)
+      except Exception as error:  # Report it rather than leave the buttons disabled
+         print(f"{type(error).__name__}: {error}")
+         status = "Error"
+      post(self.finish, status)
+
+   def finish(self, status):
+      if not self.cancelledFlag:
+         self.statusValue.set(status)
+      self.future = None
+      self.startButton.configure(state=tk.NORMAL)
+      self.cancelButton.configure(state=tk.DISABLED)
+
+   def cancel(self):
+      if self.future == None:
+         return
+      self.cancelledFlag = True
+      self.statusValue.set("Cancelled")
+      if self.future.cancel():  # It hadn't started yet
+         self.finish("Cancelled")
+
+   def progress(self, text):
+      # For use from the worker.  Returns False once cancelled.
+      if not self.cancelledFlag:
+         post(self.statusValue.set, text)
+      return not self.cancelledFlag
+
+def runGetServerState(operation, details):
+   (authStatus, authorization) = authenticated(details)
+   if authorization == None:
+      return "Auth Failure"
+   (adminFlag, authorizationCode) = authorization
+   ((hostname, port), password) = details
 
    print(f"getServerState({hostname}:{port})")
    (getStatus, serverStatus) = sdsrm_lib.getServerState(hostname, port, authorizationCode)
-   print(f"getServerState returned: {getStatus}, len {len(serverStatus)}")
+   print(f"getServerState returned: {getStatus}")
 
    if serverStatus != None:
-      serverStatusValue.set(serverStatus)
-   else:
-      authorizationInfo = None
-      serverStatusValue.set(getStatus)
-
-def onSetServerName():
-   global authorizationInfo
-   setServerNameStatusValue.set("Initiated")
-   print()
+      post(recordSample, (hostname, port), serverStatus)
+      return sdsrm_lib.formatServerState(serverStatus)
+   checkAuthFailure(getStatus, details, adminFlag)
+   return getStatus
 
-   if not authenticated():
-      setServerNameStatusValue.set("Auth Failure")
-      return
-   (adminFlag, authorizationCode) = authorizationInfo
-   ((hostname, port), password) = getServerDetails()
+def onGetServerState():
+   getServerStateOperation.start(runGetServerState, getServerDetails())
+
+def recordSample(server, serverState):
+   global historyServer
+   if server != historyServer:
+      history.clear()
+      historyServer = server
+   history.append((time.monotonic(), serverState))
+   drawCharts()
+
+def drawCharts():
+   chartCanvas.delete("all")
+   for (index, (name, title)) in enumerate(CHART_FIELDS):
+      left = CHART_MARGIN + index * (CHART_WIDTH + CHART_MARGIN)
+      top = CHART_MARGIN
+      (right, bottom) = (left + CHART_WIDTH, top + CHART_HEIGHT)
+      chartCanvas.create_rectangle(left, top, right, bottom, outline=myLabelColor)
+      samples = [(sampleTime, getattr(serverState, name)) for (sampleTime, serverState) in history if getattr(serverState, name) != None]
+      if len(samples) == 0:
+         chartCanvas.create_text(left, top - 2, anchor=tk.SW, fill=myRowTextColor, font=myChartFont, text=title)
+         continue
+
+      values = [value for (sampleTime, value) in samples]
+      (low, high) = (min(values), max(values))
+      chartCanvas.create_text(left, top - 2, anchor=tk.SW, fill=myRowTextColor, font=myChartFont, text=f"{title}: {values[-1]}")
+      chartCanvas.create_text(right, top - 2, anchor=tk.SE, fill=myRowTextColor, font=myChartFont, text=f"{low} to {high}")
+
+      # Time runs left to right across the whole history, so gaps from
+      # failed queries show as straight segments.
+      start = history[0][0]
+      span = max(history[-1][0] - start, 1)
+      valueSpan = high - low if high != low else 1
+      points = []
+      for (sampleTime, value) in samples:
+         points.append(left + (sampleTime - start) / span * CHART_WIDTH)
+         points.append(bottom - (value - low) / valueSpan * CHART_HEIGHT)
+      if len(points) == 2:
+         chartCanvas.create_oval(points[0] - 2, points[1] - 2, points[0] + 2, points[1] + 2, fill=myChartColor, outline=myChartColor)
+      else:
+         chartCanvas.create_line(*points, fill=myChartColor, width=2)
+
+def refreshInterval():
+   try:
+      return max(MIN_REFRESH_INTERVAL, float(refreshIntervalEntry.get()))
+   except ValueError:
+      return float(DEFAULT_REFRESH_INTERVAL)
+
+def onAutoRefresh():
+   global refreshTimer
+   if refreshTimer != None:
+      window.after_cancel(refreshTimer)
+      refreshTimer = None
+   if autoRefreshCheck.get():
+      onRefreshTimer()
+
+def onRefreshTimer():
+   # A query still running when the next one is due, for example while the
+   # server is slow to respond, is left to finish rather than doubled up.
+   global refreshTimer
+   if getServerStateOperation.future == None:
+      onGetServerState()
+   refreshTimer = window.after(int(refreshInterval() * 1000), onRefreshTimer)
+
+def runSetServerName(operation, details, newName):
+   (authStatus, authorization) = authenticated(details)
+   if authorization == None:
+      return "Auth Failure"
+   (adminFlag, authorizationCode) = authorization
+   ((hostname, port), password) = details
 
-   newName = setServerNameEntry.get()
    print(f"setServerName({hostname}:{port}, {newName})")
    setStatus = sdsrm_lib.setServerName(hostname, port, authorizationCode, newName)
    print(f"setServerName returned: {setStatus}")
+   checkAuthFailure(setStatus, details, adminFlag)
+   return setStatus
 
-   setServerNameStatusValue.set(setStatus)
+def onSetServerName():
+   setServerNameOperation.start(runSetServerName, getServerDetails(), setServerNameEntry.get())
 
 def onBrowseSave():
    filepath = askopenfilename(filetypes=[("Satisfactory Save Files", "*.sav"), ("All Files", "*.*")])
    print(filepath)
    savePathValue.set(filepath)
 
-def onUploadSave():
-   global authorizationInfo
-   uploadSaveStatusValue.set("Initiated")
-   print()
-
-   if not authenticated():
-      uploadSaveStatusValue.set("Auth Failure")
-      return
-   (adminFlag, authorizationCode) = authorizationInfo
-   ((hostname, port), password) = getServerDetails()
+def runUploadSave(operation, details, filepath, saveName, loadCheckFlag, advancedCheckFlag):
+   (authStatus, authorization) = authenticated(details)
+   if authorization == None:
+      return "Auth Failure"
+   (adminFlag, authorizationCode) = authorization
+   ((hostname, port), password) = details
 
-   filepath = savePathValue.get()
-   saveName = saveNameEntry.get()
-   loadCheckFlag = loadCheck.get()
-   advancedCheckFlag = advancedCheck.get()
+   def onProgress(progress):
+      return operation.progress(sdsrm_lib.formatTransferProgress(progress))
 
    print(f"uploadSave({hostname}:{port}, {filepath}, {saveName}, {loadCheckFlag}, {advancedCheckFlag})")
-   uploadStatus = sdsrm_lib.uploadSave(hostname, port, authorizationCode, filepath, saveName, loadCheckFlag, advancedCheckFlag)
+   uploadStatus = sdsrm_lib.uploadSave(hostname, port, authorizationCode, filepath, saveName, loadCheckFlag, advancedCheckFlag, progressCallback=onProgress)
    print(f"uploadSave returned: {uploadStatus}")
+   checkAuthFailure(uploadStatus, details, adminFlag)
+   return uploadStatus
 
-   uploadSaveStatusValue.set(uploadStatus)
-
-def onShutdown():
-   global authorizationInfo
-   shutdownStatusValue.set("Initiated")
-   print()
+def onUploadSave():
+   uploadSaveOperation.start(runUploadSave, getServerDetails(), savePathValue.get(), saveNameEntry.get(), loadCheck.get(), advancedCheck.get())
 
-   if not authenticated():
-      shutdownStatusValue.set("Auth Failure")
-      return
-   (adminFlag, authorizationCode) = authorizationInfo
-   ((hostname, port), password) = getServerDetails()
+def runShutdown(operation, details):
+   (authStatus, authorization) = authenticated(details)
+   if authorization == None:
+      return "Auth Failure"
+   (adminFlag, authorizationCode) = authorization
+   ((hostname, port), password) = details
 
    shutdownStatus = sdsrm_lib.shutdown(hostname, port, authorizationCode)
-   shutdownStatusValue.set(shutdownStatus)
+   checkAuthFailure(shutdownStatus, details, adminFlag)
+   return shutdownStatus
+
+def onShutdown():
+   shutdownOperation.start(runShutdown, getServerDetails())
 
 if __name__ == '__main__':
 
@@ -212,11 +358,32 @@ if __name__ == '__main__':
 
    frame2 = tk.Frame(pady=pady, bg=myRowColor)
    frame2.pack()
-   tk.Button(frame2, font=myNormalFont, bg=myRowColor, fg=myRowTextColor, text="Get Server State", command=onGetServerState).pack(side=tk.LEFT)
    serverStatusValue = tk.StringVar(window, "Server state unknown.  Please click 'Get Server State'.")
+   getServerStateOperation = Operation(serverStatusValue)
+   frame2a = tk.Frame(frame2, bg=myRowColor)
+   frame2a.pack(side=tk.LEFT)
+   getServerStateOperation.startButton = tk.Button(frame2a, font=myNormalFont, bg=myRowColor, fg=myRowTextColor, text="Get Server State", command=onGetServerState)
+   getServerStateOperation.startButton.pack()
+   getServerStateOperation.cancelButton = tk.Button(frame2a, font=mySmallFont, bg=myRowColor, fg=myRowTextColor, text="Cancel", state=tk.DISABLED, command=lambda: getServerStateOperation.cancel())
+   getServerStateOperation.cancelButton.pack()
    serverStatusLabel = tk.Label(frame2, font=mySmallFont, bg=myLabelColor, width=120, height=10, textvariable=serverStatusValue)
    serverStatusLabel.pack(side=tk.LEFT)
 
+   frame2b = tk.Frame(pady=pady, bg=myRowColor)
+   frame2b.pack()
+   frame2c = tk.Frame(frame2b, bg=myRowColor)
+   frame2c.pack(side=tk.LEFT)
+   autoRefreshCheck = tk.BooleanVar(window, False)
+   tk.Checkbutton(frame2c, font=myNormalFont, bg=myRowColor, fg=myRowTextColor, activebackground=myRowColor, activeforeground=myRowTextColor, highlightbackground=myRowColor, selectcolor=myRowColor, text="Auto Refresh", variable=autoRefreshCheck, command=onAutoRefresh).pack()
+   tk.Label(frame2c, font=mySmallFont, bg=myRowColor, fg=myRowTextColor, text="Every (seconds):").pack()
+   refreshIntervalEntry = tk.Entry(frame2c, font=mySmallFont, width=6, textvariable=tk.StringVar(window, DEFAULT_REFRESH_INTERVAL))
+   refreshIntervalEntry.pack()
+   myChartFont = (defaultFontFamily, 12)
+   myChartColor = "#fa9549"
+   chartCanvas = tk.Canvas(frame2b, bg=myOtherRowColor, highlightthickness=0, width=len(CHART_FIELDS) * (CHART_WIDTH + CHART_MARGIN) + CHART_MARGIN, height=CHART_HEIGHT + 2 * CHART_MARGIN)
+   chartCanvas.pack(side=tk.LEFT)
+   drawCharts()
+
    frame3 = tk.Frame(pady=pady, padx=129, bg=myOtherRowColor)
    frame3.pack()
    tk.Label(frame3, font=myNormalFont, bg=myOtherRowColor, fg=myOtherRowTextColor, text="New Server Name:").pack(side=tk.LEFT)
@@ -224,10 +391,14 @@ if __name__ == '__main__':
    setServerNameEntry = tk.Entry(frame3, font=myNormalFont, width=40)
    setServerNameEntry.pack(side=tk.LEFT)
    tk.Label(frame3, bg=myOtherRowColor, width=4).pack(side=tk.LEFT)
-   tk.Button(frame3, font=myNormalFont, bg=myOtherRowColor, fg=myOtherRowTextColor, text="Set Server Name", command=onSetServerName).pack(side=tk.LEFT)
    setServerNameStatusValue = tk.StringVar(window, "<>")
+   setServerNameOperation = Operation(setServerNameStatusValue)
+   setServerNameOperation.startButton = tk.Button(frame3, font=myNormalFont, bg=myOtherRowColor, fg=myOtherRowTextColor, text="Set Server Name", command=onSetServerName)
+   setServerNameOperation.startButton.pack(side=tk.LEFT)
    setServerNameStatusLabel = tk.Label(frame3, font=myNormalFont, bg=myLabelColor, width=20, textvariable=setServerNameStatusValue)
    setServerNameStatusLabel.pack(side=tk.LEFT)
+   setServerNameOperation.cancelButton = tk.Button(frame3, font=mySmallFont, bg=myOtherRowColor, fg=myOtherRowTextColor, text="Cancel", state=tk.DISABLED, command=lambda: setServerNameOperation.cancel())
+   setServerNameOperation.cancelButton.pack(side=tk.LEFT)
 
    frame4 = tk.Frame(pady=pady, padx=1, bg=myRowColor)
    frame4.pack()
@@ -251,16 +422,34 @@ if __name__ == '__main__':
    advancedCheck = tk.BooleanVar(window, False)
    tk.Checkbutton(frame4b, font=myNormalFont, bg=myRowColor, fg=myRowTextColor, activebackground=myRowColor, activeforeground=myRowTextColor, highlightbackground=myRowColor, selectcolor=myRowColor, text="Enable Advanced Game Settings on Upload", variable=advancedCheck).pack(side=tk.LEFT)
    tk.Label(frame4b, bg=myRowColor, width=4).pack(side=tk.LEFT)
-   tk.Button(frame4b, font=myNormalFont, bg=myRowColor, fg=myRowTextColor, text="Upload Save", height=0, command=onUploadSave).pack(side=tk.LEFT)
    uploadSaveStatusValue = tk.StringVar(window, "<>")
-   uploadSaveStatusLabel = tk.Label(frame4b, font=myNormalFont, bg=myLabelColor, width=20, textvariable=uploadSaveStatusValue)
+   uploadSaveOperation = Operation(uploadSaveStatusValue)
+   uploadSaveOperation.startButton = tk.Button(frame4b, font=myNormalFont, bg=myRowColor, fg=myRowTextColor, text="Upload Save", height=0, command=onUploadSave)
+   uploadSaveOperation.startButton.pack(side=tk.LEFT)
+   uploadSaveStatusLabel = tk.Label(frame4b, font=myNormalFont, bg=myLabelColor, width=24, textvariable=uploadSaveStatusValue)
    uploadSaveStatusLabel.pack(side=tk.LEFT)
+   uploadSaveOperation.cancelButton = tk.Button(frame4b, font=mySmallFont, bg=myRowColor, fg=myRowTextColor, text="Cancel", state=tk.DISABLED, command=lambda: uploadSaveOperation.cancel())
+   uploadSaveOperation.cancelButton.pack(side=tk.LEFT)
 
    frame5 = tk.Frame(frame4, padx=603, bg=myOtherRowColor)
    frame5.pack()
-   tk.Button(frame5, font=myNormalFont, bg=myOtherRowColor, fg=myOtherRowTextColor, text="Shutdown", height=0, command=onShutdown).pack(side=tk.LEFT)
    shutdownStatusValue = tk.StringVar(window, "<>")
+   shutdownOperation = Operation(shutdownStatusValue)
+   shutdownOperation.startButton = tk.Button(frame5, font=myNormalFont, bg=myOtherRowColor, fg=myOtherRowTextColor, text="Shutdown", height=0, command=onShutdown)
+   shutdownOperation.startButton.pack(side=tk.LEFT)
    shutdownStatusLabel = tk.Label(frame5, font=myNormalFont, bg=myLabelColor, width=20, textvariable=shutdownStatusValue)
    shutdownStatusLabel.pack(side=tk.LEFT)
-
+   shutdownOperation.cancelButton = tk.Button(frame5, font=mySmallFont, bg=myOtherRowColor, fg=myOtherRowTextColor, text="Cancel", state=tk.DISABLED, command=lambda: shutdownOperation.cancel())
+   shutdownOperation.cancelButton.pack(side=tk.LEFT)
+
+   def onClose():
+      # Stops a running upload so the process can exit.  Other calls end
+      # within their timeouts.
+      for operation in (getServerStateOperation, setServerNameOperation, uploadSaveOperation, shutdownOperation):
+         operation.cancel()
+      window.destroy()
+
+   window.protocol("WM_DELETE_WINDOW", onClose)
+   window.after(RESULT_POLL_INTERVAL, pollResults)
    window.mainloop()
+   workers.shutdown(wait=False)
@@ -13,401 +13,2249 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+# asyncio is imported by the functions that use it.  It takes longer to
+# import than everything else here together, and the synchronous API and its
+# command line users don't need it.
+import contextlib
+import functools
+import hashlib
 import os
 import json
+import mmap
 import random
+import select
 import socket
 import ssl
 import string
+import tempfile
+import threading
+import time
 
 ALLOW_SELF_SIGNED_CERTS_FLAG = True
 USER_AGENT = "sdsm/1.1.0"
+DEFAULT_POOL_SIZE = 4
+RECV_TIMEOUT = 10
+CONNECT_TIMEOUT = 5  # Seconds for the TCP connect plus TLS handshake
+TOTAL_TIMEOUT = 30  # Seconds for a whole call, retries included, other than uploads and downloads
+RETRY_COUNT = 2
+RETRY_BACKOFF = 0.25  # Seconds.  Retry n waits a random time up to RETRY_BACKOFF * 2**n.
+RETRY_BACKOFF_MAX = 4.0
+RECV_SIZE = 65536
+UPLOAD_CHUNK_SIZE = 1048576
+UPLOAD_INDEX_FILENAME = "UploadIndex.json"
+TOKEN_CACHE_FILENAME = "TokenCache.json"
+TOKEN_VERIFY_TTL = 600  # Seconds a verified token is trusted before it is verified again
+PROGRESS_INTERVAL = 0.5  # Seconds between progress reports during a transfer
+MAX_HEADER_SIZE = 65536
+DEFAULT_FLEET_CONCURRENCY = 64
+DEFAULT_DEPLOY_CONCURRENCY = 16  # Uploads in flight at once across a deploy
+DEFAULT_HOST_CONCURRENCY = 2  # Uploads in flight at once to servers sharing a host
+REQUEST_PREFIX_CACHE_SIZE = 256  # Pre-encoded request header prefixes kept, one per (host, token)
+BANDWIDTH_BURST = 262144  # Default bytes a bandwidth limit lets through at once
+KEEP_ALIVE_MARGIN = 1.0  # Seconds.  Stop reusing a connection this long before the server's keep-alive timeout.
+
+class HttpProtocolError(Exception):
+   pass
+
+class HttpResponse:
+   def __init__(self):
+      self.statusCode = None
+      self.reason = ""
+      self.headers = {}  # Lower-case header name to value
+      self.body = b""
+      self.bodyLength = 0
+
+   def keepAliveTimeout(self):
+      # The dedicated server sends "keep-alive: timeout=15.000000".
+      for param in self.headers.get("keep-alive", "").split(","):
+         (key, sep, value) = param.strip().partition("=")
+         if key.lower() == "timeout":
+            try:
+               return float(value)
+            except ValueError:
+               return None
+      return None
+
+   def closeFlag(self):
+      return self.headers.get("connection", "").lower() == "close"
+
+# Incremental HTTP/1.1 response parser.  Bytes are fed in as they arrive from
+# the socket, in whatever pieces TLS delivers them.  feed() returns True once
+# a full response has been parsed; any bytes past the end of that response
+# are kept in leftover() for the next response on the same connection.
+# Interim 1xx responses, such as "100 Continue", are skipped.  If bodySink is
+# given, the body of a 2xx response is passed to it as bodySink(response,
+# data) piece by piece instead of being collected in response.body.  Other
+# bodies, usually a JSON error, are always collected.
+class HttpResponseParser:
+   def __init__(self, bodySink=None):
+      self.bodySink = bodySink
+      self.sinkFlag = False
+      self.buffer = bytearray()
+      self.body = bytearray()
+      self.response = HttpResponse()
+      self.state = "status"
+      self.remaining = 0
+
+   def leftover(self):
+      return bytes(self.buffer)
+
+   def feed(self, data):
+      if self.state == "body" and len(self.buffer) == 0 and len(data) <= self.remaining:
+         # The common case while streaming a large body.  Skip the buffer.
+         self.emit(data)
+         self.remaining -= len(data)
+         if self.remaining == 0:
+            return self.finish()
+         return False
+      self.buffer += data
+      return self.parse()
+
+   def feedEof(self):
+      if self.state == "untilClose":
+         return self.finish()
+      if self.state == "done":
+         return True
+      raise HttpProtocolError(f"Connection closed in state {self.state}")
+
+   def emit(self, data):
+      self.response.bodyLength += len(data)
+      if self.sinkFlag:
+         self.bodySink(self.response, data)
+      else:
+         self.body += data
 
-context = None
-sock = None
-ssock = None
+   def finish(self):
+      self.state = "done"
+      if not self.sinkFlag:
+         self.response.body = bytes(self.body)
+      return True
 
-def connect(hostname, port):
-   global context
-   global sock
-   global ssock
+   def startBody(self):
+      response = self.response
+      if 100 <= response.statusCode < 200:
+         self.response = HttpResponse()
+         self.state = "status"
+         return False
+      if response.statusCode in (204, 304):
+         return self.finish()
+      self.sinkFlag = self.bodySink != None and 200 <= response.statusCode < 300
+      if "chunked" in response.headers.get("transfer-encoding", "").lower():
+         self.state = "chunkSize"
+         return False
+      if "content-length" in response.headers:
+         try:
+            self.remaining = int(response.headers["content-length"])
+         except ValueError:
+            raise HttpProtocolError(f"Bad content-length {response.headers['content-length']}")
+         if self.remaining == 0:
+            return self.finish()
+         self.state = "body"
+         return False
+      self.state = "untilClose"
+      return False
 
-   if ssock != None:
-      return True
+   def parse(self):
+      while True:
+         if self.state == "done":
+            return True
+
+         if self.state in ("body", "chunkData"):
+            if len(self.buffer) == 0:
+               return False
+            count = min(self.remaining, len(self.buffer))
+            self.emit(bytes(self.buffer[:count]))
+            del self.buffer[:count]
+            self.remaining -= count
+            if self.remaining == 0:
+               if self.state == "body":
+                  return self.finish()
+               self.state = "chunkEnd"
+            continue
+
+         if self.state == "untilClose":
+            if len(self.buffer) > 0:
+               self.emit(bytes(self.buffer))
+               self.buffer.clear()
+            return False
+
+         eol = self.buffer.find(b"\r\n")
+         if eol == -1:
+            if len(self.buffer) > MAX_HEADER_SIZE:
+               raise HttpProtocolError("Header line too long")
+            return False
+         line = bytes(self.buffer[:eol])
+         del self.buffer[:eol + 2]
+
+         if self.state == "status":
+            parts = line.split(b" ", 2)
+            if len(parts) < 2 or parts[0][:5] != b"HTTP/":
+               raise HttpProtocolError(f"Bad status line {line}")
+            try:
+               self.response.statusCode = int(parts[1])
+            except ValueError:
+               raise HttpProtocolError(f"Bad status line {line}")
+            if len(parts) == 3:
+               self.response.reason = parts[2].decode("latin-1")
+            self.state = "headers"
+
+         elif self.state == "headers":
+            if len(line) == 0:
+               if self.startBody():
+                  return True
+            else:
+               (name, sep, value) = line.partition(b":")
+               self.response.headers[name.strip().lower().decode("latin-1")] = value.strip().decode("latin-1")
+
+         elif self.state == "chunkSize":
+            try:
+               self.remaining = int(line.split(b";")[0], 16)
+            except ValueError:
+               raise HttpProtocolError(f"Bad chunk size {line}")
+            if self.remaining == 0:
+               self.state = "trailers"
+            else:
+               self.state = "chunkData"
 
-   if context == None:
-      if ALLOW_SELF_SIGNED_CERTS_FLAG:
-         context = ssl._create_unverified_context()
-      else:
-         context = ssl.create_default_context()
+         elif self.state == "chunkEnd":
+            if len(line) != 0:
+               raise HttpProtocolError("Missing chunk terminator")
+            self.state = "chunkSize"
 
-   if sock == None:
-      try:
-         sock = socket.create_connection((hostname, port))
-      except ConnectionRefusedError:
-         return False
+         elif self.state == "trailers":
+            if len(line) == 0:
+               return self.finish()
 
-   if not sock:
+def createContext():
+   if ALLOW_SELF_SIGNED_CERTS_FLAG:
+      return ssl._create_unverified_context()
+   else:
+      return ssl.create_default_context()
+
+contexts = {}
+contextsLock = threading.Lock()
+
+def getContext(hostname):
+   # Building an SSLContext is costly (the default one loads the system's CA
+   # store), and TLS sessions can only be resumed through the context that
+   # created them, so every client for a host shares one context.
+   with contextsLock:
+      if hostname not in contexts:
+         contexts[hostname] = createContext()
+      return contexts[hostname]
+
+class HandshakeStats:
+   __slots__ = ("handshakes", "resumed", "totalTime", "maxTime", "lastTime")
+
+   def __init__(self):
+      self.handshakes = 0
+      self.resumed = 0      # Handshakes that resumed an earlier TLS session
+      self.totalTime = 0.0  # Seconds spent in TCP connect plus TLS handshake
+      self.maxTime = 0.0
+      self.lastTime = 0.0
+
+   def record(self, seconds, resumedFlag):
+      self.handshakes += 1
+      if resumedFlag:
+         self.resumed += 1
+      self.totalTime += seconds
+      self.maxTime = max(self.maxTime, seconds)
+      self.lastTime = seconds
+
+   def averageTime(self):
+      return self.totalTime / max(1, self.handshakes)
+
+   def toDict(self):
+      result = {name: getattr(self, name) for name in self.__slots__}
+      result["averageTime"] = self.averageTime()
+      return result
+
+# Calls that can safely be sent again when it isn't known whether the server
+# acted on them.  Uploads and downloads have no total deadline since their
+# duration depends on the size of the save.
+IDEMPOTENT_FUNCTIONS = ("verifyAuthentication", "getServerState", "setServerName", "enumerateSessions", "downloadSave")
+TRANSFER_FUNCTIONS = ("uploadSave", "downloadSave")
+
+class BandwidthLimit:
+   # A token bucket shared by every transfer that uses it, in any thread or
+   # event loop.  Tokens, in bytes, accrue at rate bytes per second up to
+   # burst.  Transfers are sent in pieces of at most burst bytes, and each
+   # piece takes its tokens and waits until they would have accrued, so the
+   # transfers together average rate.  A rate of None means no limit.
+   # setRate() applies from the next piece of every transfer in progress.
+   def __init__(self, rate=None, burst=BANDWIDTH_BURST):
+      self.lock = threading.Lock()
+      self.rate = None
+      self.burst = burst
+      self.tokens = burst
+      self.lastTime = time.monotonic()
+      self.setRate(rate)
+
+   def setRate(self, rate, burst=None):
+      with self.lock:
+         self.refill()
+         self.rate = rate if rate else None
+         if burst != None:
+            self.burst = max(1, int(burst))
+         self.tokens = min(self.tokens, self.burst)
+
+   def refill(self):
+      # Called with the lock held.
+      now = time.monotonic()
+      if self.rate != None:
+         self.tokens = min(self.burst, self.tokens + (now - self.lastTime) * self.rate)
+      self.lastTime = now
+
+   def pieceSize(self, chunkSize):
+      if self.rate == None:
+         return chunkSize
+      return min(chunkSize, self.burst)
+
+   def reserve(self, byteCount):
+      # Takes byteCount tokens and returns the seconds to wait before using
+      # them.  Tokens can go negative, so waiters are served in order.
+      if self.rate == None:
+         return 0
+      with self.lock:
+         self.refill()
+         if self.rate == None:
+            return 0
+         self.tokens -= byteCount
+         if self.tokens >= 0:
+            return 0
+         return -self.tokens / self.rate
+
+   def wait(self, byteCount):
+      delay = self.reserve(byteCount)
+      if delay > 0:
+         time.sleep(delay)
+
+   async def waitAsync(self, byteCount):
+      delay = self.reserve(byteCount)
+      if delay > 0:
+         import asyncio
+         await asyncio.sleep(delay)
+
+# The limits shared by all clients whose policy doesn't name others.  Both
+# are unlimited until given a rate.
+uploadBandwidth = BandwidthLimit()
+downloadBandwidth = BandwidthLimit()
+
+class RequestPolicy:
+   # Timeouts and retries, shared by every call of the clients using it.
+   # connectTimeout bounds the TCP connect plus TLS handshake, readTimeout
+   # each wait for the server while sending or receiving, and totalTimeout a
+   # whole call including retries.  None means no limit.  Calls in
+   # IDEMPOTENT_FUNCTIONS are retried up to retries times after a failed
+   # connect, a reset or a timeout, after a random delay of up to
+   # backoff * 2**n seconds (at most maxBackoff) before retry n.  Save
+   # uploads and downloads are throttled by the BandwidthLimits
+   # uploadBandwidth and downloadBandwidth.
+   __slots__ = ("connectTimeout", "readTimeout", "totalTimeout", "retries", "backoff", "maxBackoff",
+                "uploadBandwidth", "downloadBandwidth")
+
+   def __init__(self, connectTimeout=CONNECT_TIMEOUT, readTimeout=RECV_TIMEOUT, totalTimeout=TOTAL_TIMEOUT,
+                retries=RETRY_COUNT, backoff=RETRY_BACKOFF, maxBackoff=RETRY_BACKOFF_MAX,
+                uploadBandwidth=uploadBandwidth, downloadBandwidth=downloadBandwidth):
+      self.connectTimeout = connectTimeout
+      self.readTimeout = readTimeout
+      self.totalTimeout = totalTimeout
+      self.retries = retries
+      self.backoff = backoff
+      self.maxBackoff = maxBackoff
+      self.uploadBandwidth = uploadBandwidth
+      self.downloadBandwidth = downloadBandwidth
+
+   def deadline(self, function):
+      if self.totalTimeout == None or function in TRANSFER_FUNCTIONS:
+         return None
+      return time.monotonic() + self.totalTimeout
+
+   def retryDelay(self, function, retries, deadline):
+      # Seconds to wait before the next retry, or None to give up.
+      if function not in IDEMPOTENT_FUNCTIONS or retries >= self.retries:
+         return None
+      delay = random.uniform(0, min(self.maxBackoff, self.backoff * 2 ** retries))
+      if deadline != None and time.monotonic() + delay >= deadline:
+         return None
+      return delay
+
+# The policy of clients created without one of their own
+defaultPolicy = RequestPolicy()
+
+def remainingTime(deadline, limit):
+   # The timeout for the next wait: limit, or less if the deadline is closer.
+   # Raises TimeoutError once the deadline has passed.
+   if deadline == None:
+      return limit
+   remaining = deadline - time.monotonic()
+   if remaining <= 0:
+      raise TimeoutError("Deadline passed")
+   if limit == None:
+      return remaining
+   return min(limit, remaining)
+
+def resendFlag(function, connection, freshFlag):
+   # True if a request that failed on connection is to be sent again at once
+   # on a fresh one: nothing came back on a reused connection, which the
+   # server may have closed while it was idle.
+   if freshFlag or not connection.usedFlag or connection.receivedFlag:
       return False
+   return function in IDEMPOTENT_FUNCTIONS or not connection.sentFlag
+
+# Instrumentation.  Listeners are called as listener(event, timing) where
+# timing is the RequestTiming of the call.  A "reconnect" event comes each
+# time a call is retried on a new connection, and a "request" event when the
+# call ends.  With no listeners the cost is a few clock reads per call.
+listeners = []
+
+def addListener(listener):
+   listeners.append(listener)
+
+def removeListener(listener):
+   listeners.remove(listener)
+
+class RequestTiming:
+   # Where the time went in one API call, in seconds.  resolve, connect and
+   # handshake are None when a kept-alive connection was reused.  firstByte
+   # runs from the end of the request write to the first byte of the
+   # response, which is mostly server think time.
+   __slots__ = ("function", "hostname", "port", "resolve", "connect", "handshake", "write", "firstByte", "total",
+                "bytesSent", "bytesReceived", "retries", "reusedFlag", "statusCode", "error", "start", "writeEnd")
+
+   def __init__(self, function, hostname, port):
+      self.function = function
+      self.hostname = hostname
+      self.port = port
+      self.start = time.perf_counter()
+      self.writeEnd = None
+      self.resolve = None
+      self.connect = None
+      self.handshake = None
+      self.write = None
+      self.firstByte = None
+      self.total = None
+      self.bytesSent = 0
+      self.bytesReceived = 0
+      self.retries = 0
+      self.reusedFlag = False
+      self.statusCode = None
+      self.error = None  # The error status when no response was received
+
+   def useConnection(self, connection):
+      # A new connection hands over its setup times once.
+      self.reusedFlag = connection.setupTimes == None
+      if not self.reusedFlag:
+         (self.resolve, self.connect, self.handshake) = connection.setupTimes
+         connection.setupTimes = None
+
+   def wrote(self, writeStart, byteCount):
+      self.writeEnd = time.perf_counter()
+      self.write = self.writeEnd - writeStart
+      self.bytesSent += byteCount
+
+   def received(self, connection, response):
+      if connection.firstByteTime != None and self.writeEnd != None:
+         self.firstByte = max(0.0, connection.firstByteTime - self.writeEnd)
+      self.bytesReceived += connection.bytesReceived
+      self.statusCode = response.statusCode
+
+   def reconnecting(self):
+      self.retries += 1
+      if listeners:
+         report("reconnect", self)
+
+   def finish(self, error=None):
+      self.total = time.perf_counter() - self.start
+      self.error = error
+      if listeners:
+         report("request", self)
+
+   def toDict(self):
+      return {name: getattr(self, name) for name in self.__slots__[:-2]}
+
+def report(event, timing):
+   for listener in tuple(listeners):
+      listener(event, timing)
+
+class ServerConnection:
+   def __init__(self, ssock):
+      self.ssock = ssock
+      self.buffer = b""
+      self.expiry = None
+      self.usedFlag = False      # Has completed at least one response
+      self.sentFlag = False      # Has written the whole of the current request
+      self.receivedFlag = False  # Has received part, but not all, of a response
+      self.setupTimes = None     # (resolve, connect, handshake) until the first call takes them
+      self.firstByteTime = None  # perf_counter() at the first byte of the last response
+      self.bytesReceived = 0     # Bytes read for the last response
+      self.readTimeout = RECV_TIMEOUT
+
+   def reusable(self):
+      return self.expiry == None or time.monotonic() < self.expiry
+
+   def close(self):
+      self.ssock.close()
+
+   def peerClosed(self):
+      # True if the server has closed the idle connection.  Checked before a
+      # request is written, since afterwards a closed connection can't be
+      # told apart from a server that failed while acting on the request.
+      if len(self.buffer) > 0:
+         return True  # Bytes nobody asked for
+      timeout = self.ssock.gettimeout()
+      try:
+         if not select.select([self.ssock], [], [], 0)[0]:
+            return False
+         self.ssock.setblocking(False)
+         self.ssock.recv(1)  # b"" at EOF, and any data is out of place too
+      except ssl.SSLWantReadError:
+         return False  # Only TLS records such as a session ticket
+      except (ssl.SSLError, OSError, ValueError):
+         return True
+      finally:
+         if self.ssock.fileno() >= 0:
+            self.ssock.settimeout(timeout)
+      return True
 
-   ssock = context.wrap_socket(sock, server_hostname=hostname)
-   return True
-
-def authenticate(hostname, port, adminFlag, password):
+   def readResponse(self, bodySink=None, deadline=None, bandwidthLimit=None):
+      parser = HttpResponseParser(bodySink)
+      self.sentFlag = True
+      self.receivedFlag = len(self.buffer) > 0
+      self.firstByteTime = time.perf_counter() if self.receivedFlag else None
+      self.bytesReceived = 0
+      doneFlag = self.receivedFlag and parser.feed(self.buffer)
+      while not doneFlag:
+         if deadline != None:
+            self.ssock.settimeout(remainingTime(deadline, self.readTimeout))
+         data = self.ssock.recv(RECV_SIZE)
+         if bandwidthLimit != None:
+            bandwidthLimit.wait(len(data))
+         if not data:
+            if not self.receivedFlag:
+               raise ConnectionResetError("Connection closed before response")
+            self.expiry = 0
+            try:
+               doneFlag = parser.feedEof()
+            except HttpProtocolError as error:
+               raise ConnectionResetError(str(error))  # Truncated response
+         else:
+            if not self.receivedFlag:
+               self.firstByteTime = time.perf_counter()
+               self.receivedFlag = True
+            self.bytesReceived += len(data)
+            doneFlag = parser.feed(data)
+      self.buffer = parser.leftover()
+      self.usedFlag = True
+      self.sentFlag = False
+      self.receivedFlag = False
+
+      response = parser.response
+      keepAliveTimeout = response.keepAliveTimeout()
+      if response.closeFlag() or parser.state == "untilClose":
+         self.expiry = 0
+      elif keepAliveTimeout != None and self.expiry != 0:
+         self.expiry = time.monotonic() + keepAliveTimeout - KEEP_ALIVE_MARGIN
+      return response
+
+
+@functools.lru_cache(maxsize=REQUEST_PREFIX_CACHE_SIZE)
+def requestPrefix(hostname, authorizationCode=None):
+   # The headers every request to hostname with authorizationCode starts
+   # with, encoded once.  Header values can't hold line breaks, which would
+   # end the header early.
+   headers = ["POST /api/v1 HTTP/1.1", f"Host: {hostname}", f"User-Agent: {USER_AGENT}", "Accept: */*"]
+   if authorizationCode != None:
+      headers.append(f"Authorization: Bearer {authorizationCode}")
+   for header in headers:
+      if "\r" in header or "\n" in header:
+         raise ValueError(f"Line break in header {header!r}")
+   try:
+      return ("\r\n".join(headers) + "\r\n").encode("ascii")
+   except UnicodeEncodeError:  # Internationalized host name
+      headers[1] = "Host: " + hostname.encode("idna").decode("ascii")
+      return ("\r\n".join(headers) + "\r\n").encode()
+
+JSON_HEADERS = b"Content-Type: application/json\r\nContent-Length: "
+
+# json.dumps() with options builds a new encoder every call.
+jsonEncoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+def encodeBody(function, data=None):
+   # The JSON request body for an API function, as UTF-8 bytes.
+   message = {"function": function}
+   if data != None:
+      message["data"] = data
+   return jsonEncoder.encode(message).encode()
+
+# Bodies of the functions that take no data never change.
+VERIFY_AUTHENTICATION_BODY = encodeBody("VerifyAuthenticationToken")
+QUERY_SERVER_STATE_BODY = encodeBody("QueryServerState")
+ENUMERATE_SESSIONS_BODY = encodeBody("EnumerateSessions")
+SHUTDOWN_BODY = encodeBody("Shutdown")
+
+def buildRequest(hostname, body, authorizationCode=None):
+   # body is from encodeBody().  Content-Length counts its bytes.
+   return b"".join((requestPrefix(hostname, authorizationCode), JSON_HEADERS, str(len(body)).encode(), b"\r\n\r\n", body))
+
+# Each API function is split into the request it sends and the interpretation
+# of the response, so ServerClient and AsyncServerClient share both and only
+# differ in how the bytes move.
+
+class ResultStatus(str):
+   # A status that also keeps the HTTP status code of the response it was
+   # made from, as the text alone doesn't always tell what the server said.
+   # Compares and prints as the plain string.
+   def __new__(cls, text, statusCode):
+      status = super().__new__(cls, text)
+      status.statusCode = statusCode
+      return status
+
+def keepsStatusCode(resultFunction):
+   # Decorates the xxxResult() functions, whose last argument is the response,
+   # so the status they return is a ResultStatus.
+   @functools.wraps(resultFunction)
+   def wrapper(*args):
+      result = resultFunction(*args)
+      response = args[-1]
+      if response == None:
+         return result
+      if isinstance(result, tuple):
+         return (ResultStatus(result[0], response.statusCode),) + result[1:]
+      return ResultStatus(result, response.statusCode)
+   return wrapper
+
+def authenticatePackage(adminFlag, password):
    if adminFlag:
       minimumPrivilegeLevel = "Administrator"
    else:
       minimumPrivilegeLevel = "Client"
 
    if password == None or len(password) == 0:
-      package = '{"function": "PasswordlessLogin", "data": {"MinimumPrivilegeLevel": "' + minimumPrivilegeLevel + '"}}'
+      return encodeBody("PasswordlessLogin", {"MinimumPrivilegeLevel": minimumPrivilegeLevel})
    else:
-      package = '{"function": "PasswordLogin", "data": {"MinimumPrivilegeLevel": "' + minimumPrivilegeLevel + '", "Password": "' + password + '"}}'
-
-   package = f'POST /api/v1 HTTP/1.1\r\nHost: {hostname}\r\nUser-Agent: {USER_AGENT}\r\nAccept: */*\r\nContent-Type: application/json\r\nContent-Length: {len(package)}\r\n\r\n{package}'
-
-   global sock
-   global ssock
-   for returnFlag in (False, True):
-      if not connect(hostname, port):
-         return ("Connection Failed", None)
-
-      try:
-         print("DEBUG: Authenticating")
-         ssock.send(package.encode())
-         break
-      except ssl.SSLEOFError:
-         print("Reconnecting because socket has closed")
-         sock = None
-         ssock = None
-         if returnFlag:
-            return ("Bad Sock", None)
-
-   ssock.settimeout(10)
+      return encodeBody("PasswordLogin", {"MinimumPrivilegeLevel": minimumPrivilegeLevel, "Password": password})
 
-   try:
-      data = ssock.recv(2048)
-
-      if data[:12] == b"HTTP/1.1 403":
-         return ("Server error: Forbidden", None)
+@keepsStatusCode
+def authenticateResult(errorStatus, response):
+   if errorStatus != None:
+      return (errorStatus, None)
 
-      elif data[:10] == b"HTTP/1.1 4":
-         return (f"Server error {data[9:12].decode()}", None)
-
-      elif data[:12] == b"HTTP/1.1 200":
-         data = ssock.recv(2048)
-         try:
-            data = json.loads(data.decode())
-         except json.decoder.JSONDecodeError:
-            print(f"JSON decode failed: '{data}'")
-            return ("JSON decode error", None)
-         if "errorCode" in data:
-            if "errorMessage" in data:
-               return (f"{data['errorCode']}: {data['errorMessage']}", None)
-            else:
-               return (data["errorCode"], None)
-         if "data" not in data:
-            return ("Missing data", None)
-         if "authenticationToken" not in data["data"]:
-            return ("Missing token", None)
-         return ("Success", data["data"]["authenticationToken"])
+   if response.statusCode == 403:
+      return ("Server error: Forbidden", None)
 
-      else:
-         print(f"Unsupported returned data from server: '{data}'")
-         return ("Server Failure", None)
-   except TimeoutError:
-      return ("Timed Out", None)
-
-def verifyAuthentication(hostname, port, authorizationCode):
-   package = '{"function": "VerifyAuthenticationToken"}'
-   package = f'POST /api/v1 HTTP/1.1\r\nHost: {hostname}\r\nUser-Agent: {USER_AGENT}\r\nAccept: */*\r\nAuthorization: Bearer {authorizationCode}\r\nContent-Type: application/json\r\nContent-Length: {len(package)}\r\n\r\n{package}'
-
-   global sock
-   global ssock
-   for returnFlag in (False, True):
-      if not connect(hostname, port):
-         return ("Connection Failed", None)
+   elif 400 <= response.statusCode < 500:
+      return (f"Server error {response.statusCode}", None)
 
+   elif response.statusCode == 200:
       try:
-         print("DEBUG: Verifying Authentication")
-         ssock.send(package.encode())
-         break
-      except ssl.SSLEOFError:
-         print("Reconnecting because socket has closed")
-         sock = None
-         ssock = None
-         if returnFlag:
-            return ("Bad Sock", False)
-
-   ssock.settimeout(10)
-
-   try:
-      data = ssock.recv(2048)
-   except TimeoutError:
-      return ("Timed Out", False)
+         data = json.loads(response.body.decode())
+      except (json.decoder.JSONDecodeError, UnicodeDecodeError):
+         print(f"JSON decode failed: '{response.body}'")
+         return ("JSON decode error", None)
+      if "errorCode" in data:
+         if "errorMessage" in data:
+            return (f"{data['errorCode']}: {data['errorMessage']}", None)
+         else:
+            return (data["errorCode"], None)
+      if "data" not in data:
+         return ("Missing data", None)
+      if "authenticationToken" not in data["data"]:
+         return ("Missing token", None)
+      return ("Success", data["data"]["authenticationToken"])
 
-   if data[:12] == b"HTTP/1.1 401":
+   else:
+      print(f"Unsupported returned data from server: {response.statusCode} '{response.body}'")
+      return ("Server Failure", None)
+
+BATCH_FUNCTIONS = ("verifyAuthentication", "getServerState", "setServerName", "enumerateSessions", "uploadSave", "downloadSave", "shutdown")
+SUCCESS_STATUSES = ("Success", "Unchanged")
+
+def resultStatus(result):
+   # API functions return either a status or a (status, data) tuple.
+   if isinstance(result, tuple):
+      return result[0]
+   return result
+
+def isAuthFailure(status):
+   # True for the statuses the API functions return when the server rejects
+   # the authorization token, going by the HTTP status code rather than the
+   # text, which for some functions is the server's own error message.
+   return getattr(status, "statusCode", None) in (401, 403)
+
+@keepsStatusCode
+def verifyAuthenticationResult(errorStatus, response):
+   if errorStatus != None:
+      return (errorStatus, False)
+
+   if response.statusCode == 401:
       return ("Auth Failure", False)
 
-   if data[:10] == b"HTTP/1.1 4":
-      return (f"Server error {data[9:12].decode()}", False)
+   if 400 <= response.statusCode < 500:
+      return (f"Server error {response.statusCode}", False)
 
-   if data[:12] == b"HTTP/1.1 204":
+   if response.statusCode == 204:
       return ("Success", True)
 
-   print(f"Unsupported returned data from server: '{data}'")
+   print(f"Unsupported returned data from server: {response.statusCode} '{response.body}'")
    return ("Server Failure", False)
 
-def getServerState(hostname, port, authorizationCode):
-   package = f'POST /api/v1 HTTP/1.1\r\nHost: {hostname}\r\nUser-Agent: {USER_AGENT}\r\nAccept: */*\r\nAuthorization: Bearer {authorizationCode}\r\n' + 'Content-Type: application/json\r\nContent-Length: 32\r\n\r\n{"function": "QueryServerState"}'
-
-   global sock
-   global ssock
-   for returnFlag in (False, True):
-      if not connect(hostname, port):
-         return ("Connection Failed", None)
+GAME_PHASE_NAMES = {
+   "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_0.GP_Project_Assembly_Phase_0'": "Onboarding",
+   "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_1.GP_Project_Assembly_Phase_1'": "Distribution Platform",
+   "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_2.GP_Project_Assembly_Phase_2'": "Construction Dock",
+   "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_3.GP_Project_Assembly_Phase_3'": "Main Body",
+   "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_4.GP_Project_Assembly_Phase_4'": "Propulsion Systems",
+   "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_5.GP_Project_Assembly_Phase_5'": "Assembly",
+   "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_6.GP_Project_Assembly_Phase_6'": "Completing",
+   "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_7.GP_Project_Assembly_Phase_7'": "Completed",
+   }
+
+# QueryServerState's serverGameState fields and their types.  A field the
+# server leaves out, or sends with the wrong type, is None.
+SERVER_STATE_FIELDS = (
+   ("activeSessionName", str),
+   ("numConnectedPlayers", int),
+   ("techTier", int),
+   ("activeSchematic", str),
+   ("gamePhase", str),
+   ("isGameRunning", bool),
+   ("totalGameDuration", int),
+   ("isGamePaused", bool),
+   ("averageTickRate", float),
+   ("autoLoadSessionName", str),
+   )
+
+class TypedRecord:
+   # A record of the fields a subclass lists in FIELDS, as (name, type), taken
+   # from a JSON object.  Fields that are missing or of the wrong type are None.
+   FIELDS = ()
+   __slots__ = ()
+
+   def __init__(self, jdata):
+      for (name, fieldType) in self.FIELDS:
+         value = jdata.get(name)
+         if value != None and type(value) != fieldType:
+            if fieldType == float and type(value) == int:
+               value = float(value)
+            else:
+               value = None
+         setattr(self, name, value)
+
+   def toDict(self):
+      return {name: getattr(self, name) for (name, fieldType) in self.FIELDS}
+
+class ServerState(TypedRecord):
+   FIELDS = SERVER_STATE_FIELDS
+   __slots__ = tuple(name for (name, fieldType) in SERVER_STATE_FIELDS)
+
+   def gamePhaseName(self):
+      return GAME_PHASE_NAMES.get(self.gamePhase, self.gamePhase)
+
+def formatServerState(serverState):
+   lines = []
+   if serverState.activeSessionName != None:
+      lines.append(f"Active Session Name: {serverState.activeSessionName}")
+   if serverState.numConnectedPlayers != None:
+      lines.append(f"Number of Connected Players: {serverState.numConnectedPlayers}")
+   if serverState.techTier != None:
+      lines.append(f"Tech Tier: {serverState.techTier}")
+   if serverState.activeSchematic != None:
+      lines.append(f"Active Schematic: {serverState.activeSchematic}")
+   if serverState.gamePhase != None:
+      lines.append(f"Game Phase: {serverState.gamePhaseName()}")
+   if serverState.isGameRunning != None:
+      lines.append(("Game Not Running", "Game Is Running")[serverState.isGameRunning])
+   if serverState.totalGameDuration != None:
+      lines.append(f"Total Game Duration: {serverState.totalGameDuration}")
+   if serverState.isGamePaused != None:
+      lines.append(("Game Not Paused", "Game Is Paused")[serverState.isGamePaused])
+   if serverState.averageTickRate != None:
+      lines.append(f"Average Tick Rate: {serverState.averageTickRate}")
+   if serverState.autoLoadSessionName != None:
+      lines.append(f"Auto Load Session Name: {serverState.autoLoadSessionName}")
+   return "\n".join(lines)
+
+@keepsStatusCode
+def getServerStateResult(errorStatus, response):
+   if errorStatus != None:
+      return (errorStatus, None)
+
+   if response.statusCode == 403:
+      return ("Server error: Forbidden", None)
+
+   elif 400 <= response.statusCode < 500:
+      return (f"Server error {response.statusCode}", None)
+
+   elif response.statusCode == 200:
+      try:
+         jdata = json.loads(response.body)
+      except (json.decoder.JSONDecodeError, UnicodeDecodeError):
+         print(f"JSON decode failed: '{response.body}'")
+         return ("JSON decode error", None)
+      if "data" not in jdata or "serverGameState" not in jdata["data"]:
+         return ("Missing data", None)
+      return ("Success", ServerState(jdata["data"]["serverGameState"]))
 
+   else:
+      print(f"Unsupported returned data from server: {response.statusCode} '{response.body}'")
+      return ("Server Failure", None)
+
+SAVE_HEADER_FIELDS = (
+   ("saveVersion", int),
+   ("buildVersion", int),
+   ("saveName", str),
+   ("mapName", str),
+   ("mapOptions", str),
+   ("sessionName", str),
+   ("playDurationSeconds", int),
+   ("saveDateTime", str),
+   ("isModdedSave", bool),
+   ("isEditedSave", bool),
+   ("isCreativeModeEnabled", bool),
+   )
+
+class SaveHeader(TypedRecord):
+   FIELDS = SAVE_HEADER_FIELDS
+   __slots__ = tuple(name for (name, fieldType) in SAVE_HEADER_FIELDS)
+
+class Session:
+   # One session from EnumerateSessions with the headers of its saves.
+   __slots__ = ("sessionName", "saveHeaders", "currentFlag")
+
+   def __init__(self, sessionName, saveHeaders, currentFlag):
+      self.sessionName = sessionName
+      self.saveHeaders = saveHeaders
+      self.currentFlag = currentFlag
+
+   def toDict(self):
+      return {"sessionName": self.sessionName, "current": self.currentFlag,
+              "saveHeaders": [saveHeader.toDict() for saveHeader in self.saveHeaders]}
+
+@keepsStatusCode
+def enumerateSessionsResult(errorStatus, response):
+   # Returns (enumerateStatus, sessions), sessions being a list of Session.
+   if errorStatus != None:
+      return (errorStatus, None)
+
+   if response.statusCode == 403:
+      return ("Server error: Forbidden", None)
+
+   elif 400 <= response.statusCode < 500:
+      return (f"Server error {response.statusCode}", None)
+
+   elif response.statusCode == 200:
       try:
-         ssock.send(package.encode())
-         break
-      except ssl.SSLEOFError:
-         print("Reconnecting because socket has closed")
-         sock = None
-         ssock = None
-         if returnFlag:
-            return ("Bad Sock", None)
-
-   ssock.settimeout(10)
-   summary = ""
+         jdata = json.loads(response.body)
+      except (json.decoder.JSONDecodeError, UnicodeDecodeError):
+         print(f"JSON decode failed: '{response.body}'")
+         return ("JSON decode error", None)
+      if "data" not in jdata or not isinstance(jdata["data"].get("sessions"), list):
+         return ("Missing data", None)
+      currentSessionIndex = jdata["data"].get("currentSessionIndex", -1)
+      sessions = []
+      for (index, session) in enumerate(jdata["data"]["sessions"]):
+         saveHeaders = [SaveHeader(saveHeader) for saveHeader in session.get("saveHeaders", []) if isinstance(saveHeader, dict)]
+         sessions.append(Session(session.get("sessionName"), saveHeaders, index == currentSessionIndex))
+      return ("Success", sessions)
 
-   try:
-      data = ssock.recv(2048)
+   else:
+      print(f"Unsupported returned data from server: {response.statusCode} '{response.body}'")
+      return ("Server Failure", None)
 
-      if data[:12] == b"HTTP/1.1 403":
-         return ("Server error: Forbidden", None)
+def setServerNamePackage(newName):
+   return encodeBody("RenameServer", {"serverName": newName})
 
-      elif data[:10] == b"HTTP/1.1 4":
-         return (f"Server error {data[9:12].decode()}", None)
+@keepsStatusCode
+def setServerNameResult(errorStatus, response):
+   if errorStatus != None:
+      return errorStatus
 
-      elif data[:12] == b"HTTP/1.1 200":
-         data = ssock.recv(2048)
-         try:
-            jdata = json.loads(data.decode())
-         except json.decoder.JSONDecodeError:
-            print(f"JSON decode failed: '{data}'")
-            return ("JSON decode error", None)
-         if "data" in jdata:
-            if "serverGameState" in jdata["data"]:
-               serverGameState = jdata["data"]["serverGameState"]
-               if "activeSessionName" in serverGameState:
-                  activeSessionName = serverGameState["activeSessionName"]
-                  summary += f"Active Session Name: {activeSessionName}\n"
-               if "numConnectedPlayers" in serverGameState:
-                  numConnectedPlayers = serverGameState["numConnectedPlayers"]
-                  summary += f"Number of Connected Players: {numConnectedPlayers}\n"
-               if "techTier" in serverGameState:
-                  techTier = serverGameState["techTier"]
-                  summary += f"Tech Tier: {techTier}\n"
-               if "activeSchematic" in serverGameState:
-                  activeSchematic = serverGameState["activeSchematic"]
-                  summary += f"Active Schematic: {activeSchematic}\n"
-               if "gamePhase" in serverGameState:
-                  gamePhase = serverGameState["gamePhase"]
-                  GAME_PHASE_NAMES = {
-                     "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_0.GP_Project_Assembly_Phase_0'": "Onboarding",
-                     "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_1.GP_Project_Assembly_Phase_1'": "Distribution Platform",
-                     "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_2.GP_Project_Assembly_Phase_2'": "Construction Dock",
-                     "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_3.GP_Project_Assembly_Phase_3'": "Main Body",
-                     "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_4.GP_Project_Assembly_Phase_4'": "Propulsion Systems",
-                     "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_5.GP_Project_Assembly_Phase_5'": "Assembly",
-                     "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_6.GP_Project_Assembly_Phase_6'": "Completing",
-                     "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_7.GP_Project_Assembly_Phase_7'": "Completed",
-                     }
-                  if gamePhase in GAME_PHASE_NAMES:
-                     gamePhase = GAME_PHASE_NAMES[gamePhase]
-                  summary += f"Game Phase: {gamePhase}\n"
-               if "isGameRunning" in serverGameState:
-                  isGameRunning = serverGameState["isGameRunning"]
-                  if isGameRunning:
-                     summary += f"Game Is Running\n"
-                  else:
-                     summary += f"Game Not Running\n"
-               if "totalGameDuration" in serverGameState:
-                  totalGameDuration = serverGameState["totalGameDuration"]
-                  summary += f"Total Game Duration: {totalGameDuration}\n"
-               if "isGamePaused" in serverGameState:
-                  isGamePaused = serverGameState["isGamePaused"]
-                  if isGamePaused:
-                     summary += f"Game Is Paused\n"
-                  else:
-                     summary += f"Game Not Paused\n"
-               if "averageTickRate" in serverGameState:
-                  averageTickRate = serverGameState["averageTickRate"]
-                  summary += f"Average Tick Rate: {averageTickRate}\n"
-               if "autoLoadSessionName" in serverGameState:
-                  autoLoadSessionName = serverGameState["autoLoadSessionName"]
-                  summary += f"Auto Load Session Name: {autoLoadSessionName}\n"
-               if len(summary) > 0:
-                  summary = summary[:-1]
-      return ("Success", summary)
-   except TimeoutError:
-      return ("Timed Out", None)
+   if response.statusCode == 403:
+      return "Server error: Forbidden"
 
+   elif 400 <= response.statusCode < 500:
+      return f"Server error {response.statusCode}"
 
-def setServerName(hostname, port, authorizationCode, newName):
+   elif response.statusCode == 204:
+      return "Success"
+   else:
+      print(f"Unsupported returned data from server: {response.statusCode} '{response.body}'")
+      return "Server Failure"
 
-   if not newName:
-      return "Please set name"
+# curl https://localhost:7777/api/v1 --insecure -v -H "Authorization: Bearer WXYZ" -H "Content-Type: multipart/form-data" -F data="{\"function\": \"UploadSaveGame\", \"data\": {\"saveName\": \"New Save Game\", \"loadSaveGame\": false, \"enableAdvancedGameSettings\": false}}";type=application/json -F saveGameFile=@upload.sav
+def uploadSavePackages(hostname, authorizationCode, filepath, fileSize, saveName, loadCheckFlag, advancedCheckFlag):
+   # Returns the request header, the multipart preamble that goes before the
+   # file contents and the multipart trailer that goes after them.
+   boundary = random.choices(string.ascii_letters, k=22)
+   boundary = "------------------------" + ''.join(boundary)
 
-   package = f'POST /api/v1 HTTP/1.1\r\nHost: {hostname}\r\nUser-Agent: {USER_AGENT}\r\nAccept: */*\r\nAuthorization: Bearer {authorizationCode}\r\nContent-Type: application/json\r\nContent-Length: {57+len(newName)}\r\n\r\n' + '{"function": "RenameServer", "data":{ "serverName": "' + newName + '" }}'
+   # The filename is a quoted string in the part header.
+   filename = os.path.basename(filepath)
+   filename = filename.replace("\\", "\\\\").replace('"', '\\"').replace("\r", " ").replace("\n", " ")
+   data = encodeBody("UploadSaveGame", {"saveName": saveName, "loadSaveGame": bool(loadCheckFlag), "enableAdvancedGameSettings": bool(advancedCheckFlag)})
 
-   global sock
-   global ssock
-   for returnFlag in (False, True):
-      if not connect(hostname, port):
-         return ("Connection Failed", None)
+   package2 = b"".join((
+      f'--{boundary}\r\nContent-Disposition: form-data; name="data"\r\nContent-Type: application/json\r\n\r\n'.encode(),
+      data,
+      f'\r\n--{boundary}\r\nContent-Disposition: form-data; name="saveGameFile"; filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode()))
+   package3 = f'\r\n--{boundary}--\r\n'.encode()
 
-      try:
-         ssock.send(package.encode())
-         break
-      except ssl.SSLEOFError:
-         print("Reconnecting because socket has closed")
-         sock = None
-         ssock = None
-         if returnFlag:
-            return ("Bad Sock", None)
+   contentLength = len(package2) + len(package3) + fileSize
+   package1 = requestPrefix(hostname, authorizationCode) + f'Content-Length: {contentLength}\r\nContent-Type: multipart/form-data; boundary={boundary}\r\nExpect: 100-continue\r\n\r\n'.encode()
+   return (package1, package2, package3)
 
-   ssock.settimeout(10)
+@keepsStatusCode
+def uploadSaveResult(response):
+   if response.statusCode == 202: # Uploaded and Loading
+      return "Success"
+   elif response.statusCode == 201: # Uploaded only
+      return "Success"
+   # 204 is considered a success on the server.
+   # 204 is being considered an error here because it likely means
+   # the save by the specified name already exists on the server
+   # and WAS NOT replaced by the upload file.
+   elif response.statusCode == 204:
+      return "Save Already Exists"
+   else:
+      print(f"Unsupported returned data from server: {response.statusCode} '{response.body}'")
+      return f"Upload Failure {response.statusCode}"
 
-   try:
-      data = ssock.recv(2048)
+def downloadSavePackage(saveName):
+   return encodeBody("DownloadSaveGame", {"saveName": saveName})
 
-      if data[:12] == b"HTTP/1.1 403":
-         return "Server error: Forbidden"
+@keepsStatusCode
+def downloadSaveResult(errorStatus, response):
+   if errorStatus != None:
+      return errorStatus
 
-      elif data[:10] == b"HTTP/1.1 4":
-         return f"Server error {data[9:12].decode()}"
+   if response.statusCode == 200:
+      return "Success"
 
-      elif data[:12] == b"HTTP/1.1 204":
-         return "Success"
-      else:
-         print(f"Unsupported returned data from server: '{data}'")
-         return "Server Failure"
-   except TimeoutError:
-      return "Timed Out"
+   if 400 <= response.statusCode < 600:
+      try:
+         data = json.loads(response.body)
+         if "errorCode" in data:
+            if "errorMessage" in data:
+               return f"{data['errorCode']}: {data['errorMessage']}"
+            return data["errorCode"]
+      except (json.decoder.JSONDecodeError, UnicodeDecodeError, TypeError):
+         pass
+      return f"Server error {response.statusCode}"
 
-# curl https://localhost:7777/api/v1 --insecure -v -H "Authorization: Bearer WXYZ" -H "Content-Type: multipart/form-data" -F data="{\"function\": \"UploadSaveGame\", \"data\": {\"saveName\": \"New Save Game\", \"loadSaveGame\": false, \"enableAdvancedGameSettings\": false}}";type=application/json -F saveGameFile=@upload.sav
-def uploadSave(hostname, port, authorizationCode, filepath, saveName, loadCheckFlag, advancedCheckFlag):
+   print(f"Unsupported returned data from server: {response.statusCode} '{response.body}'")
+   return "Server Failure"
 
-   if not os.path.exists(filepath):
-      return "No File"
+@keepsStatusCode
+def shutdownResult(errorStatus, response):
+   if errorStatus != None:
+      return errorStatus
 
-   fileStats = os.stat(filepath)
-   fileSize = fileStats.st_size
+   if response.statusCode == 401:
+      return "Auth Failure"
 
-   fin = open(filepath, "rb")
-   if not fin:
-      return "Open Error"
+   if 400 <= response.statusCode < 500:
+      return f"Server error {response.statusCode}"
 
-   boundary = random.choices(string.ascii_letters, k=22)
-   boundary = "------------------------" + ''.join(boundary)
+   if response.statusCode == 204:
+      return "Success"
 
-   filename = os.path.basename(filepath)
-   loadCheckFlag = str(loadCheckFlag).lower()
-   advancedCheckFlag = str(advancedCheckFlag).lower()
+   print(f"Unsupported returned data from server: {response.statusCode} '{response.body}'")
+   return "Server Failure"
 
-   package2 = f'--{boundary}\r\nContent-Disposition: form-data; name="data"\r\nContent-Type: application/json\r\n\r\n' + '{"function": "UploadSaveGame", "data": {' + f'"saveName": "{saveName}", "loadSaveGame": {loadCheckFlag}, "enableAdvancedGameSettings": {advancedCheckFlag}' + '}}\r\n' + f'--{boundary}\r\nContent-Disposition: form-data; name="saveGameFile"; filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'
-   package3 = f'\r\n--{boundary}--\r\n'.encode()
+class TransferAborted(Exception):
+   pass
+
+class TransferProgress:
+   __slots__ = ("bytesTransferred", "totalBytes", "elapsed", "instantRate", "averageRate", "eta")
+
+   def __init__(self, bytesTransferred, totalBytes, elapsed, instantRate, averageRate, eta):
+      self.bytesTransferred = bytesTransferred
+      self.totalBytes = totalBytes
+      self.elapsed = elapsed          # Seconds
+      self.instantRate = instantRate  # Bytes per second since the previous report
+      self.averageRate = averageRate  # Bytes per second since the start
+      self.eta = eta                  # Seconds remaining at the average rate, or None
+
+def formatTransferProgress(progress):
+   percent = 100 * progress.bytesTransferred // max(1, progress.totalBytes)
+   text = f"{percent}% {progress.instantRate / 1e6:.1f} MB/s"
+   if progress.eta != None:
+      text += f" ETA {int(progress.eta) // 60}:{int(progress.eta) % 60:02}"
+   return text
+
+class ProgressTracker:
+   # Turns a stream of byte counts into TransferProgress reports, at most one
+   # per interval plus one at the end.  If the callback returns False the
+   # transfer is aborted with TransferAborted.
+   def __init__(self, totalBytes, callback, interval=PROGRESS_INTERVAL):
+      self.totalBytes = totalBytes
+      self.callback = callback
+      self.interval = interval
+      self.bytesTransferred = 0
+      self.startTime = time.monotonic()
+      self.lastTime = self.startTime
+      self.lastBytes = 0
+
+   def update(self, byteCount):
+      self.bytesTransferred += byteCount
+      now = time.monotonic()
+      if now - self.lastTime < self.interval and self.bytesTransferred < self.totalBytes:
+         return
+      elapsed = now - self.startTime
+      instantRate = (self.bytesTransferred - self.lastBytes) / max(now - self.lastTime, 1e-6)
+      averageRate = self.bytesTransferred / max(elapsed, 1e-6)
+      eta = None
+      if averageRate > 0:
+         eta = (self.totalBytes - self.bytesTransferred) / averageRate
+      (self.lastTime, self.lastBytes) = (now, self.bytesTransferred)
+      if self.callback(TransferProgress(self.bytesTransferred, self.totalBytes, elapsed, instantRate, averageRate, eta)) == False:
+         raise TransferAborted()
+
+def sendFile(sendall, fin, fileSize, chunkSize=UPLOAD_CHUNK_SIZE, progress=None, hasher=None, bandwidthLimit=None):
+   # Sends the file out of an mmap in large memoryview slices, so nothing is
+   # copied or read() chunk by chunk.  sendall() takes care of partial writes.
+   # If a hasher is given it sees every chunk sent.  With a bandwidthLimit
+   # the chunks are cut down to its burst and wait for its tokens.
+   if fileSize == 0:
+      return
+   mapped = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+   if len(mapped) < fileSize:
+      mapped.close()
+      raise EOFError("File shrank during upload")
+   view = memoryview(mapped)
+   offset = 0
+   while offset < fileSize:
+      size = chunkSize if bandwidthLimit == None else bandwidthLimit.pieceSize(chunkSize)
+      end = min(fileSize, offset + size)
+      if bandwidthLimit != None:
+         bandwidthLimit.wait(end - offset)
+      sendall(view[offset:end])
+      if hasher != None:
+         hasher.update(view[offset:end])
+      if progress != None:
+         progress.update(end - offset)
+      offset = end
+   # If sendall() raises, its traceback still holds the chunk, so the mapping
+   # can't be closed then and is freed along with the traceback instead.
+   view.release()
+   mapped.close()
+
+def hashFile(filepath, chunkSize=UPLOAD_CHUNK_SIZE):
+   sha256 = hashlib.sha256()
+   buffer = bytearray(chunkSize)
+   view = memoryview(buffer)
+   with open(filepath, "rb") as fin:
+      while True:
+         count = fin.readinto(buffer)
+         if not count:
+            break
+         sha256.update(view[:count])
+   return sha256.hexdigest()
+
+class UploadIndex:
+   # Remembers the content hash of what was last uploaded successfully to each
+   # (server, saveName), so pushing the same save again can be skipped.  File
+   # hashes are cached by size and mtime, so checking an unchanged save does
+   # not read it again.  The index is kept in a JSON file.
+   def __init__(self, filename=UPLOAD_INDEX_FILENAME):
+      self.filename = filename
+      self.lock = threading.Lock()
+      self.hashes = {}   # Absolute file path to [size, mtime_ns, sha256]
+      self.uploads = {}  # "host:port/saveName" to [size, mtime_ns, sha256]
+      try:
+         with open(filename, "r") as fin:
+            jdata = json.load(fin)
+         self.hashes = jdata.get("Hashes", {})
+         self.uploads = jdata.get("Uploads", {})
+      except (OSError, ValueError, AttributeError):
+         pass
+
+   def save(self):
+      with self.lock:
+         jdata = {"Hashes": dict(self.hashes), "Uploads": dict(self.uploads)}
+      tempPath = f"{self.filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+      with open(tempPath, "w") as fout:
+         json.dump(jdata, fout)
+      os.replace(tempPath, self.filename)
+
+   def fileHash(self, filepath, fileStats=None, contents=None):
+      # contents, if given, is the file already in memory or mapped, and is
+      # hashed instead of reading the file again.
+      if fileStats == None:
+         fileStats = os.stat(filepath)
+      key = os.path.abspath(filepath)
+      with self.lock:
+         entry = self.hashes.get(key)
+      if entry != None and entry[0] == fileStats.st_size and entry[1] == fileStats.st_mtime_ns:
+         return entry[2]
+      sha256 = hashFile(filepath) if contents == None else hashlib.sha256(contents).hexdigest()
+      with self.lock:
+         self.hashes[key] = [fileStats.st_size, fileStats.st_mtime_ns, sha256]
+      self.save()
+      return sha256
+
+   def unchanged(self, hostname, port, saveName, filepath):
+      with self.lock:
+         entry = self.uploads.get(f"{hostname}:{port}/{saveName}")
+      if entry == None:
+         return False
+      try:
+         fileStats = os.stat(filepath)
+      except OSError:
+         return False
+      if entry[0] != fileStats.st_size:
+         return False
+      return self.fileHash(filepath, fileStats) == entry[2]
+
+   def record(self, hostname, port, saveName, filepath, fileStats, sha256):
+      with self.lock:
+         self.hashes[os.path.abspath(filepath)] = [fileStats.st_size, fileStats.st_mtime_ns, sha256]
+         self.uploads[f"{hostname}:{port}/{saveName}"] = [fileStats.st_size, fileStats.st_mtime_ns, sha256]
+      self.save()
+
+   def forget(self, hostname, port, saveName):
+      with self.lock:
+         self.uploads.pop(f"{hostname}:{port}/{saveName}", None)
+      self.save()
+
+class DownloadSink:
+   # Body sink for DownloadSaveGame.  Writes the save to a temporary file next
+   # to its destination and hashes it on the way, so memory use does not
+   # depend on the size of the save.  commit() renames the temporary file
+   # into place; discard() removes it.
+   def __init__(self, filepath, progressCallback=None):
+      self.filepath = filepath
+      (fd, self.tempPath) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filepath)), prefix=".", suffix=".part")
+      self.fout = os.fdopen(fd, "wb")
+      self.hash = hashlib.sha256()
+      self.progressCallback = progressCallback
+      self.progress = None
+      self.writeError = None
+
+   def __call__(self, response, data):
+      if self.progress == None and self.progressCallback != None:
+         self.progress = ProgressTracker(int(response.headers.get("content-length", 0)), self.progressCallback)
+      try:
+         self.fout.write(data)
+      except OSError as error:
+         self.writeError = error
+         raise TransferAborted()
+      self.hash.update(data)
+      if self.progress != None:
+         self.progress.update(len(data))
+
+   def reset(self):
+      # Starts over when the download is retried.
+      self.fout.seek(0)
+      self.fout.truncate()
+      self.hash = hashlib.sha256()
+      self.progress = None
+
+   def commit(self):
+      self.fout.flush()
+      os.fsync(self.fout.fileno())
+      self.fout.close()
+      os.replace(self.tempPath, self.filepath)
+      return self.hash.hexdigest()
+
+   def discard(self):
+      self.fout.close()
+      try:
+         os.remove(self.tempPath)
+      except OSError:
+         pass
+
+class TokenCache:
+   # Authentication tokens keyed by (host, port, privilege level), with the
+   # time each was last verified.  A token is only verified again once it is
+   # older than ttl seconds, or after the caller reports that it was rejected.
+   # The cache is kept in a JSON file so tokens survive restarts.
+   def __init__(self, filename=TOKEN_CACHE_FILENAME, ttl=TOKEN_VERIFY_TTL):
+      self.filename = filename
+      self.ttl = ttl
+      self.lock = threading.Lock()
+      self.entries = {}  # "host:port/level" to [token, verified time]
+      try:
+         with open(filename, "r") as fin:
+            self.entries = json.load(fin)
+      except (OSError, ValueError):
+         pass
+
+   def key(self, hostname, port, adminFlag):
+      return f"{hostname}:{port}/" + ("Administrator" if adminFlag else "Client")
+
+   def save(self):
+      with self.lock:
+         entries = dict(self.entries)
+      tempPath = f"{self.filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+      # The tokens are as good as passwords, so only the user may read them.
+      fd = os.open(tempPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+      with os.fdopen(fd, "w") as fout:
+         json.dump(entries, fout)
+      os.replace(tempPath, self.filename)
+
+   def lookup(self, hostname, port, adminFlag):
+      # Returns (token, freshFlag), or (None, False).
+      with self.lock:
+         entry = self.entries.get(self.key(hostname, port, adminFlag))
+      if entry == None:
+         return (None, False)
+      return (entry[0], time.time() - entry[1] < self.ttl)
+
+   def store(self, hostname, port, adminFlag, token, verifiedFlag=True):
+      key = self.key(hostname, port, adminFlag)
+      with self.lock:
+         entry = self.entries.get(key)
+         if not verifiedFlag and entry != None and entry[0] == token:
+            return  # Keep the existing verification time
+         self.entries[key] = [token, time.time() if verifiedFlag else 0]
+      self.save()
+
+   def invalidate(self, hostname, port, adminFlag):
+      with self.lock:
+         if self.entries.pop(self.key(hostname, port, adminFlag), None) == None:
+            return
+      self.save()
+
+class SessionCatalog:
+   # The sessions and saves on one server, listed with EnumerateSessions once
+   # and then answered from memory.  The listing can be large on a long-lived
+   # server, so it is only fetched again once it is stale: after an upload
+   # through the same client, or when a server state from that client shows
+   # a different active session than the listing did.  Saves the server
+   # makes by itself, such as autosaves, only show up after one of those or
+   # a refresh(forceFlag=True).  Listing needs an Administrator token, so
+   # answers only come from memory for tokens the server has accepted for
+   # it; any other token is checked by listing again.
+   def __init__(self, client):
+      self.client = client
+      self.lock = threading.Lock()
+      self.sessions = None
+      self.saves = {}  # saveName to SaveHeader
+      self.activeSessionName = None
+      self.staleFlag = True
+      self.acceptedTokens = set()
+
+   def invalidate(self):
+      self.staleFlag = True
+      self.acceptedTokens = set()
+
+   def observeServerState(self, serverState):
+      # A session with no saves yet isn't listed, so the active session can be
+      # unknown after a refresh.  Then the first state seen is taken as it.
+      if self.sessions == None:
+         return
+      if self.activeSessionName == None:
+         self.activeSessionName = serverState.activeSessionName
+      elif serverState.activeSessionName != self.activeSessionName:
+         self.staleFlag = True
+
+   def refresh(self, authorizationCode, forceFlag=False):
+      # Returns the status of the listing, or "Success" when the one in memory
+      # is still current and authorizationCode has been accepted for it.  A
+      # failed listing keeps the previous one.  Threads arriving during a
+      # listing wait for it rather than make their own.
+      with self.lock:
+         if not self.staleFlag and not forceFlag and authorizationCode in self.acceptedTokens:
+            return "Success"
+         staleFlag = self.staleFlag
+         self.staleFlag = False
+         (enumerateStatus, sessions) = self.client.enumerateSessions(authorizationCode, catalogFlag=False)
+         if sessions == None:
+            if staleFlag:
+               self.staleFlag = True
+            return enumerateStatus
+         self.acceptedTokens.add(authorizationCode)
+         self.sessions = sessions
+         self.saves = {saveHeader.saveName: saveHeader for session in sessions for saveHeader in session.saveHeaders}
+         self.activeSessionName = next((session.sessionName for session in sessions if session.currentFlag), None)
+         return enumerateStatus
+
+   def listSessions(self, authorizationCode):
+      # Returns (status, sessions).
+      status = self.refresh(authorizationCode)
+      if status != "Success":
+         return (status, None)
+      return (status, self.sessions)
+
+   def findSave(self, authorizationCode, saveName):
+      # Returns (status, saveHeader), saveHeader None if there is no such save.
+      status = self.refresh(authorizationCode)
+      if status != "Success":
+         return (status, None)
+      return (status, self.saves.get(saveName))
+
+   def saveExists(self, authorizationCode, saveName):
+      # Returns (status, existsFlag).
+      (status, saveHeader) = self.findSave(authorizationCode, saveName)
+      return (status, saveHeader != None)
+
+class ServerClient:
+   # One client per server.  The client has a bounded pool of keep-alive
+   # connections so several threads can talk to the same server, and one
+   # process can talk to many servers, without sharing a single TLS stream.
+   # New connections resume the most recent TLS session where the server
+   # allows it; handshakeStats shows how often that works.  Timeouts and
+   # retries follow policy, by default the shared defaultPolicy.
+   def __init__(self, hostname, port, poolSize=DEFAULT_POOL_SIZE, policy=None):
+      self.hostname = hostname
+      self.port = int(port)
+      self.poolSize = poolSize
+      self.policy = policy if policy != None else defaultPolicy
+      self.context = getContext(hostname)
+      self.session = None
+      self.handshakeStats = HandshakeStats()
+      self.idleConnections = []
+      self.lock = threading.Lock()
+      self.slots = threading.BoundedSemaphore(poolSize)
+      self.pinned = threading.local()
+      self.sessionCatalog = SessionCatalog(self)
+
+   def connect(self, deadline=None):
+      # Resolving and connecting are done separately from each other, rather
+      # than with socket.create_connection(), so that each can be timed.
+      # The resolver has no timeout of its own.  Returns None if the server
+      # can't be reached, and raises TimeoutError if connectTimeout or the
+      # deadline ran out first.
+      start = time.perf_counter()
+      timeout = remainingTime(deadline, self.policy.connectTimeout)
+      try:
+         addresses = socket.getaddrinfo(self.hostname, self.port, type=socket.SOCK_STREAM)
+      except OSError:  # Unknown host
+         return None
+      resolved = time.perf_counter()
+      sock = None
+      timedOutFlag = False
+      for (family, socketType, protocol, _, address) in addresses:
+         try:
+            sock = socket.socket(family, socketType, protocol)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(timeout)  # Also covers the handshake
+            sock.connect(address)
+            break
+         except OSError as error:  # ConnectionRefusedError, unreachable, timed out
+            timedOutFlag = timedOutFlag or isinstance(error, (TimeoutError, socket.timeout))
+            if sock != None:
+               sock.close()
+               sock = None
+      if sock == None:
+         if timedOutFlag:
+            raise TimeoutError("Connect timed out")
+         return None
+      connected = time.perf_counter()
+      try:
+         ssock = self.context.wrap_socket(sock, server_hostname=self.hostname, session=self.session)
+      except (TimeoutError, socket.timeout):
+         sock.close()
+         raise
+      except (ssl.SSLError, OSError):
+         sock.close()
+         return None
+      handshaken = time.perf_counter()
+      with self.lock:
+         self.handshakeStats.record(handshaken - start, ssock.session_reused)
+      connection = ServerConnection(ssock)
+      connection.setupTimes = (resolved - start, connected - resolved, handshaken - connected)
+      return connection
+
+   def keepSession(self, connection):
+      # TLS 1.3 servers send session tickets after the handshake, so the
+      # session is only worth keeping once a response has been read.
+      session = connection.ssock.session
+      if session != None:
+         self.session = session
+
+   def acquire(self, reuseFlag=True, deadline=None):
+      # Blocks while poolSize connections are already checked out.  While
+      # the thread has pinned a connection, that one is handed out instead.
+      pinned = self.pinned.__dict__
+      if "connection" in pinned:
+         connection = pinned["connection"]
+         if connection != None:
+            if reuseFlag and connection.reusable() and not connection.peerClosed():
+               return connection
+            pinned["connection"] = None
+            self.release(connection, False)
+         pinned["connection"] = self.acquirePooled(reuseFlag, deadline)
+         return pinned["connection"]
+      return self.acquirePooled(reuseFlag, deadline)
+
+   def acquirePooled(self, reuseFlag, deadline=None):
+      # Returns None if no connection could be made, and raises TimeoutError
+      # if the deadline passed waiting for one.
+      if not self.slots.acquire(timeout=remainingTime(deadline, None)):
+         raise TimeoutError("Deadline passed")
+      if reuseFlag:
+         with self.lock:
+            while len(self.idleConnections) > 0:
+               connection = self.idleConnections.pop()
+               if connection.reusable() and not connection.peerClosed():
+                  return connection
+               connection.close()
+      try:
+         connection = self.connect(deadline)
+      except BaseException:
+         self.slots.release()
+         raise
+      if connection == None:
+         self.slots.release()
+      return connection
+
+   def release(self, connection, reuseFlag=True):
+      pinned = self.pinned.__dict__
+      if pinned.get("connection") is connection:
+         if reuseFlag and connection.reusable():
+            return
+         pinned["connection"] = None
+      if connection.usedFlag:
+         self.keepSession(connection)
+      if reuseFlag and connection.reusable():
+         with self.lock:
+            if len(self.idleConnections) < self.poolSize:
+               self.idleConnections.append(connection)
+               connection = None
+      if connection != None:
+         connection.close()
+      self.slots.release()
+
+   def close(self):
+      with self.lock:
+         (idleConnections, self.idleConnections) = (self.idleConnections, [])
+      for connection in idleConnections:
+         connection.close()
+
+   @contextlib.contextmanager
+   def pinnedConnection(self):
+      # Within this block every call made by this thread uses one connection,
+      # which goes back to the pool at the end.  A replacement is opened if
+      # the server closes it in between.
+      pinned = self.pinned.__dict__
+      pinned["connection"] = None
+      try:
+         yield
+      finally:
+         connection = pinned.pop("connection")
+         if connection != None:
+            self.release(connection)
+
+   def batch(self, authorizationCode, calls, stopOnError=False):
+      # Runs calls back-to-back over one kept-alive connection and returns
+      # their results in order.  Each call is a tuple of a method name from
+      # BATCH_FUNCTIONS and its arguments after authorizationCode, such as
+      # ("setServerName", "New Name").  A failed call doesn't stop the rest
+      # unless stopOnError is set.
+      results = []
+      with self.pinnedConnection():
+         for call in calls:
+            if call[0] not in BATCH_FUNCTIONS:
+               result = "Unknown function"
+            else:
+               result = getattr(self, call[0])(authorizationCode, *call[1:])
+            results.append(result)
+            if stopOnError and resultStatus(result) not in SUCCESS_STATUSES:
+               break
+      return results
+
+   def exchange(self, package, bodySink=None, function=None):
+      # Returns (errorStatus, response).  function names the call for the
+      # retry policy and instrumentation listeners.  A bodySink used with a
+      # retried function needs a reset() to start over.
+      timing = RequestTiming(function, self.hostname, self.port)
+      attempts = 0
+      bandwidthLimit = self.policy.downloadBandwidth if function == "downloadSave" else None
+
+      def attempt(connection, deadline):
+         nonlocal attempts
+         if attempts > 0 and bodySink != None:
+            bodySink.reset()
+         attempts += 1
+         connection.ssock.settimeout(remainingTime(deadline, self.policy.readTimeout))
+         writeStart = time.perf_counter()
+         connection.ssock.sendall(package)
+         timing.wrote(writeStart, len(package))
+         return connection.readResponse(bodySink, deadline, bandwidthLimit)
 
-   contentLength = len(package2) + len(package3) + fileSize
-   package1 = f'POST /api/v1 HTTP/1.1\r\nHost: {hostname}\r\nUser-Agent: {USER_AGENT}\r\nAccept: */*\r\nAuthorization: Bearer {authorizationCode}\r\nContent-Length: {contentLength}\r\nContent-Type: multipart/form-data; boundary={boundary}\r\nExpect: 100-continue\r\n\r\n'.encode()
+      try:
+         (errorStatus, response) = self.perform(function, timing, attempt)
+      except BaseException as error:  # Such as TransferAborted from bodySink
+         timing.finish(type(error).__name__)
+         raise
+      timing.finish(errorStatus)
+      return (errorStatus, response)
+
+   def perform(self, function, timing, attempt, failureStatus="Bad Sock"):
+      # Calls attempt(connection, deadline), which sends one request and
+      # returns the response, until it succeeds or the policy gives up.
+      # Returns (errorStatus, response).  A pooled connection may have been
+      # closed by the server since it was last used, so if nothing at all
+      # came back on a reused connection the request is sent again at once
+      # on a fresh one.  A function outside IDEMPOTENT_FUNCTIONS is only sent
+      # again if the request couldn't be written in full, as otherwise the
+      # server may already have acted on it.
+      deadline = self.policy.deadline(function)
+      retries = 0
+      freshFlag = False
+      while True:
+         errorStatus = "Connection Failed"
+         try:
+            connection = self.acquire(not freshFlag, deadline)
+         except (TimeoutError, socket.timeout):
+            (errorStatus, connection) = ("Timed Out", None)
+         if connection != None:
+            timing.useConnection(connection)
+            connection.readTimeout = self.policy.readTimeout
+            reuseFlag = False
+            try:
+               response = attempt(connection, deadline)
+               timing.received(connection, response)
+               reuseFlag = True
+               return (None, response)
+            except (TimeoutError, socket.timeout):
+               errorStatus = "Timed Out"
+            except HttpProtocolError as error:
+               print(f"Unsupported returned data from server: {error}")
+               return ("Server Failure", None)
+            except (ssl.SSLError, OSError):  # Seen on ssock.send when server terminated prematurely.
+               errorStatus = failureStatus
+               if resendFlag(function, connection, freshFlag):
+                  freshFlag = True
+                  timing.reconnecting()
+                  continue
+            finally:
+               self.release(connection, reuseFlag)
+
+         delay = self.policy.retryDelay(function, retries, deadline)
+         if delay == None:
+            return (errorStatus, None)
+         retries += 1
+         freshFlag = True
+         timing.reconnecting()
+         time.sleep(delay)
+
+   def authenticate(self, adminFlag, password):
+      package = buildRequest(self.hostname, authenticatePackage(adminFlag, password))
+      return authenticateResult(*self.exchange(package, function="authenticate"))
+
+   def verifyAuthentication(self, authorizationCode):
+      package = buildRequest(self.hostname, VERIFY_AUTHENTICATION_BODY, authorizationCode)
+      return verifyAuthenticationResult(*self.exchange(package, function="verifyAuthentication"))
+
+   def getServerState(self, authorizationCode):
+      package = buildRequest(self.hostname, QUERY_SERVER_STATE_BODY, authorizationCode)
+      (getStatus, serverState) = getServerStateResult(*self.exchange(package, function="getServerState"))
+      if serverState != None:
+         self.sessionCatalog.observeServerState(serverState)
+      return (getStatus, serverState)
+
+   def enumerateSessions(self, authorizationCode, catalogFlag=True):
+      # Returns (enumerateStatus, sessions).  By default the answer comes
+      # from sessionCatalog, which only lists the sessions again once they
+      # may have changed.  Pass catalogFlag=False to always ask the server.
+      if catalogFlag:
+         return self.sessionCatalog.listSessions(authorizationCode)
+      package = buildRequest(self.hostname, ENUMERATE_SESSIONS_BODY, authorizationCode)
+      return enumerateSessionsResult(*self.exchange(package, function="enumerateSessions"))
+
+   def setServerName(self, authorizationCode, newName):
+      if not newName:
+         return "Please set name"
+      package = buildRequest(self.hostname, setServerNamePackage(newName), authorizationCode)
+      return setServerNameResult(*self.exchange(package, function="setServerName"))
+
+   def uploadSave(self, authorizationCode, filepath, saveName, loadCheckFlag, advancedCheckFlag, chunkSize=UPLOAD_CHUNK_SIZE, progressCallback=None, uploadIndex=None):
+      # progressCallback, if given, is called with a TransferProgress every
+      # PROGRESS_INTERVAL seconds and can return False to abort the upload.
+      # With an UploadIndex, a save identical to the last one successfully
+      # uploaded under this name is skipped and "Unchanged" is returned.
+
+      if not os.path.exists(filepath):
+         return "No File"
+
+      if uploadIndex != None and uploadIndex.unchanged(self.hostname, self.port, saveName, filepath):
+         return "Unchanged"
+
+      fileStats = os.stat(filepath)
+      fileSize = fileStats.st_size
 
-   global sock
-   global ssock
-   for returnFlag in (False, True):
-      if not connect(hostname, port):
-         return "Connection Failed"
+      try:
+         fin = open(filepath, "rb")
+      except OSError:
+         return "Open Error"
+
+      with fin:
+         (package1, package2, package3) = uploadSavePackages(self.hostname, authorizationCode, filepath, fileSize, saveName, loadCheckFlag, advancedCheckFlag)
+
+         hasher = None
+         timing = RequestTiming("uploadSave", self.hostname, self.port)
+
+         def attempt(connection, deadline):
+            nonlocal hasher
+            ssock = connection.ssock
+            ssock.settimeout(self.policy.readTimeout)
+            writeStart = time.perf_counter()
+            ssock.sendall(package1 + package2)
+
+            progress = None
+            if progressCallback != None:
+               progress = ProgressTracker(fileSize, progressCallback)
+            if uploadIndex != None:
+               hasher = hashlib.sha256()
+            sendFile(ssock.sendall, fin, fileSize, chunkSize, progress, hasher, self.policy.uploadBandwidth)
+            ssock.sendall(package3)
+            timing.wrote(writeStart, len(package1) + len(package2) + fileSize + len(package3))
+            return connection.readResponse()
 
+         try:
+            (uploadStatus, response) = self.perform("uploadSave", timing, attempt, "Termination Exception")
+         except (EOFError, ValueError):  # File shrank or could not be mapped
+            (uploadStatus, response) = ("Read Error", None)
+         except TransferAborted:
+            (uploadStatus, response) = ("Aborted", None)
+         timing.finish(uploadStatus)
+         if response != None:
+            uploadStatus = uploadSaveResult(response)
+            self.sessionCatalog.invalidate()  # The save may have been written even if the status is an error
+         if uploadIndex != None and uploadStatus == "Success":
+            uploadIndex.record(self.hostname, self.port, saveName, filepath, fileStats, hasher.hexdigest())
+         return uploadStatus
+
+   def downloadSave(self, authorizationCode, saveName, filepath, progressCallback=None):
+      # Returns (downloadStatus, sha256).  filepath is only replaced once the
+      # whole save has arrived.
       try:
-         ssock.send(package1)
-         break
-      except ssl.SSLEOFError:
-         print("Reconnecting because socket has closed")
-         sock = None
-         ssock = None
-         if returnFlag:
-            return "Bad Sock"
+         sink = DownloadSink(filepath, progressCallback)
+      except OSError:
+         return ("Open Error", None)
 
-   try:
-      ssock.send(package2.encode())
-
-      print(f"Sending file of size {fileSize} bytes")
-      while fileSize > 0:
-         data = fin.read(min(fileSize, 16384))
-         fileSize -= len(data)
-         if fileSize == 0:
-            data += package3[:20]
-            ssock.send(data)
-            ssock.send(package3[20:])
+      try:
+         package = buildRequest(self.hostname, downloadSavePackage(saveName), authorizationCode)
+         downloadStatus = downloadSaveResult(*self.exchange(package, sink, "downloadSave"))
+         if downloadStatus != "Success":
+            sink.discard()
+            return (downloadStatus, None)
+         return ("Success", sink.commit())
+      except TransferAborted:
+         sink.discard()
+         if sink.writeError != None:
+            return ("Write Error", None)
+         return ("Aborted", None)
+      except OSError:
+         sink.discard()
+         return ("Write Error", None)
+
+   def shutdown(self, authorizationCode):
+      package = buildRequest(self.hostname, SHUTDOWN_BODY, authorizationCode)
+      return shutdownResult(*self.exchange(package, function="shutdown"))
+
+   def cachedToken(self, adminFlag, tokenCache):
+      # Returns (authStatus, token).  The cached token is used as is when it
+      # was verified within the cache's TTL, and is verified otherwise.  The
+      # token is None if there is none or the server rejected it.
+      (token, freshFlag) = tokenCache.lookup(self.hostname, self.port, adminFlag)
+      if token == None or freshFlag:
+         return ("Success", token)
+      (authStatus, authFlag) = self.verifyAuthentication(token)
+      if authFlag:
+         tokenCache.store(self.hostname, self.port, adminFlag, token)
+         return ("Success", token)
+      if not isAuthFailure(authStatus) and not authStatus.startswith("Server error"):
+         return (authStatus, None)  # Couldn't reach the server, so keep the token
+      print("Authentication code rejected")
+      tokenCache.invalidate(self.hostname, self.port, adminFlag)
+      return ("Success", None)
+
+   def getToken(self, adminFlag, password, tokenCache):
+      # Returns (authStatus, token) like authenticate(), but only logs in when
+      # cachedToken() has no usable token.
+      (authStatus, token) = self.cachedToken(adminFlag, tokenCache)
+      if token != None or authStatus != "Success":
+         return (authStatus, token)
+
+      (authStatus, token) = self.authenticate(adminFlag, password)
+      if token != None:
+         tokenCache.store(self.hostname, self.port, adminFlag, token)
+      return (authStatus, token)
+
+async def withTimeout(awaitable, timeout):
+   # asyncio.wait_for() before Python 3.12 runs the awaitable as a new task,
+   # which is noticeable once per read of a large download.  asyncio.timeout()
+   # only schedules a timer.
+   import asyncio
+   if not hasattr(asyncio, "timeout"):
+      return await asyncio.wait_for(awaitable, timeout)
+   async with asyncio.timeout(timeout):
+      return await awaitable
+
+class AsyncServerConnection:
+   def __init__(self, reader, writer):
+      self.reader = reader
+      self.writer = writer
+      self.buffer = b""
+      self.expiry = None
+      self.usedFlag = False
+      self.sentFlag = False
+      self.receivedFlag = False
+      self.setupTimes = None
+      self.firstByteTime = None
+      self.bytesReceived = 0
+      self.readTimeout = RECV_TIMEOUT  # Seconds to wait on each read or drain
+
+   def reusable(self):
+      return self.expiry == None or time.monotonic() < self.expiry
+
+   def close(self):
+      self.writer.close()
+
+   def peerClosed(self):
+      # As ServerConnection.peerClosed().  The event loop has already read
+      # whatever the server sent while the connection was idle.
+      return len(self.buffer) > 0 or self.reader.at_eof() or self.writer.is_closing() or self.reader.exception() != None
+
+   async def sendall(self, data):
+      self.writer.write(data)
+      await withTimeout(self.writer.drain(), self.readTimeout)
+
+   async def readResponse(self, bodySink=None, bandwidthLimit=None):
+      parser = HttpResponseParser(bodySink)
+      self.sentFlag = True
+      self.receivedFlag = len(self.buffer) > 0
+      self.firstByteTime = time.perf_counter() if self.receivedFlag else None
+      self.bytesReceived = 0
+      doneFlag = self.receivedFlag and parser.feed(self.buffer)
+      while not doneFlag:
+         data = await withTimeout(self.reader.read(RECV_SIZE), self.readTimeout)
+         if bandwidthLimit != None:
+            await bandwidthLimit.waitAsync(len(data))
+         if not data:
+            if not self.receivedFlag:
+               raise ConnectionResetError("Connection closed before response")
+            self.expiry = 0
+            try:
+               doneFlag = parser.feedEof()
+            except HttpProtocolError as error:
+               raise ConnectionResetError(str(error))  # Truncated response
          else:
-            ssock.send(data)
-
-      data = ssock.recv(2048)
-      if data[:12] == b"HTTP/1.1 202": # Uploaded and Loading
-         return "Success"
-      elif data[:12] == b"HTTP/1.1 201": # Uploaded only
-         return "Success"
-      # 204 is considered a success on the server.
-      # 204 is being considered an error here because it likely means
-      # the save by the specified name already exists on the server
-      # and WAS NOT replaced by the upload file.
-      elif data[:12] == b"HTTP/1.1 204":
-         return "Save Already Exists"
+            if not self.receivedFlag:
+               self.firstByteTime = time.perf_counter()
+               self.receivedFlag = True
+            self.bytesReceived += len(data)
+            doneFlag = parser.feed(data)
+      self.buffer = parser.leftover()
+      self.usedFlag = True
+      self.sentFlag = False
+      self.receivedFlag = False
+
+      response = parser.response
+      keepAliveTimeout = response.keepAliveTimeout()
+      if response.closeFlag() or parser.state == "untilClose":
+         self.expiry = 0
+      elif keepAliveTimeout != None and self.expiry != 0:
+         self.expiry = time.monotonic() + keepAliveTimeout - KEEP_ALIVE_MARGIN
+      return response
+
+class AsyncServerClient:
+   # asyncio counterpart of ServerClient.  Every method is a coroutine that
+   # returns exactly what the matching ServerClient method returns, and takes
+   # an optional per-call deadline in seconds which covers connecting,
+   # sending, receiving and retries.  Without one the policy's totalTimeout
+   # applies.  A client and its pooled connections belong to the event loop
+   # they were first used on.  asyncio has no way to offer a saved TLS
+   # session, so unlike ServerClient every new connection makes a full
+   # handshake; handshakeStats still records them.
+   def __init__(self, hostname, port, poolSize=DEFAULT_POOL_SIZE, policy=None):
+      self.hostname = hostname
+      self.port = int(port)
+      self.poolSize = poolSize
+      self.policy = policy if policy != None else defaultPolicy
+      self.context = getContext(hostname)
+      self.handshakeStats = HandshakeStats()
+      self.idleConnections = []
+      import asyncio
+      self.slots = asyncio.Semaphore(poolSize)
+
+   async def connect(self):
+      # As in ServerClient.connect(), the TCP connection is made separately
+      # so that resolving, connecting and the handshake can each be timed.
+      import asyncio
+      loop = asyncio.get_running_loop()
+      start = time.perf_counter()
+      try:
+         addresses = await loop.getaddrinfo(self.hostname, self.port, type=socket.SOCK_STREAM)
+      except OSError:
+         return None
+      resolved = time.perf_counter()
+      sock = None
+      for (family, socketType, protocol, _, address) in addresses:
+         try:
+            sock = socket.socket(family, socketType, protocol)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setblocking(False)
+            await loop.sock_connect(sock, address)
+            break
+         except OSError:
+            if sock != None:
+               sock.close()
+               sock = None
+         except BaseException:  # Including cancellation by the deadline
+            sock.close()
+            raise
+      if sock == None:
+         return None
+      connected = time.perf_counter()
+      try:
+         (reader, writer) = await asyncio.open_connection(sock=sock, ssl=self.context, server_hostname=self.hostname)
+      except (ssl.SSLError, OSError):
+         sock.close()
+         return None
+      except BaseException:
+         sock.close()
+         raise
+      handshaken = time.perf_counter()
+      sslObject = writer.get_extra_info("ssl_object")
+      self.handshakeStats.record(handshaken - start, sslObject != None and sslObject.session_reused)
+      connection = AsyncServerConnection(reader, writer)
+      connection.setupTimes = (resolved - start, connected - resolved, handshaken - connected)
+      return connection
+
+   async def acquire(self, reuseFlag=True):
+      # As ServerClient.acquirePooled(), raising asyncio.TimeoutError once
+      # connectTimeout has run out.
+      import asyncio
+      await self.slots.acquire()
+      try:
+         if reuseFlag:
+            while len(self.idleConnections) > 0:
+               connection = self.idleConnections.pop()
+               if connection.reusable() and not connection.peerClosed():
+                  return connection
+               connection.close()
+         connection = await asyncio.wait_for(self.connect(), self.policy.connectTimeout)
+      except BaseException:  # Including cancellation by the deadline
+         self.slots.release()
+         raise
+      if connection == None:
+         self.slots.release()
+      return connection
+
+   def release(self, connection, reuseFlag=True):
+      if reuseFlag and connection.reusable() and len(self.idleConnections) < self.poolSize:
+         self.idleConnections.append(connection)
       else:
-         print(f"Unsupported returned data from server: '{data}'")
-         return f"Upload Failure {data[9:12].decode()}"
-
-   except (ssl.SSLEOFError, ssl.SSLZeroReturnError):  # Seen on ssock.send when server terminated prematurely.
-      return "Termination Exception"
-   except TimeoutError:
-      return "Timed Out"
+         connection.close()
+      self.slots.release()
+
+   def close(self):
+      (idleConnections, self.idleConnections) = (self.idleConnections, [])
+      for connection in idleConnections:
+         connection.close()
+
+   async def perform(self, function, timing, attempt, timeout, failureStatus="Bad Sock"):
+      # Runs retry() within timeout seconds, or the policy's totalTimeout
+      # when timeout is None.  Returns (errorStatus, response).
+      import asyncio
+      if timeout == None:
+         deadline = self.policy.deadline(function)
+      else:
+         deadline = time.monotonic() + timeout
+      try:
+         remaining = remainingTime(deadline, None)
+      except TimeoutError:
+         return ("Timed Out", None)
+      try:
+         return await asyncio.wait_for(self.retry(function, timing, attempt, deadline, failureStatus), remaining)
+      except asyncio.TimeoutError:
+         return ("Timed Out", None)
+
+   async def retry(self, function, timing, attempt, deadline, failureStatus):
+      # As ServerClient.perform(), with attempt(connection) a coroutine.
+      import asyncio
+      retries = 0
+      freshFlag = False
+      while True:
+         errorStatus = "Connection Failed"
+         try:
+            connection = await self.acquire(not freshFlag)
+         except (asyncio.TimeoutError, TimeoutError):
+            (errorStatus, connection) = ("Timed Out", None)
+         if connection != None:
+            timing.useConnection(connection)
+            connection.readTimeout = self.policy.readTimeout
+            reuseFlag = False
+            try:
+               response = await attempt(connection)
+               timing.received(connection, response)
+               reuseFlag = True
+               return (None, response)
+            except (asyncio.TimeoutError, TimeoutError):
+               errorStatus = "Timed Out"
+            except HttpProtocolError as error:
+               print(f"Unsupported returned data from server: {error}")
+               return ("Server Failure", None)
+            except (ssl.SSLError, OSError):
+               errorStatus = failureStatus
+               if resendFlag(function, connection, freshFlag):
+                  freshFlag = True
+                  timing.reconnecting()
+                  continue
+            finally:
+               self.release(connection, reuseFlag)
+
+         delay = self.policy.retryDelay(function, retries, deadline)
+         if delay == None:
+            return (errorStatus, None)
+         retries += 1
+         freshFlag = True
+         timing.reconnecting()
+         await asyncio.sleep(delay)
+
+   async def timedExchange(self, package, timeout, function=None, bodySink=None):
+      timing = RequestTiming(function, self.hostname, self.port)
+      attempts = 0
+      bandwidthLimit = self.policy.downloadBandwidth if function == "downloadSave" else None
+
+      async def attempt(connection):
+         nonlocal attempts
+         if attempts > 0 and bodySink != None:
+            bodySink.reset()
+         attempts += 1
+         writeStart = time.perf_counter()
+         await connection.sendall(package)
+         timing.wrote(writeStart, len(package))
+         return await connection.readResponse(bodySink, bandwidthLimit)
 
-def shutdown(hostname, port, authorizationCode):
-   package = '{"function": "Shutdown"}'
-   package = f'POST /api/v1 HTTP/1.1\r\nHost: {hostname}\r\nUser-Agent: {USER_AGENT}\r\nAccept: */*\r\nAuthorization: Bearer {authorizationCode}\r\nContent-Type: application/json\r\nContent-Length: {len(package)}\r\n\r\n{package}'
+      try:
+         (errorStatus, response) = await self.perform(function, timing, attempt, timeout)
+      except BaseException as error:
+         timing.finish(type(error).__name__)
+         raise
+      timing.finish(errorStatus)
+      return (errorStatus, response)
+
+   async def authenticate(self, adminFlag, password, timeout=None):
+      package = buildRequest(self.hostname, authenticatePackage(adminFlag, password))
+      return authenticateResult(*await self.timedExchange(package, timeout, "authenticate"))
+
+   async def verifyAuthentication(self, authorizationCode, timeout=None):
+      package = buildRequest(self.hostname, VERIFY_AUTHENTICATION_BODY, authorizationCode)
+      return verifyAuthenticationResult(*await self.timedExchange(package, timeout, "verifyAuthentication"))
+
+   async def getServerState(self, authorizationCode, timeout=None):
+      package = buildRequest(self.hostname, QUERY_SERVER_STATE_BODY, authorizationCode)
+      return getServerStateResult(*await self.timedExchange(package, timeout, "getServerState"))
+
+   async def enumerateSessions(self, authorizationCode, timeout=None):
+      # Always asks the server; the SessionCatalog is only kept by ServerClient.
+      package = buildRequest(self.hostname, ENUMERATE_SESSIONS_BODY, authorizationCode)
+      return enumerateSessionsResult(*await self.timedExchange(package, timeout, "enumerateSessions"))
+
+   async def setServerName(self, authorizationCode, newName, timeout=None):
+      if not newName:
+         return "Please set name"
+      package = buildRequest(self.hostname, setServerNamePackage(newName), authorizationCode)
+      return setServerNameResult(*await self.timedExchange(package, timeout, "setServerName"))
+
+   async def uploadSave(self, authorizationCode, filepath, saveName, loadCheckFlag, advancedCheckFlag, timeout=None, chunkSize=UPLOAD_CHUNK_SIZE, progressCallback=None, uploadIndex=None, contents=None, sha256=None):
+      # Uploads have no deadline by default since their duration depends on
+      # the size of the save.  The policy's readTimeout still applies.
+      # contents, if given, is the save as bytes or a memoryview of a mapping
+      # of it, which is sent instead of reading filepath.  deployFleet()
+      # shares one mapping of the save between all of its uploads this way.
+      # sha256, if given, is the hash of the save recorded in uploadIndex,
+      # so the save isn't hashed again during the upload.
+
+      if not os.path.exists(filepath):
+         return "No File"
+
+      if uploadIndex != None and uploadIndex.unchanged(self.hostname, self.port, saveName, filepath):
+         return "Unchanged"
+
+      fileStats = os.stat(filepath)
+      fileSize = fileStats.st_size
+
+      if contents != None:
+         fileSize = len(contents)
+         fin = contextlib.nullcontext()
+      else:
+         try:
+            fin = open(filepath, "rb")
+         except OSError:
+            return "Open Error"
+
+      with fin:
+         (package1, package2, package3) = uploadSavePackages(self.hostname, authorizationCode, filepath, fileSize, saveName, loadCheckFlag, advancedCheckFlag)
+
+         hasher = None
+         timing = RequestTiming("uploadSave", self.hostname, self.port)
+
+         async def attempt(connection):
+            nonlocal hasher
+            writeStart = time.perf_counter()
+            await connection.sendall(package1 + package2)
+            progress = None
+            if progressCallback != None:
+               progress = ProgressTracker(fileSize, progressCallback)
+            if uploadIndex != None and sha256 == None:
+               hasher = hashlib.sha256()
+
+            async def sendChunks(source):
+               bandwidthLimit = self.policy.uploadBandwidth
+               offset = 0
+               while offset < fileSize:
+                  size = chunkSize if bandwidthLimit == None else bandwidthLimit.pieceSize(chunkSize)
+                  chunk = source[offset:offset + size]
+                  if bandwidthLimit != None:
+                     await bandwidthLimit.waitAsync(len(chunk))
+                  await connection.sendall(chunk)
+                  if hasher != None:
+                     hasher.update(chunk)
+                  if progress != None:
+                     progress.update(len(chunk))
+                  offset += len(chunk)
+
+            if fileSize > 0 and contents != None:
+               # Slices of a memoryview aren't copies.  The transport may
+               # keep them after drain() returns, which keeps the memory
+               # they refer to alive.
+               await sendChunks(memoryview(contents))
+            elif fileSize > 0:
+               # Slicing the mmap copies each chunk into bytes, which
+               # the transport may keep after drain() returns.
+               with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                  if len(mapped) < fileSize:
+                     raise EOFError("File shrank during upload")
+                  await sendChunks(mapped)
+            await connection.sendall(package3)
+            timing.wrote(writeStart, len(package1) + len(package2) + fileSize + len(package3))
+            return await connection.readResponse()
 
-   global sock
-   global ssock
-   for returnFlag in (False, True):
-      if not connect(hostname, port):
-         return "Connection Failed"
+         try:
+            (uploadStatus, response) = await self.perform("uploadSave", timing, attempt, timeout, "Termination Exception")
+         except (EOFError, ValueError):  # File shrank or could not be mapped
+            (uploadStatus, response) = ("Read Error", None)
+         except TransferAborted:
+            (uploadStatus, response) = ("Aborted", None)
+         timing.finish(uploadStatus)
+         if response != None:
+            uploadStatus = uploadSaveResult(response)
+         if uploadIndex != None and uploadStatus == "Success":
+            uploadIndex.record(self.hostname, self.port, saveName, filepath, fileStats, sha256 if sha256 != None else hasher.hexdigest())
+         return uploadStatus
+
+   async def downloadSave(self, authorizationCode, saveName, filepath, progressCallback=None, timeout=None):
+      try:
+         sink = DownloadSink(filepath, progressCallback)
+      except OSError:
+         return ("Open Error", None)
 
       try:
-         print("DEBUG: Verifying Authentication")
-         ssock.send(package.encode())
-         break
-      except ssl.SSLEOFError:
-         print("Reconnecting because socket has closed")
-         sock = None
-         ssock = None
-         if returnFlag:
-            return "Bad Sock"
-
-   ssock.settimeout(10)
+         package = buildRequest(self.hostname, downloadSavePackage(saveName), authorizationCode)
+         downloadStatus = downloadSaveResult(*await self.timedExchange(package, timeout, "downloadSave", sink))
+         if downloadStatus != "Success":
+            sink.discard()
+            return (downloadStatus, None)
+         return ("Success", sink.commit())
+      except TransferAborted:
+         sink.discard()
+         if sink.writeError != None:
+            return ("Write Error", None)
+         return ("Aborted", None)
+      except OSError:
+         sink.discard()
+         return ("Write Error", None)
+
+   async def shutdown(self, authorizationCode, timeout=None):
+      package = buildRequest(self.hostname, SHUTDOWN_BODY, authorizationCode)
+      return shutdownResult(*await self.timedExchange(package, timeout, "shutdown"))
+
+clients = {}
+clientsLock = threading.Lock()
+
+def getClient(hostname, port):
+   key = (hostname, int(port))
+   with clientsLock:
+      if key not in clients:
+         clients[key] = ServerClient(hostname, port)
+      return clients[key]
+
+def getHandshakeStats():
+   # Handshake statistics of the clients behind the module-level functions,
+   # keyed by "host:port".
+   with clientsLock:
+      return {f"{hostname}:{port}": client.handshakeStats.toDict() for ((hostname, port), client) in clients.items()}
 
-   try:
-      data = ssock.recv(2048)
-   except TimeoutError:
-      return "Timed Out"
+def authenticate(hostname, port, adminFlag, password):
+   return getClient(hostname, port).authenticate(adminFlag, password)
 
-   if data[:12] == b"HTTP/1.1 401":
-      return "Auth Failure"
+def verifyAuthentication(hostname, port, authorizationCode):
+   return getClient(hostname, port).verifyAuthentication(authorizationCode)
 
-   if data[:10] == b"HTTP/1.1 4":
-      return f"Server error {data[9:12].decode()}"
+def getServerState(hostname, port, authorizationCode):
+   return getClient(hostname, port).getServerState(authorizationCode)
 
-   if data[:12] == b"HTTP/1.1 204":
-      return "Success"
+def setServerName(hostname, port, authorizationCode, newName):
+   return getClient(hostname, port).setServerName(authorizationCode, newName)
 
-   print(f"Unsupported returned data from server: '{data}'")
-   return "Server Failure"
+def enumerateSessions(hostname, port, authorizationCode):
+   return getClient(hostname, port).enumerateSessions(authorizationCode)
+
+def saveExists(hostname, port, authorizationCode, saveName):
+   return getClient(hostname, port).sessionCatalog.saveExists(authorizationCode, saveName)
+
+def uploadSave(hostname, port, authorizationCode, filepath, saveName, loadCheckFlag, advancedCheckFlag, chunkSize=UPLOAD_CHUNK_SIZE, progressCallback=None, uploadIndex=None):
+   return getClient(hostname, port).uploadSave(authorizationCode, filepath, saveName, loadCheckFlag, advancedCheckFlag, chunkSize, progressCallback, uploadIndex)
+
+def downloadSave(hostname, port, authorizationCode, saveName, filepath, progressCallback=None):
+   return getClient(hostname, port).downloadSave(authorizationCode, saveName, filepath, progressCallback)
+
+def shutdown(hostname, port, authorizationCode):
+   return getClient(hostname, port).shutdown(authorizationCode)
+
+def batch(hostname, port, authorizationCode, calls, stopOnError=False):
+   return getClient(hostname, port).batch(authorizationCode, calls, stopOnError)
+
+def getToken(hostname, port, adminFlag, password, tokenCache):
+   return getClient(hostname, port).getToken(adminFlag, password, tokenCache)
+
+def inventoryEntry(entry):
+   # Inventory entries are either (host, port, token) sequences or objects
+   # using the same keys as the GUI's ServerConfig.json.
+   if isinstance(entry, dict):
+      return (entry["Host"], int(entry.get("Port", 7777)), entry.get("API Token"), entry.get("Password"))
+   (hostname, port, authorizationCode) = entry
+   return (hostname, int(port), authorizationCode, None)
+
+async def pollServerAsync(hostname, port, authorizationCode, password, timeout):
+   start = time.monotonic()
+   client = AsyncServerClient(hostname, port, poolSize=1)
+   serverState = None
+   try:
+      if not authorizationCode:
+         (status, authorizationCode) = await client.authenticate(False, password, timeout=timeout)
+      if authorizationCode:
+         remaining = max(0, timeout - (time.monotonic() - start))
+         (status, serverState) = await client.getServerState(authorizationCode, timeout=remaining)
+   finally:
+      client.close()
+   return {
+      "host": hostname,
+      "port": port,
+      "status": status,
+      "latency": round(time.monotonic() - start, 4),
+      "timedOut": status == "Timed Out",
+      "serverState": serverState.toDict() if serverState != None else None,
+      }
+
+async def pollFleetAsync(inventory, concurrency=DEFAULT_FLEET_CONCURRENCY, timeout=RECV_TIMEOUT):
+   # Queries every server in the inventory with at most concurrency calls in
+   # flight.  timeout bounds each server's authenticate plus query.
+   import asyncio
+   start = time.monotonic()
+   semaphore = asyncio.Semaphore(concurrency)
+
+   async def poll(entry):
+      async with semaphore:
+         return await pollServerAsync(*inventoryEntry(entry), timeout)
+
+   servers = await asyncio.gather(*(poll(entry) for entry in inventory))
+   return {
+      "servers": servers,
+      "total": len(servers),
+      "succeeded": sum(1 for server in servers if server["status"] == "Success"),
+      "failed": [f"{server['host']}:{server['port']}" for server in servers if server["status"] != "Success"],
+      "timedOut": [f"{server['host']}:{server['port']}" for server in servers if server["timedOut"]],
+      "elapsed": round(time.monotonic() - start, 4),
+      }
+
+def pollFleet(inventory, concurrency=DEFAULT_FLEET_CONCURRENCY, timeout=RECV_TIMEOUT):
+   import asyncio
+   return asyncio.run(pollFleetAsync(inventory, concurrency, timeout))
+
+async def deployServerAsync(hostname, port, authorizationCode, password, filepath, saveName, loadCheckFlag, advancedCheckFlag, contents, timeout, uploadIndex, sha256):
+   start = time.monotonic()
+   client = AsyncServerClient(hostname, port, poolSize=1)
+   uploadTime = None
+   try:
+      if not authorizationCode:
+         (status, authorizationCode) = await client.authenticate(True, password, timeout=timeout)
+      if authorizationCode:
+         uploadStart = time.monotonic()
+         remaining = None if timeout == None else max(0, timeout - (uploadStart - start))
+         status = await client.uploadSave(authorizationCode, filepath, saveName, loadCheckFlag, advancedCheckFlag, remaining, uploadIndex=uploadIndex, contents=contents, sha256=sha256)
+         uploadTime = time.monotonic() - uploadStart
+   finally:
+      client.close()
+   sentFlag = status == "Success" and uploadTime != None
+   return {
+      "host": hostname,
+      "port": port,
+      "status": status,
+      "elapsed": round(time.monotonic() - start, 4),
+      "bytes": len(contents) if sentFlag else 0,
+      "rate": round(len(contents) / max(uploadTime, 1e-6)) if sentFlag else None,  # Bytes per second
+      "timedOut": status == "Timed Out",
+      }
+
+async def deployFleetAsync(inventory, filepath, saveName, loadCheckFlag=False, advancedCheckFlag=False,
+                           concurrency=DEFAULT_DEPLOY_CONCURRENCY, hostConcurrency=DEFAULT_HOST_CONCURRENCY,
+                           timeout=None, uploadIndex=None):
+   # Uploads one save to every server in the inventory.  The save is mapped
+   # once, and that one mapping is sent to all servers, so it is read from
+   # disk once and memory use doesn't grow with the save.  With an
+   # uploadIndex it is hashed once too.  At most concurrency
+   # uploads are in flight at once, and at most hostConcurrency to servers
+   # on the same host, which usually share one uplink.  timeout bounds each
+   # server's login plus upload and is unlimited by default.  Servers given
+   # a password are logged into as Administrator.
+   import asyncio
+   start = time.monotonic()
+   with open(filepath, "rb") as fin:
+      fileStats = os.fstat(fin.fileno())
+      mapped = None
+      if fileStats.st_size > 0:
+         mapped = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+   contents = memoryview(mapped) if mapped != None else b""
+   sha256 = None
+   if uploadIndex != None:
+      sha256 = uploadIndex.fileHash(filepath, fileStats, contents)
+   semaphore = asyncio.Semaphore(concurrency)
+   hostSemaphores = {}
+
+   async def deploy(entry):
+      (hostname, port, authorizationCode, password) = inventoryEntry(entry)
+      # Waiting for the host before taking a global slot keeps servers on a
+      # busy host from holding slots that other hosts could use.
+      hostSemaphore = hostSemaphores.setdefault(hostname, asyncio.Semaphore(hostConcurrency))
+      async with hostSemaphore, semaphore:
+         return await deployServerAsync(hostname, port, authorizationCode, password, filepath, saveName,
+                                        loadCheckFlag, advancedCheckFlag, contents, timeout, uploadIndex, sha256)
+
+   try:
+      servers = await asyncio.gather(*(deploy(entry) for entry in inventory))
+   finally:
+      # A transport may still hold slices of the mapping, in which case it
+      # can't be closed yet and is freed along with the last of them.
+      if mapped != None:
+         try:
+            contents.release()
+            mapped.close()
+         except BufferError:
+            pass
+   elapsed = time.monotonic() - start
+   return {
+      "servers": servers,
+      "total": len(servers),
+      "succeeded": sum(1 for server in servers if server["status"] in SUCCESS_STATUSES),
+      "failed": [f"{server['host']}:{server['port']}" for server in servers if server["status"] not in SUCCESS_STATUSES],
+      "timedOut": [f"{server['host']}:{server['port']}" for server in servers if server["timedOut"]],
+      "bytes": sum(server["bytes"] for server in servers),
+      "elapsed": round(elapsed, 4),
+      "rate": round(sum(server["bytes"] for server in servers) / max(elapsed, 1e-6)),  # Bytes per second, all servers together
+      }
+
+def deployFleet(inventory, filepath, saveName, loadCheckFlag=False, advancedCheckFlag=False,
+                concurrency=DEFAULT_DEPLOY_CONCURRENCY, hostConcurrency=DEFAULT_HOST_CONCURRENCY,
+                timeout=None, uploadIndex=None):
+   import asyncio
+   return asyncio.run(deployFleetAsync(inventory, filepath, saveName, loadCheckFlag, advancedCheckFlag,
+                                       concurrency, hostConcurrency, timeout, uploadIndex))
@@ -0,0 +1,274 @@
+# This file is part of the SDSRM distribution (https://github.com/GreyHak/sdsrm).
+# Copyright (c) 2024 GreyHak (github.com/GreyHak).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import asyncio
+import bisect
+import json
+import math
+import os
+import struct
+import time
+import sdsrm_lib
+from sdsrm_fleet import loadInventory
+
+DEFAULT_INTERVAL = 5.0  # Seconds between samples
+DEFAULT_BUCKET = 3600  # Seconds per bucket in query results
+DEFAULT_QUERY_RANGE = 86400  # Seconds back from now that query covers by default
+METRICS_SUFFIX = ".metrics"
+READ_RECORDS = 4096  # Records read at a time by queries
+
+# A metrics file is a header followed by one fixed-width record per sample,
+# in time order.  A record is 12 bytes: the sample time in whole seconds
+# since the epoch, the average tick rate, the number of connected players,
+# the tech tier, and flags.  A week of 5 second samples is about 1.4 MB.
+HEADER = struct.Struct("<4sHH")
+MAGIC = b"SDSM"
+VERSION = 1
+RECORD = struct.Struct("<IfHBB")
+
+FLAG_ONLINE = 1  # The server answered.  The other fields are 0 otherwise.
+FLAG_RUNNING = 2
+FLAG_PAUSED = 4
+
+class MetricsFile:
+   # Appends samples to, and queries, one server's metrics file.  Records are
+   # kept in time order so a query can find its range by binary search and
+   # read only the records inside it.
+   def __init__(self, filepath):
+      self.filepath = filepath
+      self.lastTime = None
+      try:
+         self.file = open(filepath, "r+b")
+      except FileNotFoundError:
+         self.file = open(filepath, "w+b")
+         self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+         self.file.flush()
+         self.file.seek(0)
+      header = self.file.read(HEADER.size)
+      if len(header) != HEADER.size or HEADER.unpack(header) != (MAGIC, VERSION, RECORD.size):
+         self.file.close()
+         raise ValueError(f"{filepath} is not a version {VERSION} metrics file")
+      count = self.count()
+      if count > 0:
+         self.lastTime = self.recordTime(count - 1)
+
+   def close(self):
+      self.file.close()
+
+   def count(self):
+      # Ignores a partial record left by an interrupted write.
+      return (os.fstat(self.file.fileno()).st_size - HEADER.size) // RECORD.size
+
+   def recordTime(self, index):
+      self.file.seek(HEADER.size + index * RECORD.size)
+      return RECORD.unpack(self.file.read(RECORD.size))[0]
+
+   def append(self, sampleTime, serverState):
+      # serverState is None when the server couldn't be reached.  A clock
+      # stepped backwards would break the time order, so such samples are
+      # recorded at the time of the previous one.
+      sampleTime = int(sampleTime)
+      if self.lastTime != None and sampleTime < self.lastTime:
+         sampleTime = self.lastTime
+      if serverState == None:
+         record = RECORD.pack(sampleTime, 0.0, 0, 0, 0)
+      else:
+         flags = FLAG_ONLINE
+         if serverState.isGameRunning:
+            flags |= FLAG_RUNNING
+         if serverState.isGamePaused:
+            flags |= FLAG_PAUSED
+         record = RECORD.pack(sampleTime, serverState.averageTickRate or 0.0,
+                              min(serverState.numConnectedPlayers or 0, 0xffff),
+                              min(serverState.techTier or 0, 0xff), flags)
+      # Appending after a partial record would misalign every later one.
+      self.file.seek(HEADER.size + self.count() * RECORD.size)
+      self.file.write(record)
+      self.file.flush()
+      self.lastTime = sampleTime
+
+   def findTime(self, sampleTime):
+      # Index of the first record at or after sampleTime.
+      (low, high) = (0, self.count())
+      while low < high:
+         middle = (low + high) // 2
+         if self.recordTime(middle) < sampleTime:
+            low = middle + 1
+         else:
+            high = middle
+      return low
+
+   def records(self, start, end):
+      # Yields lists of (time, tickRate, players, techTier, flags), at most
+      # READ_RECORDS long, for the records with start <= time < end.
+      index = self.findTime(start)
+      count = self.count()
+      while index < count:
+         self.file.seek(HEADER.size + index * RECORD.size)
+         data = self.file.read(min(READ_RECORDS, count - index) * RECORD.size)
+         if len(data) < RECORD.size:
+            return
+         records = list(RECORD.iter_unpack(data[:len(data) // RECORD.size * RECORD.size]))
+         index += len(records)
+         if records[-1][0] >= end:
+            del records[bisect.bisect_left([record[0] for record in records], end):]
+            if len(records) > 0:
+               yield records
+            return
+         yield records
+
+   def query(self, start, end, bucketSeconds=DEFAULT_BUCKET):
+      # Summarizes the samples from start up to end, in seconds since the
+      # epoch, in buckets of bucketSeconds.  Returns a list with an entry for
+      # every bucket that has samples.  Each has the bucket's start time, its
+      # sample count, how many of those found the server offline, and the
+      # min/max/mean of each metric over the samples where it was online.
+      # running and paused are the fraction of online samples with that flag.
+      buckets = []
+      bucket = None
+      for records in self.records(start, end):
+         times = [record[0] for record in records]
+         first = 0
+         while first < len(records):
+            bucketStart = start + (times[first] - start) // bucketSeconds * bucketSeconds
+            last = bisect.bisect_left(times, bucketStart + bucketSeconds, first)
+            if bucket == None or bucket.start != bucketStart:
+               bucket = MetricsBucket(bucketStart)
+               buckets.append(bucket)
+            bucket.add(records[first:last])
+            first = last
+      return [bucket.toDict() for bucket in buckets]
+
+class MetricsBucket:
+   # Aggregates run column by column over whole slices of records, since
+   # the builtins are far quicker than a Python loop over single records.
+   FIELDS = ("averageTickRate", "numConnectedPlayers", "techTier", "running", "paused")
+
+   def __init__(self, start):
+      self.start = start
+      self.samples = 0
+      self.offline = 0
+      self.low = [math.inf] * len(self.FIELDS)
+      self.high = [-math.inf] * len(self.FIELDS)
+      self.total = [0] * len(self.FIELDS)
+
+   def add(self, records):
+      self.samples += len(records)
+      online = [record for record in records if record[4] & FLAG_ONLINE]
+      self.offline += len(records) - len(online)
+      if len(online) == 0:
+         return
+      (times, tickRates, players, techTiers, flags) = zip(*online)
+      running = [flag & FLAG_RUNNING and 1 for flag in flags]
+      paused = [flag & FLAG_PAUSED and 1 for flag in flags]
+      for (index, values) in enumerate((tickRates, players, techTiers, running, paused)):
+         self.low[index] = min(self.low[index], min(values))
+         self.high[index] = max(self.high[index], max(values))
+         self.total[index] += sum(values)
+
+   def toDict(self):
+      result = {"start": self.start, "samples": self.samples, "offline": self.offline}
+      online = self.samples - self.offline
+      for (index, name) in enumerate(self.FIELDS):
+         if online == 0:
+            result[name] = None
+         else:
+            result[name] = {"min": self.low[index], "max": self.high[index], "mean": self.total[index] / online}
+      return result
+
+def metricsPath(directory, hostname, port):
+   safeName = "".join(c if c.isalnum() or c in ".-" else "-" for c in hostname)
+   return os.path.join(directory, f"{safeName}_{port}{METRICS_SUFFIX}")
+
+class ServerRecorder:
+   # Samples one server.  The client, and with it the kept-alive connection,
+   # and the token are kept from one sample to the next; a password login
+   # is only repeated when the server rejects the token.
+   def __init__(self, entry, directory):
+      (self.hostname, self.port, self.authorizationCode, self.password) = sdsrm_lib.inventoryEntry(entry)
+      self.loginFlag = not self.authorizationCode
+      self.client = sdsrm_lib.AsyncServerClient(self.hostname, self.port, poolSize=1)
+      self.metrics = MetricsFile(metricsPath(directory, self.hostname, self.port))
+
+   async def sample(self, sampleTime, timeout):
+      deadline = time.monotonic() + timeout
+      if not self.authorizationCode:
+         (status, self.authorizationCode) = await self.client.authenticate(False, self.password, timeout=timeout)
+      serverState = None
+      if self.authorizationCode:
+         (status, serverState) = await self.client.getServerState(self.authorizationCode, timeout=max(0, deadline - time.monotonic()))
+         if self.loginFlag and sdsrm_lib.isAuthFailure(status):
+            self.authorizationCode = None
+      if serverState == None:
+         print(f"{self.hostname}:{self.port}: {status}")
+      self.metrics.append(sampleTime, serverState)
+
+   def close(self):
+      self.client.close()
+      self.metrics.close()
+
+async def recordAsync(inventory, directory, interval=DEFAULT_INTERVAL, timeout=None, sampleCount=None):
+   # Samples every server in the inventory each interval seconds, sampleCount
+   # times or forever.  Samples are taken on a fixed schedule; when one takes
+   # longer than interval the missed ones are skipped rather than bunched up.
+   if timeout == None:
+      timeout = interval
+   os.makedirs(directory, exist_ok=True)
+   recorders = [ServerRecorder(entry, directory) for entry in inventory]
+   try:
+      nextTime = time.monotonic()
+      taken = 0
+      while sampleCount == None or taken < sampleCount:
+         sampleTime = time.time()
+         await asyncio.gather(*(recorder.sample(sampleTime, timeout) for recorder in recorders))
+         taken += 1
+         nextTime += interval
+         now = time.monotonic()
+         if nextTime < now:
+            nextTime += (now - nextTime) // interval * interval + interval
+         await asyncio.sleep(nextTime - now)
+   finally:
+      for recorder in recorders:
+         recorder.close()
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description="Record, or query, the state of Satisfactory dedicated servers over time.")
+   subparsers = parser.add_subparsers(dest="command", required=True)
+   recordParser = subparsers.add_parser("record", help="sample the servers in an inventory until interrupted")
+   recordParser.add_argument("inventory", help="JSON file listing the servers to sample, as for sdsrm_fleet.py")
+   recordParser.add_argument("--directory", default="metrics", help="where to keep one metrics file per server")
+   recordParser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between samples")
+   recordParser.add_argument("--timeout", type=float, help="seconds allowed per sample, the interval by default")
+   queryParser = subparsers.add_parser("query", help="summarize a metrics file as JSON")
+   queryParser.add_argument("metrics", help="metrics file written by record")
+   queryParser.add_argument("--start", type=float, help="seconds since the epoch, a day ago by default")
+   queryParser.add_argument("--end", type=float, help="seconds since the epoch, now by default")
+   queryParser.add_argument("--bucket", type=int, default=DEFAULT_BUCKET, help="seconds per bucket")
+   args = parser.parse_args()
+
+   if args.command == "record":
+      try:
+         asyncio.run(recordAsync(loadInventory(args.inventory), args.directory, args.interval, args.timeout))
+      except KeyboardInterrupt:
+         pass
+   else:
+      end = args.end if args.end != None else time.time()
+      start = args.start if args.start != None else end - DEFAULT_QUERY_RANGE
+      metrics = MetricsFile(args.metrics)
+      try:
+         print(json.dumps(metrics.query(int(start), math.ceil(end), args.bucket), indent=3))
+      finally:
+         metrics.close()
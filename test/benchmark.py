@@ -0,0 +1,230 @@
+# This file is part of the SDSRM distribution (https://github.com/GreyHak/sdsrm).
+# Copyright (c) 2024 GreyHak (github.com/GreyHak).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmarks sdsrm_lib against the test server, started on a free local port
+# with a freshly generated certificate.  Run from anywhere:
+#   python3 test/benchmark.py --output before.json
+# and compare the JSON from two versions of the library.
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TEST_DIRECTORY))
+
+import sdsrm_lib
+import test_server
+
+HOSTNAME = "127.0.0.1"
+AUTHORIZATION_CODE = test_server.AUTHORIZATION_CODE.decode()
+ADMIN_PASSWORD = "benchmark"
+DEFAULT_ITERATIONS = 200
+DEFAULT_UPLOAD_SIZES = "1,16,128,1024"  # MiB
+CALL_SAVE_SIZE = 65536  # Bytes in the save used for the uploadSave and downloadSave latency runs
+MIB = 1048576
+
+def summarize(samples):
+   # Seconds in, milliseconds out.
+   ms = sorted(sample * 1000 for sample in samples)
+   result = {"count": len(ms)}
+   if len(ms) == 0:
+      return result
+   result["min"] = ms[0]
+   result["mean"] = statistics.mean(ms)
+   result["max"] = ms[-1]
+   if len(ms) == 1:
+      (result["p50"], result["p95"], result["p99"]) = (ms[0], ms[0], ms[0])
+   else:
+      cuts = statistics.quantiles(ms, n=100, method="inclusive")
+      (result["p50"], result["p95"], result["p99"]) = (cuts[49], cuts[94], cuts[98])
+   return result
+
+def timeCall(call, iterations):
+   # Returns (summary, failures).  Only successful calls are timed.
+   samples = []
+   failures = {}
+   for iteration in range(iterations):
+      start = time.perf_counter()
+      status = sdsrm_lib.resultStatus(call())
+      elapsed = time.perf_counter() - start
+      if status in sdsrm_lib.SUCCESS_STATUSES:
+         samples.append(elapsed)
+      else:
+         failures[status] = failures.get(status, 0) + 1
+   return (summarize(samples), failures)
+
+def writeSave(filepath, size):
+   block = os.urandom(min(size, MIB))
+   with open(filepath, "wb") as fout:
+      remaining = size
+      while remaining > 0:
+         fout.write(block[:remaining])
+         remaining -= len(block)
+
+def benchmarkCalls(port, iterations, workDirectory):
+   client = sdsrm_lib.ServerClient(HOSTNAME, port)
+   savePath = os.path.join(workDirectory, "call.sav")
+   writeSave(savePath, CALL_SAVE_SIZE)
+   downloadPath = os.path.join(workDirectory, "call-download.sav")
+   calls = {
+      "authenticate": lambda: client.authenticate(True, ADMIN_PASSWORD),
+      "verifyAuthentication": lambda: client.verifyAuthentication(AUTHORIZATION_CODE),
+      "getServerState": lambda: client.getServerState(AUTHORIZATION_CODE),
+      "enumerateSessions": lambda: client.enumerateSessions(AUTHORIZATION_CODE, catalogFlag=False),
+      "setServerName": lambda: client.setServerName(AUTHORIZATION_CODE, "Benchmark"),
+      "uploadSave": lambda: client.uploadSave(AUTHORIZATION_CODE, savePath, "BenchmarkCall", False, False),
+      "downloadSave": lambda: client.downloadSave(AUTHORIZATION_CODE, "BenchmarkCall", downloadPath),
+      "shutdown": lambda: client.shutdown(AUTHORIZATION_CODE),  # The mock server only counts shutdowns
+   }
+   results = {}
+   for (name, call) in calls.items():
+      handshakesBefore = client.handshakeStats.handshakes
+      (summary, failures) = timeCall(call, iterations)
+      summary["failures"] = failures
+      summary["handshakes"] = client.handshakeStats.handshakes - handshakesBefore
+      results[name] = summary
+   client.close()
+   return results
+
+def benchmarkConnections(port, iterations):
+   # Full handshakes use a new client, and so a new session, every time.
+   fullSamples = []
+   for iteration in range(iterations):
+      client = sdsrm_lib.ServerClient(HOSTNAME, port)
+      connection = client.connect()
+      if connection != None:
+         fullSamples.append(client.handshakeStats.lastTime)
+         connection.close()
+
+   # Resumed handshakes reuse the session from one completed call.
+   client = sdsrm_lib.ServerClient(HOSTNAME, port)
+   client.getServerState(AUTHORIZATION_CODE)
+   resumedSamples = []
+   resumedCount = 0
+   for iteration in range(iterations):
+      connection = client.connect()
+      if connection != None:
+         resumedSamples.append(client.handshakeStats.lastTime)
+         resumedCount += connection.ssock.session_reused
+         connection.close()
+   client.close()
+
+   # A call on a new connection, against a call on a pooled one.  Whether
+   # the pooled connection really was reused depends on the server honoring
+   # keep-alive, so handshakes are counted alongside.
+   def newConnectionCall():
+      client = sdsrm_lib.ServerClient(HOSTNAME, port)
+      result = client.getServerState(AUTHORIZATION_CODE)
+      client.close()
+      return result
+   (coldCall, coldFailures) = timeCall(newConnectionCall, iterations)
+   coldCall["failures"] = coldFailures
+
+   client = sdsrm_lib.ServerClient(HOSTNAME, port)
+   client.getServerState(AUTHORIZATION_CODE)
+   handshakesBefore = client.handshakeStats.handshakes
+   (reusedCall, reusedFailures) = timeCall(lambda: client.getServerState(AUTHORIZATION_CODE), iterations)
+   reusedCall["failures"] = reusedFailures
+   reusedCall["handshakes"] = client.handshakeStats.handshakes - handshakesBefore
+   client.close()
+
+   return {
+      "fullHandshake": summarize(fullSamples),
+      "resumedHandshake": dict(summarize(resumedSamples), resumed=resumedCount),
+      "newConnectionCall": coldCall,
+      "pooledConnectionCall": reusedCall,
+   }
+
+def benchmarkUploads(port, sizes, workDirectory):
+   client = sdsrm_lib.ServerClient(HOSTNAME, port)
+   results = []
+   for sizeMiB in sizes:
+      size = int(sizeMiB * MIB)
+      savePath = os.path.join(workDirectory, "upload.sav")
+      writeSave(savePath, size)
+      start = time.perf_counter()
+      status = client.uploadSave(AUTHORIZATION_CODE, savePath, "BenchmarkUpload", False, False)
+      elapsed = time.perf_counter() - start
+      result = {"bytes": size, "status": status, "seconds": elapsed}
+      if status == "Success":
+         result["mibPerSecond"] = size / MIB / elapsed
+      results.append(result)
+      os.remove(savePath)
+      with contextlib.suppress(FileNotFoundError):
+         os.remove(os.path.join(workDirectory, "BenchmarkUpload.sav"))
+   client.close()
+   return results
+
+def gitRevision():
+   try:
+      return subprocess.run(["git", "rev-parse", "HEAD"], cwd=TEST_DIRECTORY, check=True,
+                            capture_output=True, text=True).stdout.strip()
+   except (OSError, subprocess.CalledProcessError):
+      return None
+
+def main():
+   parser = argparse.ArgumentParser(description="Benchmark sdsrm_lib against a local mock server.")
+   parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="calls per latency measurement")
+   parser.add_argument("--sizes", default=DEFAULT_UPLOAD_SIZES, help="comma-separated upload sizes in MiB")
+   parser.add_argument("--output", default="benchmark.json", help="JSON results file")
+   args = parser.parse_args()
+   sizes = [float(size) for size in args.sizes.split(",") if size.strip() != ""]
+
+   with tempfile.TemporaryDirectory(prefix="sdsrm-benchmark-") as workDirectory:
+      certPath = os.path.join(workDirectory, "cert.pem")
+      test_server.generateCertificate(certPath)
+      server = test_server.MockServer(workDirectory, log=lambda *args: None, quietFlag=True, adminPassword=ADMIN_PASSWORD)
+      (listenSocket, port) = test_server.startServer(server, certPath)
+      try:
+         calls = benchmarkCalls(port, args.iterations, workDirectory)
+         connections = benchmarkConnections(port, args.iterations)
+         uploads = benchmarkUploads(port, sizes, workDirectory)
+      finally:
+         listenSocket.close()
+
+   results = {
+      "library": sdsrm_lib.USER_AGENT,
+      "revision": gitRevision(),
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "openssl": ssl.OPENSSL_VERSION,
+      "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+      "iterations": args.iterations,
+      "calls": calls,
+      "connections": connections,
+      "uploads": uploads,
+   }
+   with open(args.output, "w") as fout:
+      json.dump(results, fout, indent=3)
+
+   for (name, summary) in calls.items():
+      print(f"{name:24} p50 {summary.get('p50', 0):8.3f} ms  p95 {summary.get('p95', 0):8.3f} ms  p99 {summary.get('p99', 0):8.3f} ms")
+   for (name, summary) in connections.items():
+      print(f"{name:24} p50 {summary.get('p50', 0):8.3f} ms  p95 {summary.get('p95', 0):8.3f} ms  p99 {summary.get('p99', 0):8.3f} ms")
+   for upload in uploads:
+      print(f"upload {upload['bytes'] / MIB:10.0f} MiB  {upload['status']:10} {upload.get('mibPerSecond', 0):8.1f} MiB/s")
+   print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+   main()
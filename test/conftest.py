@@ -0,0 +1,50 @@
+# This file is part of the SDSRM distribution (https://github.com/GreyHak/sdsrm).
+# Copyright (c) 2024 GreyHak (github.com/GreyHak).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# pytest fixtures for the tests that run sdsrm_lib against the test server.
+
+import os
+import sys
+
+import pytest
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TEST_DIRECTORY))
+sys.path.insert(0, TEST_DIRECTORY)
+
+import test_server
+
+@pytest.fixture(scope="session")
+def certPath(tmp_path_factory):
+   # One certificate for the whole run, as openssl takes a while to make one.
+   path = str(tmp_path_factory.mktemp("cert") / "cert.pem")
+   test_server.generateCertificate(path)
+   return path
+
+@pytest.fixture
+def serve(certPath, tmp_path):
+   # serve(faults=None, **options) starts a MockServer saving into a fresh
+   # directory and returns (server, port).  The servers stop after the test.
+   listenSockets = []
+
+   def start(faults=None, **options):
+      server = test_server.MockServer(str(tmp_path), faults, log=lambda *args: None, quietFlag=True, **options)
+      (listenSocket, port) = test_server.startServer(server, certPath)
+      listenSockets.append(listenSocket)
+      return (server, port)
+
+   yield start
+   for listenSocket in listenSockets:
+      listenSocket.close()
@@ -0,0 +1,40 @@
+# This file is part of the SDSRM distribution (https://github.com/GreyHak/sdsrm).
+# Copyright (c) 2024 GreyHak (github.com/GreyHak).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Ways of cutting a byte stream into pieces for the parser tests, as TLS
+# records may cut it: byte by byte, in two at every point, or at random
+# points that are the same on every run.
+
+import random
+
+FUZZ_ITERATIONS = 300
+FUZZ_SEED = 1234
+
+def splitAt(data, cuts):
+   cuts = [0] + sorted(cuts) + [len(data)]
+   return [data[start:end] for (start, end) in zip(cuts, cuts[1:])]
+
+def byteByByte(data):
+   return [data[index:index + 1] for index in range(len(data))]
+
+def singleSplits(data):
+   for cut in range(1, len(data)):
+      yield splitAt(data, [cut])
+
+def randomSplits(data, maxCuts):
+   # FUZZ_ITERATIONS splits, each at 1 to maxCuts points.
+   rng = random.Random(FUZZ_SEED)
+   for iteration in range(FUZZ_ITERATIONS):
+      yield splitAt(data, rng.sample(range(1, len(data)), rng.randint(1, maxCuts)))
@@ -0,0 +1,67 @@
+# This file is part of the SDSRM distribution (https://github.com/GreyHak/sdsrm).
+# Copyright (c) 2024 GreyHak (github.com/GreyHak).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Regression tests for token handling against the test server.  Every API
+# function must report a rejected token so that isAuthFailure() sees it,
+# whatever status text it returns, and cached tokens must stay private.
+#   python3 -m pytest test
+
+import os
+import stat
+
+import pytest
+
+import sdsrm_lib
+
+HOSTNAME = "127.0.0.1"
+ADMIN_PASSWORD = "admin"
+BOGUS_TOKEN = "bogus.0123456789ABCDEF"
+
+def testRejectedToken(serve, tmp_path):
+   (server, port) = serve(adminPassword=ADMIN_PASSWORD)
+   client = sdsrm_lib.ServerClient(HOSTNAME, port)
+   try:
+      (authStatus, token) = client.authenticate(True, ADMIN_PASSWORD)
+      savePath = str(tmp_path / "upload.sav")
+      with open(savePath, "wb") as fout:
+         fout.write(b"save" * 100)
+      assert client.uploadSave(token, savePath, "Test", False, False) == "Success"
+
+      statuses = (
+         client.verifyAuthentication(BOGUS_TOKEN)[0],
+         client.getServerState(BOGUS_TOKEN)[0],
+         client.enumerateSessions(BOGUS_TOKEN, catalogFlag=False)[0],
+         client.setServerName(BOGUS_TOKEN, "Name"),
+         client.uploadSave(BOGUS_TOKEN, savePath, "Test", False, False),
+         client.downloadSave(BOGUS_TOKEN, "Test", str(tmp_path / "download.sav"))[0],
+         client.shutdown(BOGUS_TOKEN),
+         )
+      for status in statuses:
+         assert sdsrm_lib.isAuthFailure(status), status
+      assert not sdsrm_lib.isAuthFailure(client.downloadSave(token, "Test", str(tmp_path / "download.sav"))[0])
+      assert not sdsrm_lib.isAuthFailure("Connection Failed")
+   finally:
+      client.close()
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX file modes")
+def testTokenCachePrivate(tmp_path):
+   filename = str(tmp_path / sdsrm_lib.TOKEN_CACHE_FILENAME)
+   umask = os.umask(0o022)
+   try:
+      sdsrm_lib.TokenCache(filename).store(HOSTNAME, 7777, True, BOGUS_TOKEN)
+   finally:
+      os.umask(umask)
+   assert stat.S_IMODE(os.stat(filename).st_mode) == 0o600
+   assert sdsrm_lib.TokenCache(filename).lookup(HOSTNAME, 7777, True) == (BOGUS_TOKEN, True)
@@ -0,0 +1,97 @@
+# This file is part of the SDSRM distribution (https://github.com/GreyHak/sdsrm).
+# Copyright (c) 2024 GreyHak (github.com/GreyHak).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Regression tests for the retry policy of ServerClient and AsyncServerClient
+# against the test server.  Calls that aren't safe to repeat must reach the
+# server at most once, however often it drops connections after acting on
+# a request, and both clients report a connect that ran out of time alike.
+#   python3 -m pytest test
+
+import asyncio
+import socket
+
+import sdsrm_lib
+import test_server
+
+HOSTNAME = "127.0.0.1"
+AUTHORIZATION_CODE = test_server.AUTHORIZATION_CODE.decode()
+CALLS = 100
+DROP_RATE = 0.3
+
+def checkShutdowns(server, statuses):
+   successes = statuses.count("Success")
+   assert 0 < successes < CALLS, statuses
+   assert successes <= server.shutdownCount <= CALLS
+
+def testShutdownNotResent(serve):
+   (server, port) = serve(test_server.FaultInjector(dropRate=DROP_RATE))
+   client = sdsrm_lib.ServerClient(HOSTNAME, port)
+   try:
+      statuses = [client.shutdown(AUTHORIZATION_CODE) for call in range(CALLS)]
+   finally:
+      client.close()
+   checkShutdowns(server, statuses)
+
+def testAsyncShutdownNotResent(serve):
+   (server, port) = serve(test_server.FaultInjector(dropRate=DROP_RATE))
+
+   async def shutdowns():
+      client = sdsrm_lib.AsyncServerClient(HOSTNAME, port)
+      try:
+         return [await client.shutdown(AUTHORIZATION_CODE) for call in range(CALLS)]
+      finally:
+         client.close()
+
+   checkShutdowns(server, asyncio.run(shutdowns()))
+
+def testIdleConnectionReused(serve):
+   # The check for a connection closed while idle mustn't take the TLS
+   # session tickets the server sends after the handshake for a close.
+   (server, port) = serve()
+   client = sdsrm_lib.ServerClient(HOSTNAME, port)
+   try:
+      for call in range(10):
+         assert client.shutdown(AUTHORIZATION_CODE) == "Success"
+   finally:
+      client.close()
+   assert server.shutdownCount == 10
+   assert client.handshakeStats.handshakes == 1
+
+def callBoth(port, policy):
+   # Returns the getServerState status from ServerClient and AsyncServerClient.
+   client = sdsrm_lib.ServerClient(HOSTNAME, port, policy=policy)
+   syncStatus = client.getServerState(AUTHORIZATION_CODE)[0]
+   asyncClient = sdsrm_lib.AsyncServerClient(HOSTNAME, port, policy=policy)
+   asyncStatus = asyncio.run(asyncClient.getServerState(AUTHORIZATION_CODE))[0]
+   return (syncStatus, asyncStatus)
+
+def testConnectTimeout():
+   # A listener that never answers the TLS handshake.
+   listenSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+   listenSocket.bind((HOSTNAME, 0))
+   listenSocket.listen(8)
+   try:
+      port = listenSocket.getsockname()[1]
+      assert callBoth(port, sdsrm_lib.RequestPolicy(connectTimeout=0.1, totalTimeout=5, backoff=0.01)) == ("Timed Out", "Timed Out")
+      assert callBoth(port, sdsrm_lib.RequestPolicy(connectTimeout=5, totalTimeout=0.2)) == ("Timed Out", "Timed Out")
+   finally:
+      listenSocket.close()
+
+def testConnectRefused():
+   listenSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+   listenSocket.bind((HOSTNAME, 0))
+   port = listenSocket.getsockname()[1]
+   listenSocket.close()
+   assert callBoth(port, sdsrm_lib.RequestPolicy(backoff=0.01)) == ("Connection Failed", "Connection Failed")
@@ -0,0 +1,114 @@
+# This file is part of the SDSRM distribution (https://github.com/GreyHak/sdsrm).
+# Copyright (c) 2024 GreyHak (github.com/GreyHak).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Regression tests for sdsrm_lib.HttpResponseParser.  A stream of pipelined
+# responses is fed in pieces cut at random points, as TLS records may cut
+# them, and must always parse to the same responses.
+#   python3 -m pytest test
+
+import sdsrm_lib
+from splitting import byteByByte, randomSplits, singleSplits
+
+def framed(status, body, headers=b""):
+   return b"HTTP/1.1 " + status + b"\r\n" + headers + b"Content-Length: %d\r\n\r\n" % len(body) + body
+
+def chunked(chunks):
+   # Chunk bodies that look like HTTP, with an extension and a trailer.
+   body = b"".join(b"%x;name=value\r\n" % len(chunk) + chunk + b"\r\n" for chunk in chunks)
+   return b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n" + body + b"0\r\nTrailer: yes\r\n\r\n"
+
+JSON_BODY = b'{"data": {"text": "\\r\\n\\r\\n"}}'
+CHUNKS = (b"HTTP/", b"1.1 200 OK\r\n\r\n0\r\n\r\n", b"x" * 300)
+
+# (raw response, status, body) in the order they are sent on one connection
+RESPONSES = (
+   (framed(b"200 OK", JSON_BODY, b"Content-Type: application/json\r\nKeep-Alive: timeout=15.000000\r\n"), 200, JSON_BODY),
+   (b"HTTP/1.1 100 Continue\r\n\r\n" + framed(b"201 Created", b""), 201, b""),
+   (chunked(CHUNKS), 200, b"".join(CHUNKS)),
+   (b"HTTP/1.1 204 No Content\r\n\r\n", 204, None),
+   (framed(b"404 Not Found", b'{"errorCode": "file_not_found"}'), 404, b'{"errorCode": "file_not_found"}'),
+   )
+STREAM = b"".join(response[0] for response in RESPONSES)
+
+def parseStream(pieces, bodySink=None):
+   # Feeds the pieces the way ServerConnection.readResponse() does, starting
+   # a new parser on the leftover bytes after each response.
+   responses = []
+   parser = sdsrm_lib.HttpResponseParser(bodySink)
+   for piece in pieces:
+      doneFlag = parser.feed(piece)
+      while doneFlag:
+         responses.append(parser.response)
+         leftover = parser.leftover()
+         parser = sdsrm_lib.HttpResponseParser(bodySink)
+         doneFlag = len(leftover) > 0 and parser.feed(leftover)
+   assert parser.leftover() == b"", "Bytes left after the last response"
+   return responses
+
+def checkResponses(responses):
+   assert [response.statusCode for response in responses] == [status for (raw, status, body) in RESPONSES]
+   for (response, (raw, status, body)) in zip(responses, RESPONSES):
+      if body != None:
+         assert response.body == body
+   assert responses[0].keepAliveTimeout() == 15.0
+
+def testWhole():
+   checkResponses(parseStream([STREAM]))
+
+def testByteByByte():
+   checkResponses(parseStream(byteByByte(STREAM)))
+
+def testEverySingleSplit():
+   for pieces in singleSplits(STREAM):
+      checkResponses(parseStream(pieces))
+
+def testRandomSplits():
+   for pieces in randomSplits(STREAM, 12):
+      checkResponses(parseStream(pieces))
+
+def testBodySink():
+   # 2xx bodies go to the sink, others are still collected.
+   for pieces in randomSplits(STREAM, 12):
+      sunk = {}
+      def sink(response, data):
+         sunk[id(response)] = sunk.get(id(response), b"") + data
+      responses = parseStream(pieces, sink)
+      assert sunk.get(id(responses[0])) == RESPONSES[0][2]
+      assert sunk.get(id(responses[2])) == RESPONSES[2][2]
+      assert responses[0].body == b"" and responses[0].bodyLength == len(RESPONSES[0][2])
+      assert responses[4].body == RESPONSES[4][2]
+
+def testUntilClose():
+   raw = b"HTTP/1.1 200 OK\r\nConnection: close\r\n\r\nall of the rest"
+   for cut in range(1, len(raw)):
+      parser = sdsrm_lib.HttpResponseParser()
+      assert not parser.feed(raw[:cut])
+      assert not parser.feed(raw[cut:])
+      assert parser.feedEof()
+      assert parser.response.body == b"all of the rest"
+      assert parser.response.closeFlag()
+
+def testTruncated():
+   # A connection closed partway through a framed body is an error.
+   raw = RESPONSES[0][0]
+   for cut in range(1, len(raw)):
+      parser = sdsrm_lib.HttpResponseParser()
+      assert not parser.feed(raw[:cut])
+      try:
+         parser.feedEof()
+      except sdsrm_lib.HttpProtocolError:
+         pass
+      else:
+         assert False, f"No error when cut at {cut}"
@@ -0,0 +1,86 @@
+# This file is part of the SDSRM distribution (https://github.com/GreyHak/sdsrm).
+# Copyright (c) 2024 GreyHak (github.com/GreyHak).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Regression tests for the test server's MultipartParser.  An upload body
+# is fed in pieces cut at random points, as TLS records may cut it, so the
+# boundaries land anywhere in them.  The saved file holds sequences that
+# almost match the delimiter, which must come through unchanged.
+#   python3 -m pytest test
+
+import io
+import os
+
+import test_server
+from splitting import byteByByte, randomSplits, singleSplits
+
+BOUNDARY = b"------------------------QxWvEtRyUiOpAsDfGhJkLz"
+DATA = b'{"function": "UploadSaveGame", "data": {"saveName": "Test", "loadSaveGame": false}}'
+# Near misses of "\r\n--" + BOUNDARY, including a whole boundary without
+# its leading CRLF, and an ending that could be the start of the delimiter.
+SAVE = (b"\r\n--" + BOUNDARY[:-1] + b"X" + b"\x00" * 100 +
+        b"\r\n-" + BOUNDARY + b"\r\r\n--" + BOUNDARY[:10] +
+        b"--" + BOUNDARY + b"\r\n--\r\n" + os.urandom(500) + b"\r\n--" + BOUNDARY[:-3] + b"\r")
+
+def uploadBody(save=SAVE):
+   return b"".join((
+      b"--" + BOUNDARY + b"\r\n",
+      b'Content-Disposition: form-data; name="data"\r\nContent-Type: application/json\r\n\r\n',
+      DATA,
+      b"\r\n--" + BOUNDARY + b"\r\n",
+      b'Content-Disposition: form-data; name="saveGameFile"; filename="Test.sav"\r\nContent-Type: application/octet-stream\r\n\r\n',
+      save,
+      b"\r\n--" + BOUNDARY + b"--\r\n",
+      b"epilogue, ignored"))
+
+def parsePieces(pieces):
+   # Returns {name: (filename, data)}.
+   parser = test_server.MultipartParser(BOUNDARY, lambda part: io.BytesIO())
+   for piece in pieces:
+      parser.feed(piece)
+   parser.finish()
+   return {part.name: (part.filename, part.sink.getvalue()) for part in parser.parts}
+
+def checkParts(parts, save=SAVE):
+   assert parts == {"data": (None, DATA), "saveGameFile": ("Test.sav", save)}
+
+def testWhole():
+   checkParts(parsePieces([uploadBody()]))
+
+def testByteByByte():
+   checkParts(parsePieces(byteByByte(uploadBody())))
+
+def testEverySingleSplit():
+   for pieces in singleSplits(uploadBody()):
+      checkParts(parsePieces(pieces))
+
+def testRandomSplits():
+   for pieces in randomSplits(uploadBody(), 20):
+      checkParts(parsePieces(pieces))
+
+def testEmptyFile():
+   for pieces in singleSplits(uploadBody(b"")):
+      checkParts(parsePieces(pieces), b"")
+
+def testTruncated():
+   # A body that ends before the closing boundary is an error.
+   body = uploadBody()
+   end = body.index(b"\r\n--" + BOUNDARY + b"--")
+   for cut in range(1, end, 7):
+      try:
+         parsePieces([body[:cut]])
+      except ValueError:
+         pass
+      else:
+         assert False, f"No error when cut at {cut}"
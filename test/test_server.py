@@ -13,9 +13,25 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+# Mock Satisfactory Dedicated Server API.  Every connection gets its own
+# thread and is kept alive between requests.  Server state is kept in memory;
+# saves are files in the save directory.  Latency, jitter, dropped connections
+# and truncated responses can be injected to test clients against a
+# misbehaving server.
+#
+#   python3 test_server.py --port 7778 --latency 0.05 --jitter 0.02 --drop 0.01 --truncate 0.01 --quiet
+
+import argparse
+import base64
+import io
+import json
+import os
+import random
 import socket
 import ssl
-import json
+import subprocess
+import tempfile
+import threading
 import time
 
 AUTHORIZATION_CODE = b"ew0KCSJwbCI6ICJBZG1pbmlzdHJhdG9yIg0KfQ==.3EA86D4C9D008C692F8C12DAB9554FE8733B8FF55D45E2D4F74037295BF3714F9A68CB27B94A554C5164321BC3C78705463E8DC7A7ACA45294D56C0D432F2982"
@@ -36,234 +52,785 @@ def parseHeaders(request):
    return (headers, data)
 
 RECV_SIZE = 1048576 # curl sends it through as 16384 bytes
-
-context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-
-# openssl req -new -x509 -days 365 -nodes -out cert.pem -keyout cert.pem -subj "/C=US"
-context.load_cert_chain('cert.pem')
-
-ERROR_MESSAGE_400 = b"HTTP/1.1 400\r\nServer: FactoryGame/++FactoryGame+dev-CL-332077 (Windows)\r\nkeep-alive: timeout=15.000000\r\ncontent-length: 0\r\n\r\n"
-ERROR_MESSAGE_403 = b"HTTP/1.1 403\r\nServer: FactoryGame/++FactoryGame+dev-CL-332077 (Windows)\r\nkeep-alive: timeout=15.000000\r\ncontent-length: 0\r\n\r\n"
-
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-   s.bind(("127.0.0.1", 7778))
-   s.listen()
-   print("Successfully Started Satisfactory API Test Server")
-   with context.wrap_socket(s, server_side=True) as ssock:
+MAX_HEADER_SIZE = 65536
+MAX_FIELD_SIZE = 65536  # Largest multipart part, other than a file, that is kept in memory
+KEEP_ALIVE_TIMEOUT = 15
+SERVER_HEADER = "Server: FactoryGame/++FactoryGame+dev-CL-332077 (Windows)"
+
+# InitialAdmin, given out before the server is claimed, may only call
+# functions open to everyone, and ClaimServer.
+PRIVILEGE_LEVELS = {"NotAuthenticated": 0, "InitialAdmin": 0, "Client": 1, "Administrator": 2}
+
+DEFAULT_SERVER_GAME_STATE = {
+   "activeSessionName": "PIE209",
+   "numConnectedPlayers": 0,
+   "playerLimit": 4,
+   "techTier": 2,
+   "activeSchematic": "None",
+   "gamePhase": "/Script/FactoryGame.FGGamePhase'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_0.GP_Project_Assembly_Phase_0'",
+   "isGameRunning": True,
+   "totalGameDuration": 2176,
+   "isGamePaused": True,
+   "averageTickRate": 30.286127090454102,
+   "autoLoadSessionName": "PIE209",
+}
+
+DEFAULT_SERVER_OPTIONS = {
+   "FG.DSAutoPause": "True",
+   "FG.DSAutoSaveOnDisconnect": "True",
+   "FG.AutosaveInterval": "300.0",
+   "FG.ServerRestartTimeSlot": "0.0",
+   "FG.SendGameplayData": "True",
+   "FG.NetworkQuality": "3",
+}
+
+DEFAULT_ADVANCED_GAME_SETTINGS = {
+   "FG.GameRules.NoPower": "False",
+   "FG.GameRules.DisableArachnidCreatures": "False",
+   "FG.GameRules.NoUnlockCost": "False",
+   "FG.GameRules.SetGamePhase": "1",
+   "FG.GameRules.GiveAllTiers": "False",
+   "FG.GameRules.UnlockAllResearchSchematics": "False",
+   "FG.GameRules.UnlockInstantAltRecipes": "False",
+   "FG.GameRules.UnlockAllResourceSinkSchematics": "False",
+   "FG.GameRules.GiveItems": "Empty",
+   "FG.PlayerRules.NoBuildCost": "False",
+   "FG.PlayerRules.GodMode": "False",
+   "FG.PlayerRules.FlightMode": "False",
+}
+
+def generateCertificate(certPath):
+   subprocess.run(["openssl", "req", "-new", "-x509", "-days", "365", "-nodes", "-out", certPath, "-keyout", certPath, "-subj", "/C=US"],
+                  check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def createContext(certPath):
+   context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+   context.load_cert_chain(certPath)
+   return context
+
+def argument(data, name, default=None):
+   # The documentation capitalizes argument names, but sdsrm_lib does not,
+   # and the game accepts both.
+   for (key, value) in data.items():
+      if key.lower() == name.lower():
+         return value
+   return default
+
+class MockRequest:
+   def __init__(self, requestLine, headers):
+      self.requestLine = requestLine
+      self.headers = headers  # Lower-case name -> value
+      self.function = None
+      self.data = {}
+      self.privilege = "NotAuthenticated"
+
+class MockResponse:
+   def __init__(self, statusCode, body=b"", contentType=None, filePath=None, headers=None):
+      self.statusCode = statusCode
+      self.body = body
+      self.contentType = contentType
+      self.filePath = filePath  # Sent after body when set
+      self.headers = headers or []
+
+def jsonResponse(jdata, statusCode=200):
+   return MockResponse(statusCode, json.dumps(jdata).encode(), "application/json;charset=utf-8")
+
+def errorResponse(statusCode, errorCode, errorMessage):
+   return jsonResponse({"errorCode": errorCode, "errorMessage": errorMessage}, statusCode)
+
+def emptyResponse():
+   return MockResponse(204)
+
+class MultipartPart:
+   def __init__(self, headers):
+      self.headers = headers  # Lower-case name -> value
+      self.name = None
+      self.filename = None
+      for parameter in headers.get("content-disposition", "").split(";")[1:]:
+         (key, _, value) = parameter.strip().partition("=")
+         if key.lower() == "name":
+            self.name = value.strip('"')
+         elif key.lower() == "filename":
+            self.filename = value.strip('"')
+      self.size = 0
+      self.sink = None  # Whatever openPart returned
+      self.path = None  # Set by openPart when the part goes to a file
+
+class MultipartParser:
+   # Incremental multipart/form-data parser.  The body can be fed in pieces
+   # of any size, with boundaries split between them.  Each part's data is
+   # written to the sink returned by openPart(part) as it arrives.  Only a
+   # delimiter's length of data is held back, so memory use is constant and
+   # every byte is searched a bounded number of times.
+   def __init__(self, boundary, openPart, maxFieldSize=MAX_FIELD_SIZE):
+      self.delimiter = b"\r\n--" + boundary
+      self.openPart = openPart
+      self.maxFieldSize = maxFieldSize
+      self.buffer = bytearray(b"\r\n")  # So the first boundary matches like the others
+      self.state = "preamble"
+      self.parts = []
+
+   def feed(self, data):
+      if self.state != "done":  # The epilogue is ignored
+         self.buffer += data
+         self.parse()
+
+   def finish(self):
+      if self.state != "done":
+         raise ValueError(f"Multipart body ended in state {self.state}")
+
+   def emit(self, length):
+      if self.state == "body" and length > 0:
+         part = self.parts[-1]
+         part.size += length
+         if part.filename == None and part.size > self.maxFieldSize:
+            raise ValueError(f"Multipart field '{part.name}' too large")
+         part.sink.write(self.buffer[:length])
+      del self.buffer[:length]
+
+   def parse(self):
+      while True:
+         if self.state in ("preamble", "body"):
+            index = self.buffer.find(self.delimiter)
+            if index == -1:
+               # Keep what could be the start of a delimiter split across feeds
+               self.emit(max(0, len(self.buffer) - len(self.delimiter) + 1))
+               return
+            self.emit(index)
+            del self.buffer[:len(self.delimiter)]
+            self.state = "boundary"
+
+         elif self.state == "boundary":
+            if len(self.buffer) < 2:
+               return
+            if self.buffer[:2] == b"--":
+               self.state = "done"
+               self.buffer.clear()
+               return
+            if self.buffer[:2] != b"\r\n":
+               raise ValueError("Malformed multipart boundary")
+            del self.buffer[:2]
+            self.state = "headers"
+
+         elif self.state == "headers":
+            if self.buffer[:2] == b"\r\n":
+               headerEnd = 0
+            else:
+               headerEnd = self.buffer.find(b"\r\n\r\n")
+               if headerEnd == -1:
+                  if len(self.buffer) > MAX_HEADER_SIZE:
+                     raise ValueError("Multipart headers too large")
+                  return
+               headerEnd += 2
+            headers = {}
+            for line in bytes(self.buffer[:headerEnd]).split(b"\r\n")[:-1]:
+               (name, _, value) = line.decode("latin-1").partition(":")
+               headers[name.strip().lower()] = value.strip()
+            del self.buffer[:headerEnd + 2]
+            part = MultipartPart(headers)
+            part.sink = self.openPart(part)
+            self.parts.append(part)
+            self.state = "body"
+
+         else:
+            return
+
+class FaultInjector:
+   # Each response is delayed by latency plus up to jitter seconds.  Then
+   # with probability dropRate the connection is closed without a response,
+   # or with probability truncateRate it is closed halfway through one.
+   def __init__(self, latency=0.0, jitter=0.0, dropRate=0.0, truncateRate=0.0):
+      self.latency = latency
+      self.jitter = jitter
+      self.dropRate = dropRate
+      self.truncateRate = truncateRate
+
+   def delay(self):
+      seconds = self.latency + random.uniform(0, self.jitter)
+      if seconds > 0:
+         time.sleep(seconds)
+
+   def dropFlag(self):
+      return self.dropRate > 0 and random.random() < self.dropRate
+
+   def truncateFlag(self):
+      return self.truncateRate > 0 and random.random() < self.truncateRate
+
+class SaveInfo:
+   def __init__(self, sessionName, playDurationSeconds=0):
+      self.sessionName = sessionName
+      self.playDurationSeconds = playDurationSeconds
+      self.saveDateTime = time.strftime("%Y.%m.%d-%H.%M.%S")
+
+class MockServer:
+   def __init__(self, saveDirectory=".", faults=None, log=print, quietFlag=False, adminPassword=None, clientPassword=None, claimedFlag=True):
+      self.saveDirectory = saveDirectory
+      self.faults = faults or FaultInjector()
+      self.log = log
+      self.quietFlag = quietFlag
+      self.lock = threading.Lock()
+      self.startTime = time.monotonic()
+      self.serverName = "SDSRM Mock Server"
+      self.adminPassword = adminPassword
+      self.clientPassword = clientPassword
+      self.claimedFlag = claimedFlag
+      self.tokens = {AUTHORIZATION_CODE.decode(): "Administrator"}
+      self.gameState = dict(DEFAULT_SERVER_GAME_STATE)
+      self.serverOptions = dict(DEFAULT_SERVER_OPTIONS)
+      self.advancedGameSettings = dict(DEFAULT_ADVANCED_GAME_SETTINGS)
+      self.creativeModeEnabled = False
+      self.shutdownCount = 0
+      self.saves = {}  # saveName -> SaveInfo
+      for filename in os.listdir(saveDirectory):
+         if filename.endswith(".sav"):
+            self.saves[filename[:-4]] = SaveInfo(filename[:-4])
+
+      self.functions = {
+         # name: (minimum privilege, handler)
+         "HealthCheck": ("NotAuthenticated", self.healthCheck),
+         "VerifyAuthenticationToken": ("Client", self.verifyAuthenticationToken),
+         "PasswordlessLogin": ("NotAuthenticated", self.passwordlessLogin),
+         "PasswordLogin": ("NotAuthenticated", self.passwordLogin),
+         "QueryServerState": ("Client", self.queryServerState),
+         "GetServerOptions": ("Client", self.getServerOptions),
+         "GetAdvancedGameSettings": ("Client", self.getAdvancedGameSettings),
+         "ApplyAdvancedGameSettings": ("Administrator", self.applyAdvancedGameSettings),
+         "ClaimServer": ("NotAuthenticated", self.claimServer),
+         "RenameServer": ("Administrator", self.renameServer),
+         "SetClientPassword": ("Administrator", self.setClientPassword),
+         "SetAdminPassword": ("Administrator", self.setAdminPassword),
+         "SetAutoLoadSessionName": ("Administrator", self.setAutoLoadSessionName),
+         "RunCommand": ("Administrator", self.runCommand),
+         "Shutdown": ("Administrator", self.shutdown),
+         "ApplyServerOptions": ("Administrator", self.applyServerOptions),
+         "CreateNewGame": ("Administrator", self.createNewGame),
+         "SaveGame": ("Administrator", self.saveGame),
+         "DeleteSaveFile": ("Administrator", self.deleteSaveFile),
+         "DeleteSaveSession": ("Administrator", self.deleteSaveSession),
+         "EnumerateSessions": ("Administrator", self.enumerateSessions),
+         "LoadGame": ("Administrator", self.loadGame),
+         "UploadSaveGame": ("Administrator", self.uploadSaveGame),
+         "DownloadSaveGame": ("Administrator", self.downloadSaveGame),
+      }
+
+   # ----- Connections -----
+
+   def serve(self, listenSocket, context):
       while True:
          try:
-            conn, addr = ssock.accept()
-            print(f"Connected by {addr}")
-            while True:
-               request = conn.recv(RECV_SIZE)
-
-               if not request:
-                  print("ERROR: Empty request")
-                  conn.sendall(ERROR_MESSAGE_400)
-                  conn.close()
-                  break
-               print(f"bytes(request)={request}")
-
-               print(f"str(request)={request.decode()}")
-               (headers, data) = parseHeaders(request)
-               totalContentBytesReceived = len(data)
-
-               print(f"headers={headers}")
-               if len(headers) == 0:
-                  print("ERROR: No headers.")
-                  conn.sendall(ERROR_MESSAGE_400)
-                  conn.close()
-                  break
-               if headers[0] != b"POST /api/v1 HTTP/1.1":
-                  print("ERROR: Server only supports POST to for the v1 API.")
-                  conn.sendall(ERROR_MESSAGE_400)
-                  conn.close()
-                  break
-
-               contentTypeJsonFlag = False
-               contentTypeBoundary = None
-               for header in headers:
-                  lowerHeader = header.lower()
-                  if lowerHeader[:14] == b"content-type: ":
-                     if lowerHeader[14:30] == b"application/json":
-                        contentTypeJsonFlag = True
-                  if b"; boundary=" in lowerHeader:
-                     contentTypeBoundary = header[lowerHeader.find(b"; boundary=")+11:]
-                     print(f"has boundary: {contentTypeBoundary}")
-
-               if not contentTypeJsonFlag:
-                  print("WARNING: Test server is assuming that the real server requires the header 'Content-Type: application/json' as demonstrated.")
-
-               authorizationCode = None
-               contentLength = None
-               for header in headers:
-                  if b"authorization: bearer " in header.lower():
-                     authorizationCode = header[22:]
-                  if header[:16].lower() == b"content-length: ":
-                     contentLength = int(header[16:])
-               if authorizationCode != AUTHORIZATION_CODE:
-                  print("Failed authenication")
-                  conn.sendall(ERROR_MESSAGE_403)
-                  conn.close()
-                  break
-
-               continue100Flag = b"expect: 100-continue" in (header.lower() for header in headers)
-               if continue100Flag:
-                  print("100 Continue")
-                  conn.sendall(b"HTTP/1.1 100 Continue\r\n\r\n")
-                  data = conn.recv(RECV_SIZE)
-                  totalContentBytesReceived += len(data)
-
-               if data == None:
-                  print("ERROR: No data")
-                  conn.sendall(ERROR_MESSAGE_400)
-                  conn.close()
-                  break
-
-               print("=====DATA START=====")
-               print(data)
-               print("======DATA END======")
-
-               if contentTypeBoundary != None:
-                  contentTypeBoundary = b"--" + contentTypeBoundary
-                  if data[:len(contentTypeBoundary)+2] != contentTypeBoundary + b"\r\n":
-                     print(f"ERROR: Boundary'ed data doesn't start with boundary string {contentTypeBoundary}.")
-                     conn.sendall(ERROR_MESSAGE_400)
-                     conn.close()
-                     break
-
-                  components = []
-                  nextStart = len(contentTypeBoundary)
-                  while data[nextStart:nextStart+2] == b"\r\n":  # Stop will be "--"
-                     nextStart += 2
-                     eol = data.find(contentTypeBoundary, nextStart)
-                     if eol == -1:
-                        components.append(data[nextStart:])
-                        break
-                     components.append(data[nextStart:eol-2])
-                     nextStart = eol + len(contentTypeBoundary)
-
-                  for componentIdx in range(len(components)):
-                     print(f"=====COMPONENT {componentIdx} START=====")
-                     print(components[componentIdx])
-                     print(f"======COMPONENT {componentIdx} END======")
-
-                  (componentHeaders, data) = parseHeaders(components[0])
-
-               print("Parsing JSON...")
-               jdata = json.loads(data.decode())
-               print(jdata)
-               if "function" in jdata:
-                  function = jdata["function"]
-                  print(f"function={function}")
-
-                  VALID_FUNCTIONS = ("QueryServerState", "RenameServer", "UploadSaveGame")
-
-                  if function not in VALID_FUNCTIONS:
-                     print(f"ERROR: Unknown function '{function}'")
-                     conn.sendall(ERROR_MESSAGE_400)
-                     conn.close()
-                     break
-
-                  print(f"Responding to {function}")
-
-                  if function == "QueryServerState":
-                     responseJson = '{"data":{"serverGameState":{"activeSessionName":"PIE209","numConnectedPlayers":0,"techTier":2,"activeSchematic":"None","gamePhase":"/Script/FactoryGame.FGGamePhase\'/Game/FactoryGame/GamePhases/GP_Project_Assembly_Phase_0.GP_Project_Assembly_Phase_0\'","isGameRunning":true,"totalGameDuration":2176,"isGamePaused":true,"averageTickRate":30.286127090454102,"autoLoadSessionName":"PIE209"}}}'
-                     conn.sendall(str.encode(f'HTTP/1.1 200\r\nServer: FactoryGame/++FactoryGame+dev-CL-332077 (Windows)\r\nkeep-alive: timeout=15.000000\r\ncontent-length: {len(responseJson)}\r\n\r\n{responseJson}'))
-                     print("Success")
-                  elif function == "RenameServer":
-                     if "data" in jdata and "serverName" in jdata["data"]:
-                        newServerName = jdata["data"]["serverName"]
-                        print(f"New server name '{newServerName}'")
-                        conn.sendall(b"HTTP/1.1 204\r\nServer: FactoryGame/++FactoryGame+dev-CL-332077 (Windows)\r\nkeep-alive: timeout=15.000000\r\ncontent-length: 0\r\n\r\n")
-                        print("Success")
-                     else:
-                        print("ERROR: Improperly formatted RenameServer function")
-                        conn.sendall(ERROR_MESSAGE_400)
-                  elif function == "UploadSaveGame":
-                     if contentTypeBoundary == None:
-                        print("ERROR: Improperly formatted RenameServer function")
-                        conn.sendall(ERROR_MESSAGE_400)
-                     elif len(components) != 2:
-                        print("ERROR: UploadSaveGame doesn't have two components")
-                        conn.sendall(ERROR_MESSAGE_400)
-                     elif len(componentHeaders) != 2:
-                        print("ERROR: UploadSaveGame secondary header count unexpected")
-                        conn.sendall(ERROR_MESSAGE_400)
-                     elif componentHeaders[0].lower() != b'content-disposition: attachment; name="data"':
-                        print("ERROR: UploadSaveGame secondary header's first header unexpected")
-                        conn.sendall(ERROR_MESSAGE_400)
-                     elif componentHeaders[1].lower() != b"content-type: application/json":
-                        print("ERROR: UploadSaveGame secondary header's second header unexpected")
-                        conn.sendall(ERROR_MESSAGE_400)
-                     elif "data" not in jdata:
-                        print("ERROR: UploadSaveGame command component missing data")
-                        conn.sendall(ERROR_MESSAGE_400)
-                     elif "saveName" not in jdata["data"]:
-                        print("ERROR: UploadSaveGame command component data missing saveName")
-                        conn.sendall(ERROR_MESSAGE_400)
-                     elif "loadSaveGame" not in jdata["data"]:
-                        print("ERROR: UploadSaveGame command component data missing loadSaveGame")
-                        conn.sendall(ERROR_MESSAGE_400)
-                     elif "enableAdvancedGameSettings" not in jdata["data"]:
-                        print("ERROR: UploadSaveGame command component data missing enableAdvancedGameSettings")
-                        conn.sendall(ERROR_MESSAGE_400)
-                     else:
-                        saveName = jdata["data"]["saveName"]
-                        loadSaveGame = jdata["data"]["loadSaveGame"]
-                        enableAdvancedGameSettings = jdata["data"]["enableAdvancedGameSettings"]
-                        expectedFirstHeader = b'Content-Disposition: attachment; name="saveGameFile"; filename="'
-
-                        (componentHeaders, data) = parseHeaders(components[1])
-                        if len(componentHeaders) < 1:
-                           print("ERROR: UploadSaveGame third header count insufficient")
-                           conn.sendall(ERROR_MESSAGE_400)
-                        elif componentHeaders[0][:len(expectedFirstHeader)] != expectedFirstHeader:
-                           print(f"ERROR: UploadSaveGame third header missing content-disposition: {componentHeaders[0]}")
-                           conn.sendall(ERROR_MESSAGE_400)
-                        elif componentHeaders[0][-1:] != b'"':
-                           print(f"ERROR: UploadSaveGame third header bad content-disposition: {componentHeaders[0]}")
-                           conn.sendall(ERROR_MESSAGE_400)
-                        else:
-                           filename = componentHeaders[0][len(expectedFirstHeader):-1]
-                           print(f"Loading save game saveName={saveName}, loadSaveGame={loadSaveGame}, enableAdvancedGameSettings={enableAdvancedGameSettings}, filename={filename}")
-                           with open("out.txt", "wb") as fout:
-                              if continue100Flag:
-                                 dataEnd = -1
-                                 contentTypeBoundary = b"\r\n" + contentTypeBoundary + b"--\r\n"
-                                 print(f"Searching for {contentTypeBoundary}")
-                                 while dataEnd == -1:
-                                    # Intentionally not writing as we go to more easily handle having
-                                    # the boundary separator cross between the last two SSL "packets".
-                                    startSearch = max(0, len(data)-len(contentTypeBoundary))
-                                    moreData = conn.recv(RECV_SIZE)
-                                    totalContentBytesReceived += len(moreData)
-                                    data += moreData
-                                    dataEnd = data.find(contentTypeBoundary, startSearch)
-                                    if dataEnd != -1:
-                                       print("Trimming data to boundary end")
-                                       data = data[:dataEnd]
-                              fout.write(data)
-
-                           conn.sendall(b"HTTP/1.1 204\r\nServer: FactoryGame/++FactoryGame+dev-CL-332077 (Windows)\r\nkeep-alive: timeout=15.000000\r\ncontent-length: 0\r\n\r\n")
-
-                           print(f"Success wrote {len(data)}-byte file for save game saveName={saveName}, loadSaveGame={loadSaveGame}, enableAdvancedGameSettings={enableAdvancedGameSettings}, filename={filename}")
-
-                  else:
-                     print(f"ERROR: Coding error: Missing case for function '{function}'")
-                     conn.sendall(ERROR_MESSAGE_400)
-
-                  if contentLength == None:
-                     print(f"Received {totalContentBytesReceived} content bytes.")
-                  elif totalContentBytesReceived == contentLength:
-                     print(f"Received {totalContentBytesReceived} content bytes, matching specified Content-Length.")
-                  elif totalContentBytesReceived > contentLength:
-                     print(f"Received {totalContentBytesReceived} content bytes, off from the specified Content-Length by +{totalContentBytesReceived - contentLength} bytes.")
-                  elif totalContentBytesReceived < contentLength:
-                     print(f"Received {totalContentBytesReceived} content bytes, off from the specified Content-Length by {totalContentBytesReceived - contentLength} bytes.")
-
-                  conn.close()
+            (rawConn, addr) = listenSocket.accept()
+         except OSError:
+            break  # Listening socket was closed
+         thread = threading.Thread(target=self.handleConnection, args=(rawConn, addr, context), daemon=True)
+         thread.start()
+
+   def handleConnection(self, rawConn, addr, context):
+      # Without TCP_NODELAY the first response on a connection waits for the
+      # client's delayed ACK of the TLS session tickets.
+      rawConn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+      try:
+         conn = context.wrap_socket(rawConn, server_side=True)
+      except (ssl.SSLError, OSError) as error:
+         self.log(f"{addr}: TLS handshake failed: {error}")
+         rawConn.close()
+         return
+      self.log(f"Connected by {addr}")
+      conn.settimeout(KEEP_ALIVE_TIMEOUT)
+      buffer = bytearray()  # Bytes received past the end of the last request
+      try:
+         while self.handleRequest(conn, addr, buffer):
+            pass
+      except TimeoutError:
+         self.log(f"{addr}: Keep-alive timeout")
+      except (ssl.SSLError, OSError) as error:
+         self.log(f"{addr}: {type(error).__name__}: {error}")
+      finally:
+         conn.close()
+
+   def readRequest(self, conn, buffer):
+      # Returns the next request's headers, or None once the client has
+      # closed the connection between requests.
+      while True:
+         headerEnd = buffer.find(b"\r\n\r\n")
+         if headerEnd != -1:
+            break
+         if len(buffer) > MAX_HEADER_SIZE:
+            raise ValueError("Request headers too large")
+         data = conn.recv(RECV_SIZE)
+         if not data:
+            if len(buffer) > 0:
+               raise ValueError("Connection closed mid-request")
+            return None
+         buffer += data
+      (headerLines, _) = parseHeaders(bytes(buffer[:headerEnd + 4]))
+      del buffer[:headerEnd + 4]
+      if len(headerLines) == 0:
+         raise ValueError("No request line")
+      headers = {}
+      for line in headerLines[1:]:
+         (name, _, value) = line.decode("latin-1").partition(":")
+         headers[name.strip().lower()] = value.strip()
+      return MockRequest(headerLines[0].decode("latin-1"), headers)
+
+   def readBody(self, conn, buffer, contentLength):
+      while len(buffer) < contentLength:
+         data = conn.recv(RECV_SIZE)
+         if not data:
+            raise ValueError("Connection closed mid-body")
+         buffer += data
+      body = bytes(buffer[:contentLength])
+      del buffer[:contentLength]
+      return body
+
+   def handleRequest(self, conn, addr, buffer):
+      # Returns whether the connection stays open for another request.
+      try:
+         request = self.readRequest(conn, buffer)
+         if request == None:
+            return False
+         if not self.quietFlag:
+            self.log(f"{addr}: {request.requestLine} {request.headers}")
+         response = self.dispatch(conn, request, buffer)
+      except ValueError as error:
+         self.log(f"{addr}: ERROR: {error}")
+         self.respond(conn, errorResponse(400, "invalid_request", str(error)), True)
+         return False
+
+      closeFlag = request.headers.get("connection", "").lower() == "close"
+      sentFlag = self.respond(conn, response, closeFlag)
+      self.log(f"{addr}: {request.function} -> {response.statusCode}{'' if sentFlag else ' (fault injected)'}")
+      return sentFlag and not closeFlag
+
+   def respond(self, conn, response, closeFlag):
+      # Returns False if an injected fault cut the response short.
+      self.faults.delay()
+      if self.faults.dropFlag():
+         return False
+
+      contentLength = len(response.body)
+      if response.filePath != None:
+         contentLength += os.path.getsize(response.filePath)
+      head = f"HTTP/1.1 {response.statusCode}\r\n{SERVER_HEADER}\r\n"
+      if closeFlag:
+         head += "connection: close\r\n"
+      else:
+         head += f"keep-alive: timeout={KEEP_ALIVE_TIMEOUT:.6f}\r\n"
+      head += f"content-length: {contentLength}\r\n"
+      if response.contentType != None:
+         head += f"content-type: {response.contentType}\r\n"
+      for header in response.headers:
+         head += header + "\r\n"
+      head = (head + "\r\n").encode()
+
+      budget = None  # Bytes left to send before truncating
+      if self.faults.truncateFlag():
+         budget = (len(head) + contentLength) // 2
+
+      def send(data):
+         nonlocal budget
+         if budget != None:
+            data = data[:budget]
+            budget -= len(data)
+         conn.sendall(data)
+
+      send(head + response.body)
+      if response.filePath != None:
+         with open(response.filePath, "rb") as fin:
+            while budget != 0:
+               data = fin.read(RECV_SIZE)
+               if not data:
                   break
-
-         except ssl.SSLError as error:
-            print(f"ssl.SSLError: {error}")
+               send(data)
+      return budget == None
+
+   # ----- Requests -----
+
+   def dispatch(self, conn, request, buffer):
+      if request.requestLine != "POST /api/v1 HTTP/1.1":
+         if "content-length" in request.headers:
+            self.readBody(conn, buffer, int(request.headers["content-length"]))
+         return errorResponse(404, "invalid_endpoint", "Only POST to /api/v1 is supported")
+      if "content-length" not in request.headers:
+         raise ValueError("Missing Content-Length")
+      contentLength = int(request.headers["content-length"])
+
+      if request.headers.get("expect", "").lower() == "100-continue":
+         conn.sendall(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+      contentType = request.headers.get("content-type", "")
+      files = {}
+      if contentType.lower().startswith("multipart/form-data"):
+         if "boundary=" not in contentType:
+            self.readBody(conn, buffer, contentLength)
+            return errorResponse(400, "invalid_request", "Multipart request has no boundary")
+         boundary = contentType[contentType.find("boundary=") + 9:].split(";")[0].strip('"').encode()
+         files = self.readMultipart(conn, buffer, contentLength, boundary)
+         if "data" not in files or files["data"].path != None:
+            self.discardParts(files)
+            return errorResponse(400, "invalid_request", "Multipart request has no data part")
+         body = files.pop("data").sink.getvalue()
+      else:
+         body = self.readBody(conn, buffer, contentLength)
+         if not contentType.lower().startswith("application/json"):
+            self.log("WARNING: Test server is assuming that the real server requires the header 'Content-Type: application/json' as demonstrated.")
+
+      try:
+         return self.call(request, body, files)
+      finally:
+         self.discardParts(files)
+
+   def call(self, request, body, files):
+      try:
+         jdata = json.loads(body.decode())
+      except (json.decoder.JSONDecodeError, UnicodeDecodeError):
+         return errorResponse(400, "json_parse_error", "Request body is not valid JSON")
+      if not self.quietFlag:
+         self.log(jdata)
+      if not isinstance(jdata, dict) or "function" not in jdata:
+         return errorResponse(400, "missing_params", "Request has no function")
+      request.function = jdata["function"]
+      if isinstance(jdata.get("data"), dict):
+         request.data = jdata["data"]
+
+      if request.function not in self.functions:
+         return errorResponse(400, "unknown_function", f"Unknown function '{request.function}'")
+      (minimumPrivilege, handler) = self.functions[request.function]
+
+      authorization = request.headers.get("authorization", "")
+      if authorization[:7].lower() == "bearer ":
+         with self.lock:
+            request.privilege = self.tokens.get(authorization[7:])
+         if request.privilege == None:
+            return errorResponse(401, "invalid_token", "The provided authentication token is not valid")
+      elif minimumPrivilege != "NotAuthenticated":
+         return errorResponse(401, "missing_token", "Authentication token is required")
+      if PRIVILEGE_LEVELS[request.privilege] < PRIVILEGE_LEVELS[minimumPrivilege]:
+         return errorResponse(403, "insufficient_scope", f"{request.function} requires {minimumPrivilege} privilege")
+
+      if request.function == "UploadSaveGame":
+         return handler(request, files)
+      return handler(request)
+
+   def openPart(self, part):
+      # Files are written straight to a temporary file in the save directory
+      if part.filename == None:
+         return io.BytesIO()
+      (fd, part.path) = tempfile.mkstemp(dir=self.saveDirectory, suffix=".upload")
+      return os.fdopen(fd, "wb")
+
+   def discardParts(self, parts):
+      for part in parts.values():
+         if part.path != None:
+            part.sink.close()
+            if os.path.exists(part.path):
+               os.remove(part.path)
+            part.path = None
+
+   def readMultipart(self, conn, buffer, contentLength, boundary):
+      # Returns {name: MultipartPart} with file parts closed on disk.
+      parser = MultipartParser(boundary, self.openPart)
+      try:
+         buffered = min(len(buffer), contentLength)
+         parser.feed(buffer[:buffered])
+         del buffer[:buffered]
+         remaining = contentLength - buffered
+         while remaining > 0:
+            data = conn.recv(min(RECV_SIZE, remaining))
+            if not data:
+               raise ValueError("Connection closed mid-body")
+            parser.feed(data)
+            remaining -= len(data)
+         parser.finish()
+      except Exception:
+         self.discardParts({str(index): part for (index, part) in enumerate(parser.parts)})
+         raise
+      for part in parser.parts:
+         if part.path != None:
+            part.sink.close()
+      return {part.name: part for part in parser.parts}
+
+   # ----- API functions -----
+
+   def issueToken(self, privilege):
+      payload = base64.b64encode(json.dumps({"pl": privilege}).encode()).decode()
+      token = payload + "." + os.urandom(64).hex().upper()
+      with self.lock:
+         self.tokens[token] = privilege
+      return token
+
+   def savePath(self, saveName):
+      return os.path.join(self.saveDirectory, os.path.basename(saveName) + ".sav")
+
+   def removeSave(self, saveName):
+      # Caller holds self.lock
+      del self.saves[saveName]
+      if os.path.exists(self.savePath(saveName)):
+         os.remove(self.savePath(saveName))
+
+   def healthCheck(self, request):
+      return jsonResponse({"data": {"health": "healthy", "serverCustomData": ""}})
+
+   def verifyAuthenticationToken(self, request):
+      return emptyResponse()
+
+   def passwordlessLogin(self, request):
+      level = argument(request.data, "MinimumPrivilegeLevel", "Client")
+      if level not in ("Client", "Administrator"):
+         return errorResponse(400, "invalid_params", f"Unknown privilege level '{level}'")
+      with self.lock:
+         if not self.claimedFlag:
+            level = "InitialAdmin"
+         elif level == "Administrator" or self.clientPassword != None:
+            return errorResponse(401, "passwordless_login_not_possible", "Passwordless login is not possible for this server")
+      return jsonResponse({"data": {"authenticationToken": self.issueToken(level)}})
+
+   def passwordLogin(self, request):
+      level = argument(request.data, "MinimumPrivilegeLevel", "Client")
+      password = argument(request.data, "Password", "")
+      if level not in ("Client", "Administrator"):
+         return errorResponse(400, "invalid_params", f"Unknown privilege level '{level}'")
+      with self.lock:
+         if self.adminPassword != None and password == self.adminPassword:
+            level = "Administrator"
+         elif level != "Client" or password != self.clientPassword:
+            return errorResponse(401, "wrong_password", "Wrong password")
+      return jsonResponse({"data": {"authenticationToken": self.issueToken(level)}})
+
+   def queryServerState(self, request):
+      with self.lock:
+         serverGameState = dict(self.gameState)
+         if serverGameState["isGameRunning"] and not serverGameState["isGamePaused"]:
+            serverGameState["totalGameDuration"] += int(time.monotonic() - self.startTime)
+      return jsonResponse({"data": {"serverGameState": serverGameState}})
+
+   def getServerOptions(self, request):
+      with self.lock:
+         return jsonResponse({"data": {"serverOptions": self.serverOptions, "pendingServerOptions": {}}})
+
+   def getAdvancedGameSettings(self, request):
+      with self.lock:
+         return jsonResponse({"data": {"creativeModeEnabled": self.creativeModeEnabled, "advancedGameSettings": self.advancedGameSettings}})
+
+   def applyAdvancedGameSettings(self, request):
+      settings = argument(request.data, "AppliedAdvancedGameSettings")
+      if not isinstance(settings, dict):
+         return errorResponse(400, "invalid_params", "AppliedAdvancedGameSettings is required")
+      with self.lock:
+         self.advancedGameSettings.update(settings)
+         self.creativeModeEnabled = True
+      return emptyResponse()
+
+   def claimServer(self, request):
+      if request.privilege != "InitialAdmin":
+         return errorResponse(403, "insufficient_scope", "ClaimServer requires InitialAdmin privilege")
+      serverName = argument(request.data, "ServerName")
+      adminPassword = argument(request.data, "AdminPassword")
+      if not serverName or not adminPassword:
+         return errorResponse(400, "invalid_params", "ServerName and AdminPassword are required")
+      with self.lock:
+         if self.claimedFlag:
+            return errorResponse(400, "server_claimed", "The server has already been claimed")
+         self.claimedFlag = True
+         self.serverName = serverName
+         self.adminPassword = adminPassword
+         # Claiming the server invalidates the InitialAdmin tokens
+         self.tokens = {token: privilege for (token, privilege) in self.tokens.items() if privilege != "InitialAdmin"}
+      return jsonResponse({"data": {"authenticationToken": self.issueToken("Administrator")}})
+
+   def renameServer(self, request):
+      serverName = argument(request.data, "ServerName")
+      if not serverName:
+         return errorResponse(400, "invalid_params", "ServerName is required")
+      with self.lock:
+         self.serverName = serverName
+      if not self.quietFlag:
+         self.log(f"New server name '{serverName}'")
+      return emptyResponse()
+
+   def setClientPassword(self, request):
+      password = argument(request.data, "Password", "")
+      with self.lock:
+         self.clientPassword = password if password != "" else None
+      return emptyResponse()
+
+   def setAdminPassword(self, request):
+      password = argument(request.data, "Password", "")
+      if password == "":
+         return errorResponse(400, "cannot_reset_admin_password", "The admin password cannot be removed")
+      with self.lock:
+         self.adminPassword = password
+      return emptyResponse()
+
+   def setAutoLoadSessionName(self, request):
+      sessionName = argument(request.data, "SessionName")
+      if not sessionName:
+         return errorResponse(400, "invalid_params", "SessionName is required")
+      with self.lock:
+         self.gameState["autoLoadSessionName"] = sessionName
+      return emptyResponse()
+
+   def runCommand(self, request):
+      command = argument(request.data, "Command", "")
+      return jsonResponse({"data": {"commandResult": f"Mock server executed '{command}'"}})
+
+   def shutdown(self, request):
+      # Counted, but the mock server keeps running
+      with self.lock:
+         self.shutdownCount += 1
+      return emptyResponse()
+
+   def applyServerOptions(self, request):
+      options = argument(request.data, "UpdatedServerOptions")
+      if not isinstance(options, dict):
+         return errorResponse(400, "invalid_params", "UpdatedServerOptions is required")
+      with self.lock:
+         self.serverOptions.update(options)
+      return emptyResponse()
+
+   def createNewGame(self, request):
+      newGameData = argument(request.data, "NewGameData")
+      if not isinstance(newGameData, dict) or not argument(newGameData, "SessionName"):
+         return errorResponse(400, "invalid_params", "NewGameData.SessionName is required")
+      with self.lock:
+         self.gameState.update(activeSessionName=argument(newGameData, "SessionName"), isGameRunning=True, totalGameDuration=0, techTier=0)
+         self.startTime = time.monotonic()
+      return emptyResponse()
+
+   def saveGame(self, request):
+      saveName = argument(request.data, "SaveName")
+      if not saveName:
+         return errorResponse(400, "invalid_params", "SaveName is required")
+      with self.lock:
+         if not self.gameState["isGameRunning"]:
+            return errorResponse(400, "no_active_session", "There is no game running to save")
+         with open(self.savePath(saveName), "wb") as fout:
+            fout.write(f"Mock save {saveName}\n".encode())
+         self.saves[saveName] = SaveInfo(self.gameState["activeSessionName"], self.gameState["totalGameDuration"])
+      return emptyResponse()
+
+   def deleteSaveFile(self, request):
+      saveName = argument(request.data, "SaveName")
+      with self.lock:
+         if saveName not in self.saves:
+            return errorResponse(404, "file_not_found", "Save file not found")
+         self.removeSave(saveName)
+      return emptyResponse()
+
+   def deleteSaveSession(self, request):
+      sessionName = argument(request.data, "SessionName")
+      with self.lock:
+         saveNames = [saveName for (saveName, info) in self.saves.items() if info.sessionName == sessionName]
+         if len(saveNames) == 0:
+            return errorResponse(404, "session_not_found", "Session not found")
+         for saveName in saveNames:
+            self.removeSave(saveName)
+      return emptyResponse()
+
+   def enumerateSessions(self, request):
+      sessions = {}
+      with self.lock:
+         for (saveName, info) in sorted(self.saves.items()):
+            sessions.setdefault(info.sessionName, []).append({
+               "saveVersion": 46,
+               "buildVersion": 368883,
+               "saveName": saveName,
+               "mapName": "Persistent_Level",
+               "mapOptions": "",
+               "sessionName": info.sessionName,
+               "playDurationSeconds": info.playDurationSeconds,
+               "saveDateTime": info.saveDateTime,
+               "isModdedSave": False,
+               "isEditedSave": False,
+               "isCreativeModeEnabled": False,
+            })
+         activeSessionName = self.gameState["activeSessionName"]
+      sessionNames = list(sessions)
+      currentSessionIndex = sessionNames.index(activeSessionName) if activeSessionName in sessionNames else -1
+      return jsonResponse({"data": {
+         "sessions": [{"sessionName": sessionName, "saveHeaders": sessions[sessionName]} for sessionName in sessionNames],
+         "currentSessionIndex": currentSessionIndex,
+      }})
+
+   def loadGame(self, request):
+      saveName = argument(request.data, "SaveName")
+      with self.lock:
+         if saveName not in self.saves:
+            return errorResponse(404, "save_game_load_failed", "Save file not found")
+         info = self.saves[saveName]
+         self.gameState.update(activeSessionName=info.sessionName, isGameRunning=True, totalGameDuration=info.playDurationSeconds)
+         self.startTime = time.monotonic()
+         if argument(request.data, "EnableAdvancedGameSettings", False):
+            self.creativeModeEnabled = True
+      return emptyResponse()
+
+   def uploadSaveGame(self, request, files):
+      saveName = argument(request.data, "SaveName")
+      loadSaveGame = argument(request.data, "LoadSaveGame", False)
+      if not saveName:
+         return errorResponse(400, "invalid_params", "SaveName is required")
+      if "saveGameFile" not in files:
+         return errorResponse(400, "file_missing", "saveGameFile part is missing")
+      part = files["saveGameFile"]
+      if part.path != None:
+         os.replace(part.path, self.savePath(saveName))
+         part.path = None
+      else:
+         with open(self.savePath(saveName), "wb") as fout:
+            fout.write(part.sink.getvalue())
+      with self.lock:
+         self.saves[saveName] = SaveInfo(saveName)
+      if not self.quietFlag:
+         self.log(f"Wrote {part.size}-byte file for save game saveName={saveName}, loadSaveGame={loadSaveGame}")
+      if loadSaveGame:
+         self.loadGame(request)
+         return MockResponse(202)  # Uploaded and loading
+      return MockResponse(201)  # Uploaded only
+
+   def downloadSaveGame(self, request):
+      saveName = argument(request.data, "SaveName")
+      with self.lock:
+         knownFlag = saveName in self.saves
+      if not knownFlag or not os.path.exists(self.savePath(saveName)):
+         return errorResponse(404, "file_not_found", "Save file not found")
+      savePath = self.savePath(saveName)
+      return MockResponse(200, contentType="application/octet-stream", filePath=savePath,
+                          headers=[f'content-disposition: attachment; filename="{os.path.basename(savePath)}"'])
+
+def startServer(server, certPath, address=("127.0.0.1", 0)):
+   # Serves on a daemon thread.  Returns (listenSocket, port); close the
+   # socket to stop.
+   context = createContext(certPath)
+   listenSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+   listenSocket.bind(address)
+   listenSocket.listen(128)
+   thread = threading.Thread(target=server.serve, args=(listenSocket, context), daemon=True)
+   thread.start()
+   return (listenSocket, listenSocket.getsockname()[1])
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description="Mock Satisfactory Dedicated Server API.")
+   parser.add_argument("--port", type=int, default=7778)
+   parser.add_argument("--cert", default="cert.pem", help="certificate and key, generated with openssl if missing")
+   parser.add_argument("--save-directory", default=".", help="where uploaded and created saves are kept")
+   parser.add_argument("--admin-password", default=None)
+   parser.add_argument("--client-password", default=None)
+   parser.add_argument("--unclaimed", action="store_true", help="start as a server that still needs ClaimServer")
+   parser.add_argument("--latency", type=float, default=0.0, help="seconds added before every response")
+   parser.add_argument("--jitter", type=float, default=0.0, help="up to this many more seconds, at random")
+   parser.add_argument("--drop", type=float, default=0.0, help="fraction of responses dropped by closing the connection")
+   parser.add_argument("--truncate", type=float, default=0.0, help="fraction of responses cut off halfway")
+   parser.add_argument("--quiet", action="store_true", help="log one line per request instead of payloads")
+   args = parser.parse_args()
+
+   # openssl req -new -x509 -days 365 -nodes -out cert.pem -keyout cert.pem -subj "/C=US"
+   if not os.path.exists(args.cert):
+      generateCertificate(args.cert)
+   server = MockServer(args.save_directory, FaultInjector(args.latency, args.jitter, args.drop, args.truncate),
+                       quietFlag=args.quiet, adminPassword=args.admin_password, clientPassword=args.client_password,
+                       claimedFlag=not args.unclaimed)
+   with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+      s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+      s.bind(("127.0.0.1", args.port))
+      s.listen(128)
+      print("Successfully Started Satisfactory API Test Server")
+      server.serve(s, createContext(args.cert))
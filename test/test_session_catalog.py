@@ -0,0 +1,52 @@
+# This file is part of the SDSRM distribution (https://github.com/GreyHak/sdsrm).
+# Copyright (c) 2024 GreyHak (github.com/GreyHak).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Regression tests for SessionCatalog against the test server.  A listing
+# fetched with an Administrator token must not be handed out from memory
+# to a token the server hasn't accepted for it.
+#   python3 -m pytest test
+
+import sdsrm_lib
+
+HOSTNAME = "127.0.0.1"
+ADMIN_PASSWORD = "admin"
+CLIENT_PASSWORD = "client"
+BOGUS_TOKEN = "bogus.0123456789ABCDEF"
+
+def testListingNeedsAdminToken(serve, tmp_path):
+   (server, port) = serve(adminPassword=ADMIN_PASSWORD, clientPassword=CLIENT_PASSWORD)
+   client = sdsrm_lib.ServerClient(HOSTNAME, port)
+   try:
+      (authStatus, adminToken) = client.authenticate(True, ADMIN_PASSWORD)
+      (authStatus, clientToken) = client.authenticate(False, CLIENT_PASSWORD)
+      savePath = str(tmp_path / "upload.sav")
+      with open(savePath, "wb") as fout:
+         fout.write(b"save" * 100)
+      assert client.uploadSave(adminToken, savePath, "Test", False, False) == "Success"
+      (status, adminSessions) = client.enumerateSessions(adminToken)
+      assert status == "Success" and len(adminSessions) > 0
+
+      (status, sessions) = client.enumerateSessions(clientToken)
+      assert (status, sessions) == ("Server error: Forbidden", None)
+      assert status.statusCode == 403
+      (status, sessions) = client.enumerateSessions(BOGUS_TOKEN)
+      assert (status, sessions) == ("Server error 401", None)
+      assert client.sessionCatalog.saveExists(BOGUS_TOKEN, "Test") == ("Server error 401", False)
+
+      # The listing is still answered from memory for the Administrator token.
+      assert client.enumerateSessions(adminToken) == ("Success", adminSessions)
+      assert client.sessionCatalog.saveExists(adminToken, "Test") == ("Success", True)
+   finally:
+      client.close()